@@ -1,8 +1,11 @@
 import os
 
 from libs.provider_heatzy import HeatzyProvider
-from libs.provider_heatzy import HeaterBinaryModes
+from libs.provider_heatzy import HeaterBinaryModes, HeatzyModes
 from libs.provider_edf_tempo import EDFTempoAPI
+from libs.common import run_blocking, write_credentials_file
+from libs.decisions import Decisions
+from libs import instrumentation
 from collections import defaultdict
 import time
 import logging
@@ -33,6 +36,17 @@ class HeatzyManager:
         # Run in dry run, do not apply changes
         self.dry_run = False
 
+        # EDF Tempo red time looked up ahead of the next run, see `async_prefetch_tempo`
+        self.red_time = None
+
+        # No change is started after this `time.monotonic()` time, changes left are deferred to next run
+        self.deadline = None
+        self.deferred = {}
+
+        # Telemetry recorder set by the HeaterManager, and decision taken for each device on last run
+        self.telemetry = None
+        self.decisions = {}
+
     def _init_heatzy(self) -> HeatzyProvider:
         """Initialize and return the Heatzy API connection."""
         credentials_source = self.config['set_heaters']["providers"]["heatzy"]["credentials"]
@@ -41,17 +55,20 @@ class HeatzyManager:
             credentials_file_path = credentials_source.split("file://")[1]
         elif credentials_source.startswith("env://"):
             env_var = os.getenv(credentials_source.split("env://")[1])
-            credentials_file_path = "heatzy_credentials.json"
-            with open(credentials_file_path, "w") as credentials_file:
-                credentials_file.write(env_var)
+            credentials_file_path = write_credentials_file("heatzy", env_var)
         else:
             self.logger.error(f"Cannot get credentials from {credentials_source}")
             raise HeatzyCredentialsSourceFailure(
                 f"Invalid credentials source {credentials_source}, `file://` or `env://` not found."
             )
 
-        hz = HeatzyProvider(credentials_file_path)
-        hz.login()
+        hz = HeatzyProvider(
+            credentials_file_path, api_url=self.config['set_heaters']["providers"]["heatzy"].get("api_url")
+        )
+        if credentials_source.startswith("env://"):
+            os.remove(credentials_file_path)
+        with instrumentation.span("heatzy.login"):
+            hz.login()
         return hz
 
     def set_mode_hz(self, device_id: str, mode: str) -> bool:
@@ -87,11 +104,13 @@ class HeatzyManager:
             if device not in devices_status:
                 self.logger.warning(f"Device {device} not found")
                 status_devices[device] = 'not_found'
+                self.decisions[device] = Decisions.not_found
                 continue
 
             if not devices_status[device]["device"]['is_online']:
                 self.logger.warning(f"Device {device} is offline")
                 status_devices[device] = 'OFFLINE'
+                self.decisions[device] = Decisions.offline
                 continue
 
             current_mode = self._get_device_current_mode(devices_status[device])
@@ -99,24 +118,51 @@ class HeatzyManager:
             if current_mode == device_params['mode']:
                 self.logger.debug(f"Device {device} already in mode {device_params['mode']}")
                 status_devices[device] = device_params['mode']
+                self.decisions[device] = Decisions.unchanged
                 continue
 
             if self._should_skip_due_to_status_change(device, current_mode, last_status):
                 status_devices[device] = last_status.get(device)
+                self.decisions[device] = Decisions.overridden
                 continue
 
             if self.use_tempo and red_time:
                 device_params['mode'] = "OFF"
                 self.logger.info(f"EDF Tempo Red Time detected, setting {device} status to {device_params['mode']}")
 
+            if self._is_past_deadline():
+                self.logger.warning(f"Run deadline reached, setting {device} to {device_params['mode']} deferred")
+                self.deferred[device] = device_params['mode']
+                if device in last_status:
+                    status_devices[device] = last_status[device]
+                self.decisions[device] = Decisions.deferred
+                continue
+
             device_id = self.hz.alias_to_device_id(device)
             self.logger.info(f"Setting {device} to {device_params['mode']}")
-            result = self.set_mode_hz(device_id, device_params['mode'])
+            with instrumentation.span("heatzy.write"):
+                result = self.set_mode_hz(device_id, device_params['mode'])
             if result:
                 status_devices[device] = device_params['mode']
+            self.decisions[device] = Decisions.set if result else Decisions.failed
 
         return status_devices
 
+    def record_telemetry(self, devices_status: dict, mode_to_apply: dict):
+        """Record the mode read and the decision taken for each device, from the statuses already fetched."""
+        if self.telemetry is None:
+            return
+        sample_time = time.time()
+        for device, decision in self.decisions.items():
+            devdata = devices_status.get(device, {}).get("devdata", {})
+            mode = getattr(HeatzyModes, devdata["attr"]["mode"], None) if "attr" in devdata else None
+            self.telemetry.record(
+                device, sample_time, mode=mode, target=mode_to_apply['devices'][device]['mode'], decision=decision
+            )
+
+    def _is_past_deadline(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
     def _get_device_current_mode(self, device_status: dict) -> str:
         """Get the current mode of the device if available."""
         if "attr" in device_status["devdata"]:
@@ -142,20 +188,52 @@ class HeatzyManager:
         return False
 
     def _is_tempo_red_time(self) -> bool:
-        """Check if EDF Tempo Red Time is active."""
-        edf_tempo_api = EDFTempoAPI(
+        """Check if EDF Tempo Red Time is active, using the prefetched value once if any."""
+        if self.red_time is not None:
+            red_time, self.red_time = self.red_time, None
+            return red_time
+        with instrumentation.span("edf_tempo.check"):
+            return self._get_edf_tempo_api().red_time().is_red
+
+    async def async_prefetch_tempo(self):
+        """Look up EDF Tempo Red Time ahead of the next run."""
+        with instrumentation.span("edf_tempo.check"):
+            self.red_time = (await self._get_edf_tempo_api().async_red_time()).is_red
+
+    def _get_edf_tempo_api(self) -> EDFTempoAPI:
+        return EDFTempoAPI(
             tz=self.DEFAULT_TIMEZONE,
             tempo_config=self.config['set_heaters']["providers"]["edf_tempo"]
         )
-        return edf_tempo_api.red_time().is_red
 
     def run_hz_devices(self, merged_schedule: dict, last_status: dict) -> Dict[str, str]:
         """Run Heatzy devices with the merged schedule and return the status."""
+        self.deferred = {}
+        self.decisions = {}
         self.logger.debug(f"Fetching all Heatzy devices status")
-        devices_status = self.hz.get_all_devices_status()
+        with instrumentation.span("heatzy.status_fetch"):
+            devices_status = self.hz.get_all_devices_status()
 
         self.logger.debug(f"Applying schedule {merged_schedule}")
-        status_devices = self.apply_hz_schedule(
-            devices_status, merged_schedule['to_set'], last_status
-        )
+        with instrumentation.span("heatzy.apply"):
+            status_devices = self.apply_hz_schedule(
+                devices_status, merged_schedule['to_set'], last_status
+            )
+        self.record_telemetry(devices_status, merged_schedule['to_set'])
+        return status_devices
+
+    async def async_run_hz_devices(self, merged_schedule: dict, last_status: dict) -> Dict[str, str]:
+        """Run Heatzy devices with the merged schedule and return the status."""
+        self.deferred = {}
+        self.decisions = {}
+        self.logger.debug(f"Fetching all Heatzy devices status")
+        with instrumentation.span("heatzy.status_fetch"):
+            devices_status = await self.hz.async_get_all_devices_status()
+
+        self.logger.debug(f"Applying schedule {merged_schedule}")
+        with instrumentation.span("heatzy.apply"):
+            status_devices = await run_blocking(
+                self.apply_hz_schedule, devices_status, merged_schedule['to_set'], last_status
+            )
+        await run_blocking(self.record_telemetry, devices_status, merged_schedule['to_set'])
         return status_devices
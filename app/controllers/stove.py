@@ -1,17 +1,20 @@
 import os
 
-from pydantic.v1 import BaseModel
-
 from libs.provider_stove import StoveProvider
+from libs.common import write_credentials_file
+from libs.status_store import JOBS_STATUS_KEY
+from libs.decisions import Decisions
+from libs import instrumentation
+from libs.py_agua_iot import Device, JOB_COMPLETED, JOB_FAILED
 import time
 import logging
 from collections import defaultdict
-from typing import Dict
+from typing import Dict, List, Optional
 
 class StoveDryRun(Exception):
     pass
 
-class StoveModes(BaseModel):
+class StoveModes:
     comfort_plus = "COMFORT_PLUS"
     comfort = "COMFORT"
     comfort_eco = "COMFORT_ECO"
@@ -24,11 +27,21 @@ class StoveCredentialsSourceFailure(Exception):
 
 
 class StoveManager:
+    # Key of the pending writing jobs in the status file
+    JOBS_STATUS_KEY = JOBS_STATUS_KEY
+    # Delay in seconds after which a pending writing job is sent again
+    JOB_TIMEOUT = 600
+    JOB_MAX_RETRIES = 3
+
     def __init__(self, config: dict, max_delay_reapplied: int, logger:logging.Logger, use_tempo: bool = False):
         self.config = config
         self.max_delay_reapplied = max_delay_reapplied
         self.use_tempo = use_tempo
 
+        # Do not wait for writing jobs to complete, confirm them on next run
+        self.async_writes = config.get("async_writes", False)
+        self.pending_jobs = {}
+
         # Initialize the logger
         self.logger = logger
 
@@ -38,6 +51,14 @@ class StoveManager:
         #  Dry Run
         self.dry_run = False
 
+        # No change is started after this `time.monotonic()` time, changes left are deferred to next run
+        self.deadline = None
+        self.deferred = {}
+
+        # Telemetry recorder set by the HeaterManager, and decision taken for each device on last run
+        self.telemetry = None
+        self.decisions = {}
+
     def _init_stove(self) -> StoveProvider:
         """Initialize and return the Stove API connection."""
         credentials_source = self.config["credentials"]
@@ -46,41 +67,52 @@ class StoveManager:
             credentials_file_path = credentials_source.split("file://")[1]
         elif credentials_source.startswith("env://"):
             env_var = os.getenv(credentials_source.split("env://")[1])
-            credentials_file_path = "stove_credentials.json"
-            with open(credentials_file_path, "w") as credentials_file:
-                credentials_file.write(env_var)
+            credentials_file_path = write_credentials_file("stove", env_var)
         else:
             self.logger.error(f"Cannot get credentials from {credentials_source}")
             raise StoveCredentialsSourceFailure(
                 f"Invalid credentials source {credentials_source}, `file://` or `env://` not found."
             )
 
-        stove = StoveProvider(credentials_file_path)
-        stove.connect()
+        stove = StoveProvider(credentials_file_path, api_url=self.config.get("api_url"))
+        if credentials_source.startswith("env://"):
+            os.remove(credentials_file_path)
+        with instrumentation.span("stove.login"):
+            stove.connect()
         return stove
 
     def _get_temperature_config(self, mode) -> int:
         temperatures_config = self.config["temperatures"]
         return temperatures_config.get(mode, StoveModes.comfort)
 
-    def set_temperature_stove(self, device_name: str, mode: str):
+    def set_temperature_stove(self, device: Device, mode: str) -> Optional[str]:
+        """Set the temperature of a mode, errors being raised so the mode is not turned on nor recorded as set."""
         try:
             if self.dry_run:
                 raise StoveDryRun(
                     f"Dry run activated, function `stove.set_temperature` "
-                    f"with {device_name} not applied"
+                    f"with {device.name} not applied"
                 )
-            self.stove.set_temperature(
-                device_id=self.stove.get_device_id_by_name(device_name),
-                temperature=self._get_temperature_config(mode)
+            return self.stove.set_temperature(
+                device=device,
+                temperature=self._get_temperature_config(mode),
+                wait=not self.async_writes
             )
+        except StoveDryRun:
+            raise
         except Exception as e:
-            self.logger.error(f"Error setting temperature for {device_name}: {e}")
+            self.logger.error(f"Error setting temperature for {device.name}: {e}")
+            raise
 
 
-    def set_mode_stove(self, device_name: str, mode: str) -> bool:
+    def set_mode_stove(self, device_name: str, mode: str, retries: int = 0) -> bool:
         """Set the mode of a Stove device."""
         try:
+            device = self.stove.get_device(device_name)
+            if device is None:
+                raise Exception(f"Device {device_name} not connected")
+
+            id_requests = []
             if mode == StoveModes.off:
                 self.logger.info(f"Turn OFF {device_name}")
                 if self.dry_run:
@@ -88,16 +120,16 @@ class StoveManager:
                         f"Dry run activated, function `stove.turn_off` "
                         f"with {device_name} not applied"
                     )
-                self.stove.turn_off(self.stove.get_device_id_by_name(device_name))
+                id_requests.append(self.stove.turn_off(device, wait=not self.async_writes))
             elif mode.startswith(StoveModes.comfort) or mode == StoveModes.low_mode:
-                self.set_temperature_stove(device_name, mode)
+                id_requests.append(self.set_temperature_stove(device, mode))
                 self.logger.info(f"Turn ON {device_name} with mode {mode}")
                 if self.dry_run:
                     raise StoveDryRun(
                         f"Dry run activated, function `stove.turn_on` "
                         f"with {device_name} not applied"
                     )
-                self.stove.turn_on(self.stove.get_device_id_by_name(device_name))
+                id_requests.append(self.stove.turn_on(device, wait=not self.async_writes))
             else:
                 raise Exception(f"Unknown mode {mode}")
         except StoveDryRun:
@@ -106,8 +138,64 @@ class StoveManager:
         except Exception as e:
             self.logger.error(f"Error setting mode for {device_name}: {e}")
         else:
+            if self.async_writes:
+                self.pending_jobs[device_name] = {
+                    "id_device": device.id_device,
+                    "mode": mode,
+                    "requests": [id_request for id_request in id_requests if id_request],
+                    "time": int(time.time()),
+                    "retries": retries,
+                }
             return True
 
+    def confirm_pending_jobs(self, jobs: dict, mode_to_apply: dict = None):
+        """Check writing jobs sent on previous run, keep pending ones and retry failed ones.
+
+        Failed jobs are only retried while their mode is still the one scheduled in `mode_to_apply`.
+        """
+        current_time = int(time.time())
+        for device, job in jobs.items():
+            if self._is_past_deadline():
+                self.logger.warning(f"Run deadline reached, {device} pending jobs checked on next run")
+                self.pending_jobs[device] = job
+                continue
+
+            stove_device = self.stove.get_device_by_id(job.get("id_device")) or self.stove.get_device(device)
+            if stove_device is None:
+                self.logger.warning(f"Device {device} not found, dropping its pending jobs")
+                continue
+
+            try:
+                statuses = [self.stove.get_job_status(stove_device, id_request) for id_request in job["requests"]]
+            except Exception as e:
+                self.logger.error(f"Error checking pending jobs of {device}: {e}")
+                self.pending_jobs[device] = job
+                continue
+
+            if all(status == JOB_COMPLETED for status in statuses):
+                self.logger.info(f"Device {device} confirmed in mode {job['mode']}")
+                continue
+
+            if JOB_FAILED not in statuses and current_time - job["time"] < self.JOB_TIMEOUT:
+                self.logger.info(f"Device {device} writing to mode {job['mode']} still pending")
+                self.pending_jobs[device] = job
+                continue
+
+            if mode_to_apply is not None:
+                scheduled_mode = mode_to_apply['devices'].get(device, {}).get('mode')
+                if scheduled_mode != job["mode"]:
+                    self.logger.info(f"Device {device} writing to mode {job['mode']} not confirmed, schedule "
+                                     f"changed to {scheduled_mode}, not retried")
+                    continue
+
+            if job["retries"] >= self.JOB_MAX_RETRIES:
+                self.logger.error(f"Device {device} could not be set to {job['mode']}, giving up")
+                continue
+
+            self.logger.warning(f"Device {device} writing to mode {job['mode']} not confirmed, retrying")
+            with instrumentation.span("stove.write"):
+                self.set_mode_stove(device, job["mode"], retries=job["retries"] + 1)
+
 
     def apply_stove_schedule(self, devices_status: Dict[str, str], mode_to_apply: dict, last_status: dict) -> dict:
         """Apply the schedule to Stove devices based on their status and modes."""
@@ -121,29 +209,70 @@ class StoveManager:
             if device not in devices_status:
                 self.logger.warning(f"Device {device} not found")
                 status_devices[device] = 'not_found'
+                self.decisions[device] = Decisions.not_found
                 continue
 
             if devices_status[device] == device_params['mode']:
                 self.logger.debug(f"Device {device} already in mode {device_params['mode']}")
                 status_devices[device] = device_params['mode']
+                self.decisions[device] = Decisions.unchanged
+                continue
+
+            if self.pending_jobs.get(device, {}).get("mode") == device_params['mode']:
+                self.logger.debug(f"Device {device} writing to mode {device_params['mode']} in progress")
+                status_devices[device] = device_params['mode']
+                self.decisions[device] = Decisions.pending
                 continue
 
             if self._should_skip_due_to_status_change(device, devices_status, last_status):
                 status_devices[device] = last_status.get(device)
+                self.decisions[device] = Decisions.overridden
                 continue
 
             if self._should_skip_due_to_status_invalid(device, devices_status):
                 "We accept only ON or OFF status, intermediate must be ignored"
                 status_devices[device] = last_status.get(device)
+                self.decisions[device] = Decisions.invalid
+                continue
+
+            if self._is_past_deadline():
+                self.logger.warning(f"Run deadline reached, setting {device} to {device_params['mode']} deferred")
+                self.deferred[device] = device_params['mode']
+                if device in last_status:
+                    status_devices[device] = last_status[device]
+                self.decisions[device] = Decisions.deferred
                 continue
 
             self.logger.info(f"Setting {device} to {device_params['mode']}")
-            result = self.set_mode_stove(device, device_params['mode'])
+            with instrumentation.span("stove.write"):
+                result = self.set_mode_stove(device, device_params['mode'])
             if result:
                 status_devices[device] = device_params['mode']
+            self.decisions[device] = Decisions.set if result else Decisions.failed
 
         return status_devices
 
+    def record_telemetry(self, devices_status: Dict[str, str], mode_to_apply: dict):
+        """Record the readings, status and decision of each device, from the buffers already read."""
+        if self.telemetry is None:
+            return
+        sample_time = time.time()
+        for device, decision in self.decisions.items():
+            readings = {}
+            stove_device = self.stove.get_device(device)
+            if device in devices_status and stove_device is not None:
+                try:
+                    readings = self.stove.get_readings(stove_device)
+                except Exception as e:
+                    self.logger.warning(f"Could not decode readings of {device}: {e}")
+            self.telemetry.record(
+                device, sample_time, mode=devices_status.get(device), target=mode_to_apply['devices'][device]['mode'],
+                decision=decision, **readings
+            )
+
+    def _is_past_deadline(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
     def _should_skip_due_to_status_change(self, device: str, devices_status: dict, last_status: dict) -> bool:
         """Check if device status has changed and if we should skip applying the mode."""
         current_time = int(time.time())
@@ -169,25 +298,48 @@ class StoveManager:
             return True
 
 
-    def run_stove_devices(self, merged_schedule: dict, last_status: dict) -> Dict[str, str]:
+    def run_stove_devices(self, merged_schedule: dict, last_status: dict, disconnect: bool = True) -> Dict[str, str]:
         """Run Stove devices with the merged schedule and return the status."""
         self.logger.debug(f"Reading Stove credentials")
 
-        devices_status = self._get_devices_status()
+        self.pending_jobs = {}
+        self.deferred = {}
+        self.decisions = {}
+        pending_jobs = last_status.get(self.JOBS_STATUS_KEY, {})
+        if pending_jobs:
+            self.logger.info(f"Confirming {len(pending_jobs)} pending writing jobs")
+            with instrumentation.span("stove.jobs_confirm"):
+                self.confirm_pending_jobs(pending_jobs, merged_schedule['to_set'])
+
+        stove_devices = [
+            device for device, device_params in merged_schedule['to_set']['devices'].items()
+            if device_params['type'] == "stove"
+        ]
+        with instrumentation.span("stove.status_fetch"):
+            devices_status = self._get_devices_status(stove_devices)
 
         self.logger.debug(f"Applying schedule {merged_schedule}")
-        status_devices = self.apply_stove_schedule(
-            devices_status, merged_schedule['to_set'], last_status
-        )
+        with instrumentation.span("stove.apply"):
+            status_devices = self.apply_stove_schedule(
+                devices_status, merged_schedule['to_set'], last_status
+            )
+        self.record_telemetry(devices_status, merged_schedule['to_set'])
 
-        self.logger.info("Disconnecting Stove")
-        self.stove.disconnect()
+        if disconnect:
+            self.logger.info("Disconnecting Stove")
+            with instrumentation.span("stove.logout"):
+                self.stove.disconnect()
         return status_devices
 
-    def _get_devices_status(self) -> dict:
-        """Get the current status of all Stove devices."""
+    def _get_devices_status(self, devices: List[str] = None) -> dict:
+        """Get the current status of Stove devices, all of them if `devices` is not set."""
         self.logger.info("Reading devices status")
-        devices_status = {}
-        for idx, device in enumerate(self.stove.connection.devices):
-            devices_status[device.name.strip()] = self.stove.get_device_status(idx)
-        return devices_status
+        if devices is None:
+            stove_devices = self.stove.devices
+        else:
+            stove_devices = {name: self.stove.get_device(name) for name in devices}
+            for name in [name for name, device in stove_devices.items() if device is None]:
+                self.logger.debug(f"Device {name} not connected, status not read")
+                del stove_devices[name]
+        devices_status = self.stove.get_devices_status(list(stove_devices.values()), refresh=True)
+        return {name: devices_status[device.id_device] for name, device in stove_devices.items()}
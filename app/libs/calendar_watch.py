@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from libs.google_calendar import GoogleCalendarAPI
+
+# Channel states sent by Google, `sync` only confirming a new channel
+CHANGE_STATES = ("exists", "not_exists")
+
+
+class NotificationReceiver:
+    """HTTP receiver of Google Calendar push notifications, served from a background thread.
+
+    `on_change` is called from the receiver thread for each change notification of a known channel.
+    """
+
+    def __init__(self, host: str, port: int, on_change: Callable[[], None], token: str = None):
+        self.logger = logging.getLogger(__name__)
+        self.host = host
+        self.port = port
+        self.on_change = on_change
+        self.token = token
+        self.channel_ids = set()
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        # Port 0 picks a free port
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="calendar-notifications", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Listening to calendar notifications on {self.host}:{self.port}")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def handle(self, headers) -> int:
+        """Handle a notification from its headers, and return the HTTP status to answer."""
+        channel_id = headers.get("X-Goog-Channel-ID")
+        state = headers.get("X-Goog-Resource-State")
+        if self.token and headers.get("X-Goog-Channel-Token") != self.token:
+            self.logger.warning(f"Notification of channel {channel_id} with an invalid token")
+            return 403
+        # Notifications of a closed channel can still arrive, they are acknowledged and ignored
+        if channel_id not in self.channel_ids:
+            self.logger.debug(f"Notification of unknown channel {channel_id} ignored")
+            return 200
+        self.logger.debug(f"Notification {headers.get('X-Goog-Message-Number')} of channel {channel_id}: {state}")
+        if state in CHANGE_STATES:
+            self.on_change()
+        return 200
+
+    def _make_handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                self.send_response(receiver.handle(self.headers))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        return Handler
+
+
+class CalendarWatcher:
+    """Keep a Google Calendar notification channel open to the local receiver, renewed before it expires.
+
+    Google only sends notifications to a public HTTPS `address`, to be routed to the receiver `host` and `port`
+    (reverse proxy, tunnel...). Notifications do not carry the changes, `on_change` is expected to sync events.
+    """
+    DEFAULT_TTL = 86400
+    DEFAULT_RENEW_MARGIN = 600
+    # Seconds before trying again to open a channel
+    RETRY_DELAY = 60
+
+    def __init__(self, google_calendar_api: GoogleCalendarAPI, watch_configs: dict, on_change: Callable[[], None]):
+        self.logger = logging.getLogger(__name__)
+        self.google_calendar_api = google_calendar_api
+        self.address = watch_configs['address']
+        self.ttl = int(watch_configs.get('ttl', self.DEFAULT_TTL))
+        self.renew_margin = int(watch_configs.get('renew_margin', self.DEFAULT_RENEW_MARGIN))
+        self.calendar_id = watch_configs.get('calendar_id', 'primary')
+
+        token = watch_configs.get('token')
+        if token and token.startswith("env://"):
+            token = os.getenv(token.split("env://")[1])
+        self.receiver = NotificationReceiver(
+            watch_configs.get('host', '0.0.0.0'), int(watch_configs.get('port', 8080)), on_change, token=token
+        )
+
+        # Channel in use, as answered by events.watch
+        self.channel: Optional[dict] = None
+
+    def start(self):
+        self.receiver.start()
+
+    def renew(self) -> float:
+        """Open a new channel then close the previous one, and return the `time.monotonic()` of next renewal.
+
+        Both channels are accepted in between, no change being missed.
+        """
+        channel_id = str(uuid.uuid4())
+        self.receiver.channel_ids.add(channel_id)
+        try:
+            channel = self.google_calendar_api.watch_meetings(
+                channel_id, self.address, token=self.receiver.token, ttl=self.ttl, calendar_id=self.calendar_id
+            )
+        except Exception as err:
+            self.receiver.channel_ids.discard(channel_id)
+            self.logger.error(f"Could not open a calendar notification channel: {err}")
+            return time.monotonic() + self.RETRY_DELAY
+
+        previous, self.channel = self.channel, channel
+        if previous is not None:
+            self._close(previous)
+
+        # Expiration is given in milliseconds since epoch
+        expiration = channel.get('expiration')
+        expires_in = int(expiration) / 1000 - time.time() if expiration else self.ttl
+        self.logger.info(f"Calendar notification channel {channel_id} open for {expires_in:.0f}s")
+        # Short lived channels are renewed half way
+        return time.monotonic() + max(expires_in - self.renew_margin, expires_in / 2)
+
+    def _close(self, channel: dict):
+        self.receiver.channel_ids.discard(channel['id'])
+        try:
+            self.google_calendar_api.stop_channel(channel['id'], channel['resourceId'])
+        except Exception as err:
+            # The channel expires on its own
+            self.logger.warning(f"Could not close calendar notification channel {channel['id']}: {err}")
+
+    def stop(self):
+        if self.channel is not None:
+            self._close(self.channel)
+            self.channel = None
+        self.receiver.stop()
@@ -1,9 +1,36 @@
+import asyncio
+import atexit
+import contextvars
+import functools
 import json
 import logging
+import logging.handlers
 import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import yaml
 
+# libyaml C loader when available, pure Python one otherwise
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Workers of the executor running blocking provider calls for the async API
+IO_MAX_WORKERS = 16
+
+# Rotation of the log files
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_io_executor = None
+_io_executor_lock = threading.Lock()
+
+# Queue listeners writing the records by log file, shared by all loggers logging to the same file
+_log_listeners = {}
+_log_listeners_lock = threading.Lock()
+
 
 def read_json_config(general_config_file_path: str):
     """ Read json config file """
@@ -14,7 +41,52 @@ def read_json_config(general_config_file_path: str):
 def read_yaml_config(general_config_file_path: str):
     """ Read json config file """
     with open(general_config_file_path) as json_file:
-        return yaml.safe_load(json_file)
+        return yaml.load(json_file, Loader=YamlLoader)
+
+
+def write_credentials_file(name: str, content: str) -> str:
+    """Write credentials given through an environment variable to a private temporary file and return its path.
+
+    Each caller gets its own file, so homes run by the same process do not overwrite each other's credentials.
+    """
+    file_descriptor, path = tempfile.mkstemp(prefix=f"{name}_credentials-", suffix=".json")
+    with os.fdopen(file_descriptor, "w") as credentials_file:
+        credentials_file.write(content)
+    return path
+
+
+def get_home_logger_name(name: str, configs: dict) -> str:
+    """Logger name of a module for the home of `configs`, set by home when several homes are run by one process."""
+    home = configs.get('home')
+    return f"{name}.{home}" if home else name
+
+
+def set_io_max_workers(max_workers: int):
+    """Set the workers of the shared I/O executor, before its first use."""
+    global IO_MAX_WORKERS
+    with _io_executor_lock:
+        if _io_executor is not None:
+            raise RuntimeError("The I/O executor is already started")
+        IO_MAX_WORKERS = max_workers
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Get the executor shared by all blocking calls made from the event loop."""
+    global _io_executor
+    with _io_executor_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(max_workers=IO_MAX_WORKERS, thread_name_prefix="io")
+        return _io_executor
+
+
+def run_blocking(func, *args, **kwargs) -> asyncio.Future:
+    """Run a blocking call on the shared I/O executor and return an awaitable.
+
+    The call runs in a copy of the current context, so that it reports to the run of its caller.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return loop.run_in_executor(get_io_executor(), functools.partial(context.run, func, *args, **kwargs))
 
 
 class LoggerLevel:
@@ -24,18 +96,64 @@ class LoggerLevel:
     ERROR = logging.ERROR
 
 
-def get_logger(logger, log_file_path: str, level: str = 'DEBUG') -> logging.Logger:
-    """ Set logging configuration """
+def get_logger(logger, log_file_path: str, level: str = 'DEBUG', max_bytes: int = LOG_MAX_BYTES,
+               backup_count: int = LOG_BACKUP_COUNT) -> logging.Logger:
+    """ Set logging configuration
 
-    # Create log directory if not exists
-    log_dir = os.path.dirname(log_file_path)
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+    Records are put on an in-memory queue and written by a listener thread to the console and to a rotating
+    `log_file_path`, so logging never waits on I/O. Can be called again on the same logger, the handler is only
+    set once.
+    """
     logger.propagate = False
     logger.setLevel(getattr(LoggerLevel, level))
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
+
+    handler = next((handler for handler in logger.handlers if isinstance(handler, logging.handlers.QueueHandler)), None)
+    if handler is not None and getattr(handler, "log_file_path", None) == log_file_path:
+        return logger
+    if handler is not None:
+        logger.removeHandler(handler)
+
+    handler = logging.handlers.QueueHandler(_get_log_queue(log_file_path, max_bytes, backup_count))
+    handler.log_file_path = log_file_path
     logger.addHandler(handler)
 
     return logger
+
+
+def _get_log_queue(log_file_path: str, max_bytes: int, backup_count: int) -> queue.SimpleQueue:
+    """Get the queue of a log file, starting its listener on first use."""
+    with _log_listeners_lock:
+        listener = _log_listeners.get(log_file_path)
+        if listener is not None:
+            return listener.queue
+
+        # Create log directory if not exists
+        log_dir = os.path.dirname(log_file_path)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir, exist_ok=True)
+
+        formatter = logging.Formatter(LOG_FORMAT)
+        stream_handler = logging.StreamHandler()
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        for handler in (stream_handler, file_handler):
+            handler.setFormatter(formatter)
+
+        listener = logging.handlers.QueueListener(queue.SimpleQueue(), stream_handler, file_handler)
+        listener.start()
+        if not _log_listeners:
+            atexit.register(stop_logging)
+        _log_listeners[log_file_path] = listener
+        return listener.queue
+
+
+def stop_logging():
+    """Write the queued records and stop the listeners, called at exit."""
+    with _log_listeners_lock:
+        listeners = list(_log_listeners.values())
+        _log_listeners.clear()
+    for listener in listeners:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
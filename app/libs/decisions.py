@@ -0,0 +1,14 @@
+class Decisions:
+    """Decision taken for a device on a run, recorded with its telemetry."""
+    unchanged = "unchanged"
+    set = "set"
+    failed = "failed"
+    deferred = "deferred"
+    # Changed outside of the calendar since last run, left as is for `max_delay_reapplied`
+    overridden = "overridden"
+    # Stove in an intermediate status, neither ON nor OFF
+    invalid = "invalid"
+    # Writing job sent on a previous run not confirmed yet
+    pending = "pending"
+    offline = "offline"
+    not_found = "not_found"
@@ -2,14 +2,30 @@ import logging
 import os
 import json
 import datetime
+from typing import Iterable, List, Tuple
+
+import pytz
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from libs.common import run_blocking
+
+
+class SyncTokenExpired(Exception):
+    """The sync token is no longer valid, events have to be fully synced again."""
+    pass
 
 
 class GoogleCalendarAPI:
-    def __init__(self, credentials_file_path: str, timezone:str):
+    # Events by page of an incremental sync, the API maximum
+    SYNC_PAGE_SIZE = 2500
+
+    def __init__(self, credentials_file_path: str, timezone:str, api_endpoint: str = None):
         self.logger = logging.getLogger(__name__)
         self.credentials_file_path = credentials_file_path
+        # Root URL of the Calendar API calls, `www.googleapis.com` when None
+        self.api_endpoint = api_endpoint
         self.credentials = self._get_credentials()
         self.calendar_api = self._build_calendar_api()
         self.timezone = timezone
@@ -22,7 +38,8 @@ class GoogleCalendarAPI:
 
     def _build_calendar_api(self):
         self.logger.debug(f'Building calendar api')
-        return build('calendar', 'v3', credentials=self.credentials)
+        client_options = {'api_endpoint': self.api_endpoint} if self.api_endpoint else None
+        return build('calendar', 'v3', credentials=self.credentials, client_options=client_options)
 
     def get_meetings(self, calendar_id:str='primary', max_results:int=50):
         self.logger.debug(f'Getting meetings from {calendar_id}')
@@ -43,8 +60,87 @@ class GoogleCalendarAPI:
 
         return events_result.get('items', [])
 
+    async def async_get_meetings(self, calendar_id:str='primary', max_results:int=50):
+        return await run_blocking(self.get_meetings, calendar_id, max_results)
+
+    def sync_meetings(self, calendar_id: str = 'primary', sync_token: str = None) -> Tuple[list, str]:
+        """Get the events changed since `sync_token`, or all events without it, and the token of the next sync.
+
+        Deleted events are returned with a `cancelled` status. `SyncTokenExpired` is raised when Google asks
+        for a full sync.
+        """
+        self.logger.debug(f'Syncing meetings from {calendar_id}, {"incremental" if sync_token else "full"} sync')
+        events, page_token = [], None
+        while True:
+            # `timeMin` and `orderBy` can't be used with sync tokens, upcoming events are selected by the caller
+            try:
+                events_result = self.calendar_api.events().list(
+                    calendarId=calendar_id,
+                    singleEvents=True,
+                    syncToken=sync_token,
+                    pageToken=page_token,
+                    maxResults=self.SYNC_PAGE_SIZE,
+                    timeZone=self.timezone
+                ).execute()
+            except HttpError as err:
+                if err.resp.status == 410:
+                    raise SyncTokenExpired(f"Sync token of {calendar_id} expired") from err
+                raise
+            events.extend(events_result.get('items', []))
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                break
+        self.logger.debug(f'Got {len(events)} changed meetings')
+        return events, events_result.get('nextSyncToken')
+
+    def upcoming_meetings(self, events: Iterable[dict], max_results: int = None) -> List[dict]:
+        """Select the events not ended yet, by start time, as `get_meetings` lists them."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        upcoming = [event for event in events if self.get_event_time(event['end']) > now]
+        upcoming.sort(key=lambda event: self.get_event_time(event['start']))
+        return upcoming[:max_results]
+
+    def get_event_time(self, event_time: dict) -> datetime.datetime:
+        """Get the time of an event start or end, all-day and naive times being in the calendar timezone."""
+        value = datetime.datetime.fromisoformat(event_time.get('dateTime') or event_time['date'])
+        if value.tzinfo is None:
+            value = pytz.timezone(self.timezone).localize(value)
+        return value
+
+    def watch_meetings(self, channel_id: str, address: str, token: str = None, ttl: int = None,
+                       calendar_id: str = 'primary') -> dict:
+        """Open a notification channel sending calendar changes to `address`, return the channel."""
+        self.logger.debug(f'Opening notification channel {channel_id} to {address}')
+        body = {'id': channel_id, 'type': 'web_hook', 'address': address}
+        if token:
+            body['token'] = token
+        if ttl:
+            body['params'] = {'ttl': str(int(ttl))}
+        return self.calendar_api.events().watch(calendarId=calendar_id, body=body).execute()
+
+    def stop_channel(self, channel_id: str, resource_id: str):
+        """Close a notification channel."""
+        self.logger.debug(f'Closing notification channel {channel_id}')
+        self.calendar_api.channels().stop(body={'id': channel_id, 'resourceId': resource_id}).execute()
+
+    @staticmethod
+    def to_schedules(meetings: list) -> list:
+        """Convert calendar events to schedules (start_time, end_time, title)."""
+        schedules = []
+        for meeting in meetings:
+            schedules.append({
+                'start_time': meeting['start']['dateTime'] if 'dateTime' in meeting['start'] else meeting['start']['date'],
+                'end_time': meeting['end']['dateTime'] if 'dateTime' in meeting['end'] else meeting['end']['date'],
+                'title': meeting['summary']
+            })
+        return schedules
+
     @staticmethod
     def save_to_json(meetings: list, output_file: str) -> None:
+        GoogleCalendarAPI.save_schedules_to_json(GoogleCalendarAPI.to_schedules(meetings), output_file)
+
+    @staticmethod
+    def save_schedules_to_json(schedules: list, output_file: str) -> None:
 
         if output_file is None:
             output_file = 'outputs/heatzy_meetings.json'
@@ -55,15 +151,7 @@ class GoogleCalendarAPI:
         if not os.path.exists(path):
             os.makedirs(path)
 
-        meetings_info = []
-        for meeting in meetings:
-            meetings_info.append({
-                'start_time': meeting['start']['dateTime'] if 'dateTime' in meeting['start'] else meeting['start']['date'],
-                'end_time': meeting['end']['dateTime'] if 'dateTime' in meeting['end'] else meeting['end']['date'],
-                'title': meeting['summary']
-            })
-
-        json_content = json.dumps(meetings_info, indent=2)
+        json_content = json.dumps(schedules, indent=2)
         with open(output_file, 'w') as file:
             file.write(json_content)
 
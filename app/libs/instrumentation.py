@@ -0,0 +1,189 @@
+import contextlib
+import contextvars
+import datetime
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+from libs import rate_limit
+
+_LOGGER = logging.getLogger(__name__)
+
+# Prefix of the Prometheus metrics
+METRICS_PREFIX = "heaters"
+
+# Run in progress, by context: threads and tasks started from `run_blocking` or asyncio report to the run of the
+# code that started them, homes of `--mode homes` each recording their own run
+_active_run: contextvars.ContextVar[Optional["RunReport"]] = contextvars.ContextVar("active_run", default=None)
+
+
+class RunReport:
+    """Timings of the phases of a run and HTTP requests made by vendor."""
+
+    def __init__(self, name: str, home: str = None, parent: "RunReport" = None):
+        self.name = name
+        self.home = home
+        # Run in progress when this one started, active again once it finishes
+        self.parent = parent
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self._start = time.perf_counter()
+        self.duration = None
+        self.phases: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0}
+        )
+        self.http: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"requests": 0, "errors": 0, "throttled": 0, "bytes_sent": 0, "bytes_received": 0, "seconds": 0.0}
+        )
+        # State of the rate limits by vendor endpoint at the end of the run
+        self.rate_limits: Dict[str, dict] = {}
+        # Runs joined, the report being written when the outermost one finishes
+        self.depth = 0
+        self._lock = threading.Lock()
+
+    def add_phase(self, phase: str, seconds: float, failed: bool = False):
+        with self._lock:
+            stats = self.phases[phase]
+            stats["count"] += 1
+            stats["errors"] += int(failed)
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def on_request(self, vendor: str, method: str, url: str, response, elapsed: float):
+        """Count a request reported by `libs.transport` and its bytes, by vendor."""
+        bytes_sent = bytes_received = 0
+        if response is not None:
+            body = response.request.body if response.request is not None else None
+            bytes_sent = len(body) if body else 0
+            # Streamed bodies are not read here, their announced length is counted instead
+            content = response._content
+            bytes_received = len(content) if content else int(response.headers.get("Content-Length") or 0)
+        with self._lock:
+            stats = self.http[vendor]
+            stats["requests"] += 1
+            stats["errors"] += int(response is None or response.status_code >= 400)
+            stats["throttled"] += int(response is not None and response.status_code == 429)
+            stats["bytes_sent"] += bytes_sent
+            stats["bytes_received"] += bytes_received
+            stats["seconds"] += elapsed
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+        self.rate_limits = rate_limit.get_states()
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "run": self.name,
+                "home": self.home,
+                "started_at": self.started_at.isoformat(),
+                "duration": self.duration,
+                "phases": {phase: dict(stats) for phase, stats in self.phases.items()},
+                "http": {vendor: dict(stats) for vendor, stats in self.http.items()},
+                "rate_limits": {limiter: dict(state) for limiter, state in self.rate_limits.items()},
+            }
+
+    def to_prometheus(self) -> str:
+        """Format the report in the Prometheus text exposition format."""
+        report = self.to_dict()
+        run = f'run="{self.name}"' + (f',home="{self.home}"' if self.home else "")
+        lines = [
+            f"# TYPE {METRICS_PREFIX}_run_duration_seconds gauge",
+            f"{METRICS_PREFIX}_run_duration_seconds{{{run}}} {report['duration']}",
+            f"# TYPE {METRICS_PREFIX}_run_timestamp_seconds gauge",
+            f"{METRICS_PREFIX}_run_timestamp_seconds{{{run}}} {self.started_at.timestamp()}",
+        ]
+        for metric, key in (("phase_duration_seconds", "seconds"), ("phase_count", "count"),
+                            ("phase_errors", "errors")):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{metric} gauge")
+            for phase, stats in report["phases"].items():
+                lines.append(f'{METRICS_PREFIX}_{metric}{{{run},phase="{phase}"}} {stats[key]}')
+        for metric, key in (("http_requests", "requests"), ("http_errors", "errors"), ("http_throttled", "throttled"),
+                            ("http_sent_bytes", "bytes_sent"), ("http_received_bytes", "bytes_received"),
+                            ("http_duration_seconds", "seconds")):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{metric} gauge")
+            for vendor, stats in report["http"].items():
+                lines.append(f'{METRICS_PREFIX}_{metric}{{{run},vendor="{vendor}"}} {stats[key]}')
+        # Rate limits state, counters being kept since the process started
+        for metric, key in (("rate_limit_rate", "rate"), ("rate_limit_tokens", "tokens"),
+                            ("rate_limit_throttled_total", "throttled"), ("rate_limit_waits_total", "waits"),
+                            ("rate_limit_wait_seconds_total", "wait_seconds")):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{metric} gauge")
+            for limiter, state in report["rate_limits"].items():
+                lines.append(f'{METRICS_PREFIX}_{metric}{{{run},limiter="{limiter}"}} {state[key]}')
+        return "\n".join(lines) + "\n"
+
+
+def start_run(name: str, home: str = None) -> RunReport:
+    """Start recording a run, or join the run in progress (a manager run within `--mode all`).
+
+    A run of a `home` is recorded apart from the run in progress, its report being its own.
+    Requests are counted by `libs.transport`, which reports them to the active run.
+    """
+    report = _active_run.get()
+    if report is None or home is not None:
+        report = RunReport(name, home=home, parent=report)
+        _active_run.set(report)
+    report.depth += 1
+    return report
+
+
+def finish_run(configs: dict):
+    """Stop recording the run started last in this context, and write its report once the outermost run is done."""
+    report = _active_run.get()
+    if report is None:
+        return
+    report.depth -= 1
+    if report.depth > 0:
+        return
+    _active_run.set(report.parent)
+
+    report.finish()
+    try:
+        write_report(report, configs)
+    except Exception as err:
+        _LOGGER.warning(f"Could not write the {report.name} run report: {err}")
+
+
+def get_active_run() -> Optional[RunReport]:
+    return _active_run.get()
+
+
+@contextlib.contextmanager
+def span(phase: str):
+    """Time a phase of the run in progress, if any."""
+    report = _active_run.get()
+    if report is None:
+        yield
+        return
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        report.add_phase(phase, time.perf_counter() - start, failed)
+
+
+def write_report(report: RunReport, configs: dict):
+    """Write the JSON run report and the Prometheus textfile configured in `metrics`."""
+    metrics_configs = configs.get('metrics') or {}
+    report_directory = metrics_configs.get('report_directory')
+    if report_directory:
+        from libs.storage import get_storage
+        report_path = f"{report_directory}/run-report-{report.name}.json"
+        get_storage(configs.get('storage')).write_json(report_path, report.to_dict())
+        _LOGGER.debug(f"Run report written to {report_path}")
+
+    textfile_directory = metrics_configs.get('prometheus_textfile_directory')
+    if textfile_directory:
+        # Written locally in any case, for the node exporter textfile collector
+        from libs.storage import LocalStorage
+        suffix = f"{report.name}_{report.home}" if report.home else report.name
+        textfile_path = os.path.join(textfile_directory, f"{METRICS_PREFIX}_{suffix}.prom")
+        LocalStorage().write(textfile_path, report.to_prometheus().encode())
+        _LOGGER.debug(f"Prometheus textfile written to {textfile_path}")
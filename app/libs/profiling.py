@@ -0,0 +1,204 @@
+import cProfile
+import datetime
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+_LOGGER = logging.getLogger(__name__)
+
+# Functions reported in the CPU profile
+TOP_FUNCTIONS = 40
+# Allocation sites reported, and tracebacks detailed for the largest ones
+TOP_ALLOCATIONS = 30
+TOP_TRACEBACKS = 5
+TRACEBACK_FRAMES = 10
+
+# Built-ins where a thread waits on the network, a lock or a timer rather than using CPU
+_WAIT_FUNCTIONS = re.compile(
+    r"recv|send|connect|getaddrinfo|do_handshake|_ssl\._SSLSocket|select|poll|sleep|acquire|wait|_queue\."
+)
+# Path segments holding identifiers, grouped in the HTTP report
+_ID_SEGMENT = re.compile(r"/(?=[^/]*\d)[^/]{3,}")
+
+
+class Profiler:
+    """Profile a run with cProfile and/or tracemalloc, and write the reports to `output_directory`.
+
+    Threads started during the run are profiled too, since provider calls run in the IO executor.
+    Time spent in HTTP requests is recorded by vendor from the transport hooks and reported apart,
+    waiting built-ins being left out of the CPU hot spots.
+    """
+
+    def __init__(self, output_directory: str, name: str, profile: bool = False, trace_malloc: bool = False):
+        self.output_directory = output_directory
+        self.name = name
+        self.profile = profile
+        self.trace_malloc = trace_malloc
+        self.prefix = os.path.join(
+            output_directory, f"{name}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        )
+        self._profiles: List[cProfile.Profile] = []
+        self._profiles_lock = threading.Lock()
+        self._http: Dict[str, Dict[str, dict]] = defaultdict(lambda: defaultdict(lambda: {"requests": 0, "seconds": 0.0}))
+        self._http_lock = threading.Lock()
+        self._wall_time = 0.0
+        self._start = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.profile or self.trace_malloc
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        if self.trace_malloc:
+            tracemalloc.start(TRACEBACK_FRAMES)
+        if self.profile:
+            # requests is only loaded when HTTP calls are profiled
+            from libs import transport
+            transport.add_hook(self._on_request)
+            threading.setprofile(self._profile_thread)
+            self._profile_thread()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self.enabled:
+            return False
+        self._wall_time = time.perf_counter() - self._start
+        snapshot = peak = None
+        if self.trace_malloc:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if self.profile:
+            threading.setprofile(None)
+            from libs import transport
+            transport.remove_hook(self._on_request)
+            for profile in self._profiles:
+                profile.disable()
+
+        try:
+            os.makedirs(self.output_directory, exist_ok=True)
+            if self.profile:
+                self._write_profile()
+            if snapshot is not None:
+                self._write_allocations(snapshot, peak)
+        except Exception as err:
+            _LOGGER.warning(f"Could not write the {self.name} profiling reports: {err}")
+        return False
+
+    def _profile_thread(self, *args):
+        """Start a profile in the current thread, called by threads before their first instruction."""
+        profile = cProfile.Profile()
+        try:
+            # Replaces this hook by the profiler for the rest of the thread
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread from the first profile, a second one can't be enabled
+            threading.setprofile(None)
+            return
+        with self._profiles_lock:
+            self._profiles.append(profile)
+
+    def _on_request(self, vendor: str, method: str, url: str, response, elapsed: float):
+        endpoint = f"{method} {_ID_SEGMENT.sub('/{id}', urlsplit(url).path)}"
+        with self._http_lock:
+            stats = self._http[vendor][endpoint]
+            stats["requests"] += 1
+            stats["seconds"] += elapsed
+
+    def _merged_stats(self) -> Optional[pstats.Stats]:
+        stats = None
+        for profile in self._profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        return stats
+
+    def _write_profile(self):
+        stats = self._merged_stats()
+        if stats is None:
+            return
+        stats.dump_stats(f"{self.prefix}.prof")
+
+        lines = [f"Profile of {self.name}, {self._wall_time:.3f}s wall time, {len(self._profiles)} thread(s)", ""]
+        lines += self._http_summary()
+
+        # Own time of the functions, waiting built-ins (network, locks, sleeps) left out
+        cpu_functions, wait_time = [], 0.0
+        for function, stat in stats.stats.items():
+            if function[0] == "~" and _WAIT_FUNCTIONS.search(function[2]):
+                wait_time += stat[2]
+            else:
+                cpu_functions.append((function, stat))
+        cpu_functions.sort(key=lambda item: item[1][2], reverse=True)
+        lines += [f"CPU hot spots by own time (waiting built-ins excluded, {wait_time:.3f}s)",
+                  f"{'own (s)':>10} {'cumul (s)':>10} {'calls':>10}  function"]
+        for (filename, line, function_name), (_, calls, own, cumulative, _) in cpu_functions[:TOP_FUNCTIONS]:
+            lines.append(f"{own:>10.4f} {cumulative:>10.4f} {calls:>10}  {_short_path(filename)}:{line}({function_name})")
+
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+        lines += ["", "By cumulative time (all threads, waits included)", output.getvalue()]
+
+        with open(f"{self.prefix}.prof.txt", "w") as text_file:
+            text_file.write("\n".join(lines))
+        _LOGGER.info(f"CPU profile written to {self.prefix}.prof")
+
+    def _http_summary(self) -> List[str]:
+        with self._http_lock:
+            http = {vendor: dict(endpoints) for vendor, endpoints in self._http.items()}
+        if not http:
+            return ["No provider HTTP requests", ""]
+        total = sum(stats["seconds"] for endpoints in http.values() for stats in endpoints.values())
+        lines = [f"Provider HTTP time, {total:.3f}s summed over threads",
+                 f"{'seconds':>10} {'requests':>10}  vendor / endpoint"]
+        for vendor, endpoints in sorted(http.items(), key=lambda item: -sum(s["seconds"] for s in item[1].values())):
+            lines.append(f"{sum(s['seconds'] for s in endpoints.values()):>10.3f} "
+                         f"{sum(s['requests'] for s in endpoints.values()):>10}  {vendor}")
+            for endpoint, stats in sorted(endpoints.items(), key=lambda item: -item[1]["seconds"]):
+                lines.append(f"{stats['seconds']:>10.3f} {stats['requests']:>10}    {endpoint}")
+        return lines + [""]
+
+    def _write_allocations(self, snapshot: tracemalloc.Snapshot, peak: int):
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "*/linecache.py"),
+        ])
+        current = sum(stat.size for stat in snapshot.statistics("filename"))
+        lines = [f"Allocations of {self.name}, {current / 1024:.1f} KiB still allocated, "
+                 f"peak {peak / 1024:.1f} KiB", "", f"Top {TOP_ALLOCATIONS} allocation sites"]
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size / 1024:>10.1f} KiB {stat.count:>8} blocks  {_short_path(frame.filename)}:{frame.lineno}")
+
+        for index, stat in enumerate(snapshot.statistics("traceback")[:TOP_TRACEBACKS], start=1):
+            lines += ["", f"#{index}: {stat.size / 1024:.1f} KiB in {stat.count} blocks"]
+            lines += [f"    {line}" for line in stat.traceback.format(most_recent_first=True)]
+
+        with open(f"{self.prefix}.malloc.txt", "w") as text_file:
+            text_file.write("\n".join(lines) + "\n")
+        _LOGGER.info(f"Allocations report written to {self.prefix}.malloc.txt")
+
+
+def _short_path(filename: str) -> str:
+    """Path relative to the app or the installed packages, for readability."""
+    for marker in ("site-packages/", "app/"):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    return filename
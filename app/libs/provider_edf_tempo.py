@@ -1,4 +1,7 @@
+import asyncio
 import logging
+import threading
+import time
 
 import requests
 import datetime
@@ -7,6 +10,16 @@ from typing import Dict, Union
 from pydantic import BaseModel
 from pytz import timezone
 
+from libs import transport
+from libs.common import run_blocking
+
+
+# Seconds an API response is reused for, colors being the same for every home of the process
+RESPONSE_CACHE_TTL = 300
+
+_responses_cache: Dict[str, tuple] = {}
+_responses_cache_lock = threading.Lock()
+
 
 class RedTimeResults(BaseModel):
     current_time: str
@@ -33,6 +46,8 @@ class EDFTempoAPI:
         self.timezone = tz
         self.schedules_margin: int = tempo_config["red_hour_margin"]
         self.schedules: dict = tempo_config["schedules"]
+        # `jourTempo` endpoint, the day being appended to it
+        self.base_url: str = tempo_config.get("api_url", self.BASE_URL).rstrip("/")
         # This API does not need cred - Not in use
         self.api_credentials: Dict = credentials
 
@@ -46,7 +61,7 @@ class EDFTempoAPI:
         Returns:
             str: The complete URL for the API request.
         """
-        return f"{self.BASE_URL}/{date}"
+        return f"{self.base_url}/{date}"
 
     def _get_api_response(self, url: str) -> Union[Dict, None]:
         """
@@ -58,13 +73,21 @@ class EDFTempoAPI:
         Returns:
             Union[Dict, None]: The JSON response from the API if successful, None otherwise.
         """
+        with _responses_cache_lock:
+            expires, data = _responses_cache.get(url, (0, None))
+        if time.monotonic() < expires:
+            return data
+
         try:
-            response = requests.get(url)
+            response = transport.get_session("edf_tempo").get(url)
             response.raise_for_status()
-            return response.json()
+            data = response.json()
         except requests.RequestException as e:
             self.logger.error(f"Error fetching data from EDF API: {e}")
             return None
+        with _responses_cache_lock:
+            _responses_cache[url] = (time.monotonic() + RESPONSE_CACHE_TTL, data)
+        return data
 
     def get_tempo_colors(self) -> Dict[str, Union[str, datetime.date]]:
         """
@@ -82,6 +105,30 @@ class EDFTempoAPI:
         next_day_url = self._build_url(next_date)
         next_day_data = self._get_api_response(next_day_url)
 
+        return self._build_tempo_colors(current_date, current_day_data, next_date, next_day_data)
+
+    async def async_get_tempo_colors(self) -> Dict[str, Union[str, datetime.date]]:
+        """
+        Get the color of the current day and the next day, both days being fetched concurrently.
+
+        Returns:
+            Dict[str, Union[str, datetime.date]]: A dictionary containing the colors of the current and next day.
+        """
+        current_date = datetime.datetime.now().date()
+        next_date = current_date + datetime.timedelta(days=1)
+
+        current_day_data, next_day_data = await asyncio.gather(
+            run_blocking(self._get_api_response, self._build_url(current_date)),
+            run_blocking(self._get_api_response, self._build_url(next_date)),
+        )
+        return self._build_tempo_colors(current_date, current_day_data, next_date, next_day_data)
+
+    @staticmethod
+    def _build_tempo_colors(current_date: datetime.date, current_day_data: Union[Dict, None],
+                            next_date: datetime.date, next_day_data: Union[Dict, None]) -> Dict:
+        """
+        Build the colors result from the API responses of the current and next day.
+        """
         if current_day_data and next_day_data:
             return {
                 "current_date": current_date,
@@ -104,6 +151,45 @@ class EDFTempoAPI:
         Returns:
             str: A JSON string with the status and parameters used.
         """
+        return self._red_time_result(self.get_tempo_colors(), margin_minutes)
+
+    async def async_red_time(self, margin_minutes: int = 5) -> RedTimeResults:
+        """
+        Check if the current time is within the "red time" range, see `red_time`.
+        """
+        return self._red_time_result(await self.async_get_tempo_colors(), margin_minutes)
+
+    def _red_hours(self, schedule: Dict, date: datetime.date, margin_minutes: int):
+        """
+        Get the (start, end) times of a red hours schedule, margin included.
+        """
+        start_time = datetime.time(hour=schedule["red_hour_start"], minute=self.schedules_margin)
+        end_time = datetime.time(hour=schedule["red_hour_stop"], minute=self.schedules_margin)
+
+        start_with_margin = (
+                datetime.datetime.combine(date, start_time) - datetime.timedelta(minutes=margin_minutes)
+        ).time()
+
+        end_with_margin = (
+                datetime.datetime.combine(date, end_time) + datetime.timedelta(minutes=margin_minutes)
+        ).time()
+        return start_with_margin, end_with_margin
+
+    def in_red_hours(self, moment: datetime.datetime, margin_minutes: int = 5) -> bool:
+        """
+        Check if a moment is within the red hours schedules, whatever the color of the day.
+        """
+        moment = moment.astimezone(timezone(self.timezone))
+        for schedule in self.schedules:
+            start_with_margin, end_with_margin = self._red_hours(schedule, moment.date(), margin_minutes)
+            if start_with_margin <= moment.time() <= end_with_margin:
+                return True
+        return False
+
+    def _red_time_result(self, tempo_colors: Dict, margin_minutes: int) -> RedTimeResults:
+        """
+        Check the current time against the red hours schedules, for the given Tempo colors.
+        """
         now = datetime.datetime.now(timezone(self.timezone))
 
         _is_red_time = False
@@ -111,16 +197,7 @@ class EDFTempoAPI:
         end_with_margin = ...
 
         for schedule in self.schedules:
-            start_time = datetime.time(hour=schedule["red_hour_start"], minute=self.schedules_margin)
-            end_time = datetime.time(hour=schedule["red_hour_stop"], minute=self.schedules_margin)
-
-            start_with_margin = (
-                    datetime.datetime.combine(now.date(), start_time) - datetime.timedelta(minutes=margin_minutes)
-            ).time()
-
-            end_with_margin = (
-                    datetime.datetime.combine(now.date(), end_time) + datetime.timedelta(minutes=margin_minutes)
-            ).time()
+            start_with_margin, end_with_margin = self._red_hours(schedule, now.date(), margin_minutes)
 
             _is_red_time = start_with_margin <= now.time() <= end_with_margin
 
@@ -128,7 +205,7 @@ class EDFTempoAPI:
             if _is_red_time:
                 break
 
-        _is_red_day = self.get_tempo_colors()['current_day_color'] == TempoColorsValues().TEMPO_RED
+        _is_red_day = tempo_colors['current_day_color'] == TempoColorsValues().TEMPO_RED
 
         result: RedTimeResults = RedTimeResults(
             current_time=now.strftime("%Y-%m-%d %H:%M:%S"),
@@ -1,8 +1,11 @@
+import asyncio
 import json
 import logging
 import os
 import time
-import requests
+
+from libs import transport
+from libs.common import run_blocking
 
 
 class HeatzyException(Exception):
@@ -30,8 +33,10 @@ class HeatzyProvider:
     GIZWIT_APP_ID = 'c70a66ff039d41b4a220e198b0fcc8b3'
     GITWIT_URL = 'https://euapi.gizwits.com/app'
 
-    def __init__(self, credentials_file_path, username=None, password=None):
+    def __init__(self, credentials_file_path, username=None, password=None, api_url=None):
         self.logger = logging.getLogger(__name__)
+        # Gizwits application API root, `/login`, `/bindings` and device paths being appended to it
+        self.api_url = (api_url or self.GITWIT_URL).rstrip('/')
         if os.path.exists(credentials_file_path):
             self.logger.debug(f'Getting credentials from {credentials_file_path}')
             with open(credentials_file_path) as json_file:
@@ -50,13 +55,15 @@ class HeatzyProvider:
             'Accept': 'application/json',
             'Content-Type': 'application/json',
         }
-        self.session = requests.Session()
+        self.session = transport.get_session("heatzy")
+        # Device ids by alias, from the last bindings fetched
+        self.device_ids = {}
 
     def login(self):
         """Login to Heatzy."""
         self.logger.debug(f'Logging in to Heatzy')
         response = self.session.post(
-            url=f'{self.GITWIT_URL}/login',
+            url=f'{self.api_url}/login',
             headers=self.headers,
             json={'username': self.username, 'password': self.password}
         )
@@ -67,24 +74,24 @@ class HeatzyProvider:
         """Get Heatzy devices."""
         self.logger.debug(f'Getting devices')
         devices = self.session.get(
-            url=f'{self.GITWIT_URL}/bindings',
+            url=f'{self.api_url}/bindings',
             headers=self.headers
         ).json()
+        self.device_ids = {device['dev_alias']: device['did'] for device in reversed(devices['devices'])}
         return devices['devices']
 
     def alias_to_device_id(self, alias):
-        """Get device id from alias."""
+        """Get device id from alias, bindings being fetched again only for an unknown alias."""
         self.logger.debug(f'Getting device id from alias {alias}')
-        devices = self.get_devices()
-        for device in devices:
-            if device['dev_alias'] == alias:
-                return device['did']
+        if alias not in self.device_ids:
+            self.get_devices()
+        return self.device_ids.get(alias)
 
     def set_device_mode(self, device_id, mode):
         """Set device mode."""
         self.logger.debug(f'Setting device {device_id} to mode {mode}')
         return self.session.post(
-            url=f'{self.GITWIT_URL}/control/{device_id}',
+            url=f'{self.api_url}/control/{device_id}',
             headers=self.headers,
             json={'attrs': {'mode': mode}}
         ).json()
@@ -93,7 +100,7 @@ class HeatzyProvider:
         """Get device status."""
         self.logger.debug(f'Getting device status details for {device_id}')
         return self.session.get(
-            url=f'{self.GITWIT_URL}/devdata/{device_id}/latest',
+            url=f'{self.api_url}/devdata/{device_id}/latest',
             headers=self.headers,
         ).json()
 
@@ -101,7 +108,7 @@ class HeatzyProvider:
         """Get device status."""
         self.logger.debug(f'Getting device status for {device_id}')
         return self.session.get(
-            url=f'{self.GITWIT_URL}/devices/{device_id}',
+            url=f'{self.api_url}/devices/{device_id}',
             headers=self.headers
         ).json()
 
@@ -123,3 +130,46 @@ class HeatzyProvider:
             }
             for device in devices
         }
+
+    async def async_login(self):
+        """Login to Heatzy."""
+        return await run_blocking(self.login)
+
+    async def async_get_devices(self):
+        """Get Heatzy devices."""
+        return await run_blocking(self.get_devices)
+
+    async def async_alias_to_device_id(self, alias):
+        """Get device id from alias."""
+        return await run_blocking(self.alias_to_device_id, alias)
+
+    async def async_set_device_mode(self, device_id, mode):
+        """Set device mode."""
+        return await run_blocking(self.set_device_mode, device_id, mode)
+
+    async def async_get_device_status_details(self, device_id):
+        """Get device status."""
+        return await run_blocking(self.get_device_status_details, device_id)
+
+    async def async_get_device_status(self, device_id):
+        """Get device status."""
+        return await run_blocking(self.get_device_status, device_id)
+
+    async def async_get_all_devices_status(self):
+        """Get device status, all devices being fetched concurrently."""
+        self.logger.debug(f'Getting all devices status')
+        devices = await self.async_get_devices()
+        statuses = await asyncio.gather(*[
+            asyncio.gather(
+                self.async_get_device_status(device['did']),
+                self.async_get_device_status_details(device['did'])
+            )
+            for device in devices
+        ])
+        return {
+            device['dev_alias']: {
+                "device": device_status,
+                "devdata": device_status_details
+            }
+            for device, (device_status, device_status_details) in zip(devices, statuses)
+        }
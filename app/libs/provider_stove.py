@@ -1,9 +1,12 @@
+import asyncio
 import json
 import logging
 import os
 
-from .py_agua_iot import agua_iot
-from typing import List
+from libs import transport
+from libs.common import run_blocking
+from .py_agua_iot import agua_iot, Device
+from typing import Dict, List, Optional
 
 
 class StoveProvider(object):
@@ -11,11 +14,23 @@ class StoveProvider(object):
     CUSTOMER_CODE = "700700"
     # 1 for NOBIS
     BRAND_ID = "1"
+    # Registers needed to take a decision on a device
+    STATUS_REGISTERS = ["status_get", "temp_air_get", "temp_air_set"]
+    # Registers of each reading, the first one reported by the device being used (see `Device.air_temp`)
+    READING_REGISTERS = {
+        "air_temp": ["temp_air_get", "temp_air2_get"],
+        "gas_temp": ["temp_gas_flue_get", "temp_probe_k_get"],
+        "real_power": ["real_power_get"],
+    }
 
-    def __init__(self, credentials_file_path, email=None, password=None, uuid=None):
+    def __init__(self, credentials_file_path, email=None, password=None, uuid=None, api_url=None):
         self.logger = logging.getLogger(__name__)
+        # Agua IoT root URL, the customer code and brand being sent in each login
+        self.api_url = api_url or self.API_URL
         self.connection = None
+        # Connected devices, by stripped name and by Agua IoT `id_device`
         self.devices = {}
+        self.devices_by_id = {}
 
         if os.path.exists(credentials_file_path):
             self.logger.debug(f'Getting credentials from {credentials_file_path}')
@@ -33,55 +48,136 @@ class StoveProvider(object):
     def connect(self):
         """Establish connection to the stove."""
         self.logger.info("Connecting to Stove pellet stove...")
-        self.connection = agua_iot(self.API_URL, self.CUSTOMER_CODE, self.email, self.password, self.uuid,
-                                   brand_id=self.BRAND_ID)
+        self.connection = agua_iot(self.api_url, self.CUSTOMER_CODE, self.email, self.password, self.uuid,
+                                   brand_id=self.BRAND_ID, lazy=True,
+                                   session=transport.get_session("agua_iot"),
+                                   timeout=transport.get_timeout("agua_iot"))
 
-        for idx, device in enumerate(self.connection.devices):
-            self.logger.info(f"Connected to {device.name} device with device_id ({idx})")
+        self.devices = {device.name.strip(): device for device in self.connection.devices}
+        self.devices_by_id = {device.id_device: device for device in self.connection.devices}
+        for device in self.connection.devices:
+            self.logger.info(f"Connected to {device.name} device with device_id ({device.id_device})")
+
+    def get_device(self, name: str) -> Optional[Device]:
+        """Get a connected device by its name."""
+        return self.devices.get(name.strip())
+
+    def get_device_by_id(self, id_device) -> Optional[Device]:
+        """Get a connected device by its Agua IoT `id_device`."""
+        return self.devices_by_id.get(id_device)
+
+    def get_device_id_by_name(self, name: str):
+        device = self.get_device(name)
+        if device is not None:
+            return device.id_device
+
+    def read_registers(self, device: Device, registers: List[str] = None, refresh: bool = False) -> Dict[str, int]:
+        """Read only the declared registers of a device, `STATUS_REGISTERS` by default."""
+        registers = registers or self.STATUS_REGISTERS
+        self.logger.debug(f"Reading registers {registers} of {device.name}")
+        return device.read_items(registers, refresh)
 
-    def get_device_id_by_name(self, name: str) -> int:
-        for idx, device in enumerate(self.connection.devices):
-            if device.name.startswith(name):
-                return idx
+    def get_device_status(self, device: Device, refresh: bool = False) -> str:
+        status = self.read_registers(device, ["status_get"], refresh)["status_get"]
+        return self.connection.statusTranslated[status]
 
-    def get_device_status(self, device_id: int) -> str:
-        device = self.connection.devices[device_id]
-        return device.status_translated
+    def get_devices_status(self, devices: List[Device], refresh: bool = False) -> Dict[str, str]:
+        """Get the status of several devices by `id_device`, read concurrently."""
+        registers = self.connection.fetch_device_items(["status_get"], devices, refresh)
+        return {
+            device.id_device: self.connection.statusTranslated[device_registers["status_get"]]
+            for device, device_registers in zip(devices, registers)
+        }
+
+    def get_readings(self, device: Device) -> Dict[str, Optional[int]]:
+        """Get the air and flue gas temperatures and real power of a device, from the buffer read last.
+
+        The buffer is only read from the API if the device was never read before.
+        """
+        registers = self.read_registers(device, [register for registers in self.READING_REGISTERS.values()
+                                                 for register in registers])
+        return {
+            reading: next((registers[register] for register in reading_registers
+                           if registers[register] is not None), None)
+            for reading, reading_registers in self.READING_REGISTERS.items()
+        }
 
     def get_device_names(self) -> List[str]:
         """Get the names of all connected devices."""
-        return [device.name for device in self.connection.devices]
+        return list(self.devices)
 
     def get_air_temperature(self) -> List[str]:
         """Get the current air temperature for each device."""
         temperatures = []
-        for device in self.connection.devices:
+        for device in self.devices.values():
             temp_info = f"{device.name}: {device.air_temperature}°C"
             temperatures.append(temp_info)
             self.logger.info(temp_info)
         return temperatures
 
-    def turn_on(self, device_id: int):
-        """Turn on the stove."""
-        self.logger.info(f"Turning on device with ID {device_id}...")
-        self.connection.devices[device_id].turn_on()
-        self.logger.info("Device turned on.")
+    def turn_on(self, device: Device, wait: bool = True) -> str:
+        """Turn on the stove, without waiting for the job to complete if `wait` is False."""
+        self.logger.info(f"Turning on device {device.name} ({device.id_device})...")
+        id_request = device.turn_on(wait=wait)
+        self.logger.info("Device turned on." if wait else f"Turn on requested ({id_request}).")
+        return id_request
 
-    def turn_off(self, device_id: int):
-        """Turn off the stove."""
-        self.logger.info(f"Turning off device with ID {device_id}...")
-        self.connection.devices[device_id].turn_off()
-        self.logger.info("Device turned off.")
+    def turn_off(self, device: Device, wait: bool = True) -> str:
+        """Turn off the stove, without waiting for the job to complete if `wait` is False."""
+        self.logger.info(f"Turning off device {device.name} ({device.id_device})...")
+        id_request = device.turn_off(wait=wait)
+        self.logger.info("Device turned off." if wait else f"Turn off requested ({id_request}).")
+        return id_request
 
-    def set_temperature(self, device_id: int, temperature: int):
+    def set_temperature(self, device: Device, temperature: int, wait: bool = True) -> str:
         """Set the desired temperature for the stove."""
-        self.logger.info(f"Setting temperature for device ID {device_id} to {temperature}°C...")
-        self.connection.devices[device_id].set_temperature(temperature)
-        self.logger.info(f"Temperature set to {temperature}")
+        self.logger.info(f"Setting temperature for device {device.name} ({device.id_device}) to {temperature}°C...")
+        id_request = device.set_item_value("temp_air_set", temperature, wait=wait)
+        self.logger.info(f"Temperature set to {temperature}" if wait else f"Temperature requested ({id_request}).")
+        return id_request
+
+    def get_job_status(self, device: Device, id_request: str) -> str:
+        """Check once the status of a writing job sent with `wait=False`."""
+        return device.get_job_status(id_request)
+
+    async def async_connect(self):
+        """Establish connection to the stove."""
+        await run_blocking(self.connect)
+
+    async def async_read_registers(self, device: Device, registers: List[str] = None,
+                                   refresh: bool = False) -> Dict[str, int]:
+        """Read only the declared registers of a device, `STATUS_REGISTERS` by default."""
+        return await run_blocking(self.read_registers, device, registers, refresh)
+
+    async def async_get_device_status(self, device: Device, refresh: bool = False) -> str:
+        return await run_blocking(self.get_device_status, device, refresh)
+
+    async def async_get_devices_status(self, devices: List[Device], refresh: bool = False) -> Dict[str, str]:
+        """Get the status of several devices by `id_device`, read concurrently."""
+        statuses = await asyncio.gather(*[self.async_get_device_status(device, refresh) for device in devices])
+        return {device.id_device: status for device, status in zip(devices, statuses)}
+
+    async def async_turn_on(self, device: Device, wait: bool = True) -> str:
+        """Turn on the stove, without waiting for the job to complete if `wait` is False."""
+        return await run_blocking(self.turn_on, device, wait)
+
+    async def async_turn_off(self, device: Device, wait: bool = True) -> str:
+        """Turn off the stove, without waiting for the job to complete if `wait` is False."""
+        return await run_blocking(self.turn_off, device, wait)
+
+    async def async_set_temperature(self, device: Device, temperature: int, wait: bool = True) -> str:
+        """Set the desired temperature for the stove."""
+        return await run_blocking(self.set_temperature, device, temperature, wait)
+
+    async def async_get_job_status(self, device: Device, id_request: str) -> str:
+        """Check once the status of a writing job sent with `wait=False`."""
+        return await run_blocking(self.get_job_status, device, id_request)
 
     def disconnect(self):
         """Disconnect from the stove."""
         self.logger.info("Disconnecting from Stove pellet stove...")
         self.connection = None
+        # Connected devices, by stripped name and by Agua IoT `id_device`
         self.devices = {}
+        self.devices_by_id = {}
         self.logger.info("Disconnected.")
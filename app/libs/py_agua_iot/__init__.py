@@ -4,10 +4,14 @@ the IOT Agua platform of Micronova
 import jwt
 import json
 import logging
+import numpy as np
 import re
 import requests
+import threading
 import time
 import re
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 from . import formula_parser
 
 try:
@@ -32,6 +36,11 @@ API_PATH_DEVICE_JOB_STATUS = "/deviceJobStatus/"
 API_PATH_DEVICE_WRITING = "/deviceRequestWriting"
 API_LOGIN_APPLICATION_VERSION = "1.9.5"
 DEFAULT_TIMEOUT_VALUE = 5
+DEFAULT_MAX_WORKERS = 4
+
+JOB_COMPLETED = "completed"
+JOB_PENDING = "pending"
+JOB_FAILED = "failed"
 
 HEADER_ACCEPT = "application/json, text/javascript, */*; q=0.01"
 HEADER_CONTENT_TYPE = "application/json"
@@ -100,6 +109,10 @@ class agua_iot(object):
         brand_id=1,
         debug=False,
         api_login_application_version=API_LOGIN_APPLICATION_VERSION,
+        lazy=False,
+        max_workers=DEFAULT_MAX_WORKERS,
+        session=None,
+        timeout=DEFAULT_TIMEOUT_VALUE,
     ):
         """agua_iot object constructor"""
         if debug is True:
@@ -136,6 +149,16 @@ class agua_iot(object):
         self.refresh_token = None
 
         self.devices = list()
+        # Registers maps by id_registers_map, shared by devices of a same product
+        self.register_tables = dict()
+        # Defer registers map and buffer reading until a device value is needed
+        self.lazy = lazy
+        # Upper bound of devices fetched concurrently
+        self.max_workers = max_workers
+        self._token_lock = threading.Lock()
+        # HTTP session reused for every call, so connections are kept alive
+        self.session = session if session is not None else requests.Session()
+        self.timeout = timeout
 
         self._login()
 
@@ -143,7 +166,8 @@ class agua_iot(object):
         self.register_app_id()
         self.login()
         self.fetch_devices()
-        self.fetch_device_information()
+        if not self.lazy:
+            self.fetch_device_information()
 
     def _headers(self):
         """Correctly set headers for requests to Agua IOT."""
@@ -173,12 +197,12 @@ class agua_iot(object):
         payload = json.dumps(payload)
 
         try:
-            response = requests.post(
+            response = self.session.post(
                 url,
                 data=payload,
                 headers=self._headers(),
                 allow_redirects=False,
-                timeout=DEFAULT_TIMEOUT_VALUE,
+                timeout=self.timeout,
             )
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             raise ConnectionError(str.format("Connection to {0} not possible", url))
@@ -212,12 +236,12 @@ class agua_iot(object):
             url = self.login_api_url
 
         try:
-            response = requests.post(
+            response = self.session.post(
                 url,
                 data=payload,
                 headers=headers,
                 allow_redirects=False,
-                timeout=DEFAULT_TIMEOUT_VALUE,
+                timeout=self.timeout,
             )
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             raise ConnectionError(str.format("Connection to {0} not possible", url))
@@ -245,12 +269,12 @@ class agua_iot(object):
         payload = json.dumps(payload)
 
         try:
-            response = requests.post(
+            response = self.session.post(
                 url,
                 data=payload,
                 headers=self._headers(),
                 allow_redirects=False,
-                timeout=DEFAULT_TIMEOUT_VALUE,
+                timeout=self.timeout,
             )
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             raise ConnectionError(str.format("Connection to {0} not possible", url))
@@ -281,67 +305,93 @@ class agua_iot(object):
         if res is False:
             raise Error("Error while fetching devices")
 
-        for dev in res["device"]:
-            url = self.api_url + API_PATH_DEVICE_INFO
-
-            payload = {"id_device": dev["id_device"], "id_product": dev["id_product"]}
-            payload = json.dumps(payload)
-
-            res2 = self.handle_webcall("POST", url, payload)
-            if res2 is False:
-                raise Error("Error while fetching device info")
-
-            self.devices.append(
-                Device(
-                    dev["id"],
-                    dev["id_device"],
-                    dev["id_product"],
-                    dev["product_serial"],
-                    dev["name"],
-                    dev["is_online"],
-                    dev["name_product"],
-                    res2["device_info"][0]["id_registers_map"],
-                    self,
-                )
-            )
+        self.devices.extend(self._map_concurrently(self._fetch_device, res["device"]))
+
+    def _fetch_device(self, dev):
+        url = self.api_url + API_PATH_DEVICE_INFO
+
+        payload = {"id_device": dev["id_device"], "id_product": dev["id_product"]}
+        payload = json.dumps(payload)
+
+        res = self.handle_webcall("POST", url, payload)
+        if res is False:
+            raise Error("Error while fetching device info")
+
+        return Device(
+            dev["id"],
+            dev["id_device"],
+            dev["id_product"],
+            dev["product_serial"],
+            dev["name"],
+            dev["is_online"],
+            dev["name_product"],
+            res["device_info"][0]["id_registers_map"],
+            self,
+        )
 
     def fetch_device_information(self):
         """Fetch device information of heating devices"""
-        for dev in self.devices:
-            dev.update()
-
-    def handle_webcall(self, method, url, payload):
+        self._map_concurrently(lambda dev: dev.update(), self.devices)
+
+    def fetch_device_items(self, items, devices=None, refresh=False):
+        """Read `items` of several devices concurrently, all devices by default"""
+        devices = self.devices if devices is None else devices
+        return self._map_concurrently(lambda dev: dev.read_items(items, refresh), devices)
+
+    def _map_concurrently(self, func, iterable):
+        """Apply `func` to each element with bounded parallelism, keeping order"""
+        iterable = list(iterable)
+        if len(iterable) <= 1 or self.max_workers <= 1:
+            return [func(element) for element in iterable]
+
+        # Each call runs in a copy of the caller context, as the run its requests are reported to
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(iterable))) as executor:
+            return list(executor.map(lambda element: context.copy().run(func, element), iterable))
+
+    def _refresh_token_if_expired(self, rejected_token=None):
+        """Refresh the token once expired, or once `rejected_token` was refused and is still the current one"""
+        with self._token_lock:
+            if (rejected_token is not None and rejected_token == self.token) or time.time() > self.token_expires:
+                self.do_refresh_token()
+
+    def handle_webcall(self, method, url, payload, retry_unauthorized=True):
         if time.time() > self.token_expires:
-            self.do_refresh_token()
+            self._refresh_token_if_expired()
 
-        extra_headers = {"local": "false", "Authorization": self.token}
+        token = self.token
+        extra_headers = {"local": "false", "Authorization": token}
 
         headers = self._headers()
         headers.update(extra_headers)
 
         try:
             if method == "POST":
-                response = requests.post(
+                response = self.session.post(
                     url,
                     data=payload,
                     headers=headers,
                     allow_redirects=False,
-                    timeout=DEFAULT_TIMEOUT_VALUE,
+                    timeout=self.timeout,
                 )
             else:
-                response = requests.get(
+                response = self.session.get(
                     url,
                     data=payload,
                     headers=headers,
                     allow_redirects=False,
-                    timeout=DEFAULT_TIMEOUT_VALUE,
+                    timeout=self.timeout,
                 )
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             raise ConnectionError(str.format("Connection to {0} not possible", url))
 
         if response.status_code == 401:
-            self.do_refresh_token()
-            return self.handle_webcall(method, url, payload)
+            # Token refreshed once, a new token being refused too is not retried
+            if not retry_unauthorized:
+                raise UnauthorizedError(str.format("Unauthorized on {0} with a new token", url))
+            # Calls refused together refresh it once, the others using the token refreshed meanwhile
+            self._refresh_token_if_expired(rejected_token=token)
+            return self.handle_webcall(method, url, payload, retry_unauthorized=False)
         elif response.status_code != 200:
             return False
 
@@ -372,8 +422,8 @@ class Device(object):
         self.name_product = name_product
         self.id_registers_map = id_registers_map
         self.__agua_iot = agua_iot
-        self.__register_map_dict = dict()
-        self.__information_dict = dict()
+        self.__register_table = None
+        self.__buffer = None
         self.__canalization = dict()
 
     def update(self):
@@ -382,6 +432,35 @@ class Device(object):
         self.__update_device_information()
         self.__update_childs()
 
+    def refresh(self):
+        """Read the device buffer again, keeping the registers map"""
+        self.__update_device_information()
+
+    def read_items(self, items, refresh=False):
+        """Read only `items`, fetching registers map and buffer if not loaded yet
+
+        A buffer already loaded is read again when `refresh` is set.
+        """
+        if refresh and self.__buffer is not None:
+            self.__update_device_information()
+        return self._register_table.decode(self._buffer, items)
+
+    @property
+    def _register_table(self):
+        if self.__register_table is None:
+            register_table = self.__agua_iot.register_tables.get(self.id_registers_map)
+            if register_table is None:
+                self.__update_device_registers_mapping()
+            else:
+                self.__register_table = register_table
+        return self.__register_table
+
+    @property
+    def _buffer(self):
+        if self.__buffer is None:
+            self.__update_device_information()
+        return self.__buffer
+
     def __update_device_registers_mapping(self):
         url = self.__agua_iot.api_url + API_PATH_DEVICE_REGISTERS_MAP
 
@@ -399,31 +478,14 @@ class Device(object):
 
         for registers_map in res["device_registers_map"]["registers_map"]:
             if registers_map["id"] == self.id_registers_map:
-                register_map_dict = dict()
-                for register in registers_map["registers"]:
-                    register_dict = dict()
-                    register_dict.update(
-                        {
-                            "reg_type": register["reg_type"],
-                            "offset": register["offset"],
-                            "formula": register["formula"],
-                            "formula_inverse": register["formula_inverse"],
-                            "format_string": register["format_string"],
-                            "set_min": register["set_min"],
-                            "set_max": register["set_max"],
-                            "mask": register["mask"],
-                        }
-                    )
-                    if "enc_val" in register:
-                        for v in register["enc_val"]:
-                            if v["lang"] == "ENG" and v["description"] == "ON":
-                                register_dict.update({"value_on": v["value"]})
-                            elif v["lang"] == "ENG" and v["description"] == "OFF":
-                                register_dict.update({"value_off": v["value"]})
-                    register_map_dict.update({register["reg_key"]: register_dict})
+                register_table = RegisterTable(registers_map["registers"])
                 _LOGGER.debug("SUCCESSFULLY UPDATED REGISTERS MAP!")
-                _LOGGER.debug("REGISTERS MAP: %s", str(register_map_dict))
-                self.__register_map_dict = register_map_dict
+                _LOGGER.debug("REGISTERS MAP: %s", register_table)
+                self.__register_table = register_table
+                self.__agua_iot.register_tables[self.id_registers_map] = register_table
+
+        if self.__register_table is None:
+            raise Error("Registers map not found for device")
 
     def __update_device_information(self):
         url = self.__agua_iot.api_url + API_PATH_DEVICE_BUFFER_READING
@@ -464,30 +526,26 @@ class Device(object):
 
         _LOGGER.debug("JOBANSWERSTATUS COMPLETED!")
 
-        current_i = 0
-        information_dict = dict()
         try:
-            for item in res["jobAnswerData"]["Items"]:
-                information_dict.update(
-                    {item: res["jobAnswerData"]["Values"][current_i]}
-                )
-                current_i = current_i + 1
+            buffer = RegisterBuffer(
+                res["jobAnswerData"]["Items"], res["jobAnswerData"]["Values"]
+            )
         except KeyError:
             _LOGGER.debug("NO ITEMS IN JOBANSWERDATA!")
             raise Error("Error while fetching device information")
 
         _LOGGER.debug("SUCCESSFULLY RETRIEVED ITEM IN JOBANSWERDATA!")
 
-        _LOGGER.debug("INFORMATION MAP: %s", str(information_dict))
+        _LOGGER.debug("INFORMATION MAP: %s", buffer)
 
-        self.__information_dict = information_dict
+        self.__buffer = buffer
 
     def __update_childs(self):
         for canal in list(
             set(
                 [
                     m.group(1)
-                    for i in self.__register_map_dict.keys()
+                    for i in self._register_table.keys
                     for m in [re.match(r"^(canalization_\d+)_", i.lower())]
                     if m
                 ]
@@ -498,56 +556,58 @@ class Device(object):
 
     def get_item_value(self, item, format_string=False):
         try:
-            formula = self.__register_map_dict[item]["formula"]
-            value = str(
-                self.__information_dict[self.__register_map_dict[item]["offset"]]
-                & self.__register_map_dict[item]["mask"]
-            )
-            _LOGGER.debug("GET '%s' FORMULA: %s", item, formula)
-            _LOGGER.debug("GET '%s' ORIGINAL VALUE: %s", item, value)
-            formula = formula.replace("#", value)
-            eval_formula = formula_parser.parser(formula)
-            _LOGGER.debug("GET '%s' CALCULATED VALUE: %s", item, eval_formula)
-            if format_string:
-                return str.format(
-                    self.__register_map_dict[item]["format_string"], eval_formula
+            register = self._register_table[item]
+            formula = register.formula
+            value = str(self._buffer[register.offset] & register.mask)
+            eval_formula = formula_parser.parser(formula.replace("#", value))
+            # Called for every register read, a single level check when debug is off
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug(
+                    "GET '%s' FORMULA: %s, ORIGINAL VALUE: %s, CALCULATED VALUE: %s",
+                    item, formula, value, eval_formula
                 )
+            if format_string:
+                return str.format(register.format_string, eval_formula)
             return eval_formula
-        except (KeyError, ValueError):
+        except (KeyError, ValueError, ZeroDivisionError):
             return None
 
     def get_item_min(self, item):
         try:
-            value = int(self.__register_map_dict[item]["set_min"])
+            value = int(self._register_table[item].set_min)
             _LOGGER.debug("GET '%s' MIN: %s", item, value)
             return value
-        except (KeyError, ValueError):
+        except (KeyError, TypeError, ValueError):
             return None
 
     def get_item_max(self, item):
         try:
-            value = int(self.__register_map_dict[item]["set_max"])
+            value = int(self._register_table[item].set_max)
             _LOGGER.debug("GET '%s' MAX: %s", item, value)
             return value
-        except (KeyError, ValueError):
+        except (KeyError, TypeError, ValueError):
             return None
 
     def get_item_value_on(self, item):
         try:
-            value = int(self.__register_map_dict[item]["value_on"])
+            value = int(self._register_table[item].value_on)
             _LOGGER.debug("GET '%s' VALUE ON: %s", item, value)
             return value
-        except (KeyError, ValueError):
+        except (KeyError, TypeError, ValueError):
             return None
 
     def get_item_value_off(self, item):
         try:
-            value = int(self.__register_map_dict[item]["value_off"])
+            value = int(self._register_table[item].value_off)
             _LOGGER.debug("GET '%s' VALUE OFF: %s", item, value)
             return value
-        except (KeyError, ValueError):
+        except (KeyError, TypeError, ValueError):
             return None
 
+    def get_all_item_values(self):
+        """Calculated values of every register, decoded in one pass."""
+        return self._register_table.decode(self._buffer)
+
     def get_item_boolean(self, item):
         item_value = self.get_item_value(item)
         if item_value is None:
@@ -565,15 +625,16 @@ class Device(object):
 
     def __prepare_value_for_writing(self, item, value):
         value = int(value)
-        set_min = self.__register_map_dict[item]["set_min"]
-        set_max = self.__register_map_dict[item]["set_max"]
+        register = self._register_table[item]
+        set_min = register.set_min
+        set_max = register.set_max
 
         if value < set_min or value > set_max:
             raise ValueError(
                 "Value must be between {0} and {1}".format(set_min, set_max)
             )
 
-        formula = self.__register_map_dict[item]["formula_inverse"]
+        formula = register.formula_inverse
         _LOGGER.debug("SET '%s' FORMULA: %s", item, formula)
         _LOGGER.debug("SET '%s' ORIGINAL VALUE: %s", item, value)
         formula = formula.replace("#", str(value))
@@ -581,11 +642,12 @@ class Device(object):
         _LOGGER.debug("SET '%s' CALCULATED VALUE: %s", item, eval_formula)
         return int(eval_formula)
 
-    def __request_writing(self, item, values):
+    def __request_writing(self, item, values, wait=True):
         url = self.__agua_iot.api_url + API_PATH_DEVICE_WRITING
 
-        items = [int(self.__register_map_dict[item]["offset"])]
-        masks = [int(self.__register_map_dict[item]["mask"])]
+        register = self._register_table[item]
+        items = [int(register.offset)]
+        masks = [int(register.mask)]
 
         payload = {
             "id_device": self.id_device,
@@ -604,6 +666,8 @@ class Device(object):
             raise Error("Error while request device writing")
 
         id_request = res["idRequest"]
+        if not wait:
+            return id_request
 
         url = self.__agua_iot.api_url + API_PATH_DEVICE_JOB_STATUS + id_request
 
@@ -626,10 +690,23 @@ class Device(object):
         ):
             raise Error("Error while request device writing")
 
-    def set_item_value(self, item, value):
+        return id_request
+
+    def get_job_status(self, id_request):
+        """Check once a writing job: JOB_COMPLETED, JOB_PENDING or JOB_FAILED"""
+        url = self.__agua_iot.api_url + API_PATH_DEVICE_JOB_STATUS + id_request
+
+        res = self.__agua_iot.handle_webcall("GET", url, json.dumps({}))
+        if res is False or res["jobAnswerStatus"] != "completed":
+            return JOB_PENDING
+        if "Cmd" not in res["jobAnswerData"]:
+            return JOB_FAILED
+        return JOB_COMPLETED
+
+    def set_item_value(self, item, value, wait=True):
         values = [self.__prepare_value_for_writing(item, value)]
         try:
-            self.__request_writing(item, values)
+            return self.__request_writing(item, values, wait)
         except Error:
             raise Error(f"Error while trying to set: {item}")
 
@@ -648,6 +725,8 @@ class Device(object):
 
     @property
     def canalization(self):
+        if not self.__canalization:
+            self.__update_childs()
         return self.__canalization.values()
 
     @property
@@ -806,34 +885,237 @@ class Device(object):
     # Backwards compatibility
     set_power = power
 
-    def turn_off(self):
+    def turn_off(self, wait=True):
         item = "status_managed_get"
-        values = [int(self.__register_map_dict[item]["value_off"])]
+        values = [int(self._register_table[item].value_off)]
         try:
-            self.__request_writing(item, values)
+            return self.__request_writing(item, values, wait)
         except Error:
             raise Error("Error while trying to turn off device")
 
-    def turn_on(self):
+    def turn_on(self, wait=True):
         item = "status_managed_get"
-        values = [int(self.__register_map_dict["status_managed_get"]["value_on"])]
+        values = [int(self._register_table[item].value_on)]
         try:
-            self.__request_writing(item, values)
+            return self.__request_writing(item, values, wait)
         except Error:
             raise Error("Error while trying to turn on device")
 
     @property
     def full_data_map(self):
         data_map = {}
-        for key, value in self.__register_map_dict.items():
-            value["raw_value"] = self.__information_dict[value["offset"]]
-            value["calculated_value"] = self.get_item_value(key)
-            value["formatted_value"] = self.get_item_value(key, True)
-            data_map[key] = value
+        calculated_values = self._register_table.decode(self._buffer)
+        for register in self._register_table:
+            register_dict = register.to_dict()
+            register_dict["raw_value"] = self._buffer.get(register.offset)
+            register_dict["calculated_value"] = calculated_values[register.reg_key]
+            register_dict["formatted_value"] = self.get_item_value(
+                register.reg_key, True
+            )
+            data_map[register.reg_key] = register_dict
 
         return data_map
 
 
+class Register(object):
+    """Single entry of a device registers map"""
+
+    __slots__ = (
+        "reg_key",
+        "reg_type",
+        "offset",
+        "formula",
+        "formula_inverse",
+        "format_string",
+        "set_min",
+        "set_max",
+        "mask",
+        "value_on",
+        "value_off",
+    )
+
+    def __init__(self, register):
+        self.reg_key = register["reg_key"]
+        self.reg_type = register["reg_type"]
+        self.offset = register["offset"]
+        self.formula = register["formula"]
+        self.formula_inverse = register["formula_inverse"]
+        self.format_string = register["format_string"]
+        self.set_min = register["set_min"]
+        self.set_max = register["set_max"]
+        self.mask = register["mask"]
+        self.value_on = None
+        self.value_off = None
+        for v in register.get("enc_val", []):
+            if v["lang"] == "ENG" and v["description"] == "ON":
+                self.value_on = v["value"]
+            elif v["lang"] == "ENG" and v["description"] == "OFF":
+                self.value_off = v["value"]
+
+    def to_dict(self):
+        register_dict = {
+            "reg_type": self.reg_type,
+            "offset": self.offset,
+            "formula": self.formula,
+            "formula_inverse": self.formula_inverse,
+            "format_string": self.format_string,
+            "set_min": self.set_min,
+            "set_max": self.set_max,
+            "mask": self.mask,
+        }
+        if self.value_on is not None:
+            register_dict["value_on"] = self.value_on
+        if self.value_off is not None:
+            register_dict["value_off"] = self.value_off
+        return register_dict
+
+
+class RegisterTable(object):
+    """Registers map of a device, with parallel arrays for vectorized decoding"""
+
+    __slots__ = (
+        "keys",
+        "registers",
+        "_index",
+        "offsets",
+        "masks",
+        "kinds",
+        "factors",
+        "divisors",
+        "addends",
+        "_generic",
+    )
+
+    def __init__(self, registers):
+        self.registers = [Register(register) for register in registers]
+        self.keys = [register.reg_key for register in self.registers]
+        self._index = {key: idx for idx, key in enumerate(self.keys)}
+
+        compiled = [
+            formula_parser.compile_formula(register.formula)
+            for register in self.registers
+        ]
+        self.offsets = np.array(
+            [register.offset for register in self.registers], dtype=np.int64
+        )
+        self.masks = np.array(
+            [register.mask for register in self.registers], dtype=np.int64
+        )
+        self.kinds = np.array([c[0] for c in compiled], dtype=np.int8)
+        self.factors = np.array([c[1] for c in compiled], dtype=np.float64)
+        self.divisors = np.array([c[2] for c in compiled], dtype=np.float64)
+        self.addends = np.array([c[3] for c in compiled], dtype=np.float64)
+        self._generic = np.flatnonzero(self.kinds == formula_parser.KIND_GENERIC)
+
+    def __getitem__(self, key):
+        return self.registers[self._index[key]]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self.registers)
+
+    def __len__(self):
+        return len(self.registers)
+
+    def __repr__(self):
+        return f"RegisterTable({self.keys})"
+
+    def decode_array(self, buffer):
+        """Decode all registers from `buffer` in one pass.
+
+        Returns a tuple (values, valid) of arrays aligned on `keys`, `valid`
+        being False where the offset is missing from the buffer or the
+        formula cannot be evaluated.
+        """
+        raw, valid = buffer.take(self.offsets)
+        raw = raw & self.masks
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = np.trunc(raw * self.factors / self.divisors + self.addends)
+
+        for idx in self._generic:
+            if not valid[idx]:
+                continue
+            formula = self.registers[idx].formula.replace("#", str(raw[idx]))
+            try:
+                values[idx] = formula_parser.parser(formula)
+            except (ValueError, ZeroDivisionError):
+                valid[idx] = False
+
+        return values, valid
+
+    def decode(self, buffer, keys=None):
+        """Decode registers from `buffer` into a {reg_key: value} dict.
+
+        All registers are decoded unless `keys` restricts them, unknown keys
+        being mapped to None.
+        """
+        table = self
+        if keys is not None:
+            table = self.select([key for key in keys if key in self._index])
+        values, valid = table.decode_array(buffer)
+        decoded = dict.fromkeys(table.keys if keys is None else keys)
+        decoded.update(
+            (key, int(value))
+            for key, value, is_valid in zip(table.keys, values.tolist(), valid.tolist())
+            if is_valid
+        )
+        return decoded
+
+    def select(self, keys):
+        """Sub-table holding only `keys`, sharing the compiled registers."""
+        table = RegisterTable.__new__(RegisterTable)
+        indexes = [self._index[key] for key in keys]
+        table.registers = [self.registers[idx] for idx in indexes]
+        table.keys = list(keys)
+        table._index = {key: idx for idx, key in enumerate(table.keys)}
+        for name in ("offsets", "masks", "kinds", "factors", "divisors", "addends"):
+            setattr(table, name, getattr(self, name)[indexes])
+        table._generic = np.flatnonzero(table.kinds == formula_parser.KIND_GENERIC)
+        return table
+
+
+class RegisterBuffer(object):
+    """Dense view of a `jobAnswerData` buffer, indexed by register offset"""
+
+    __slots__ = ("values", "present")
+
+    def __init__(self, items, values):
+        items = np.asarray(items, dtype=np.int64)
+        size = int(items.max()) + 1 if len(items) else 0
+        self.values = np.zeros(size, dtype=np.int64)
+        self.present = np.zeros(size, dtype=bool)
+        self.values[items] = np.asarray(values, dtype=np.int64)
+        self.present[items] = True
+
+    def __getitem__(self, offset):
+        if not 0 <= offset < len(self.present) or not self.present[offset]:
+            raise KeyError(offset)
+        return int(self.values[offset])
+
+    def get(self, offset, default=None):
+        try:
+            return self[offset]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        return int(self.present.sum())
+
+    def __repr__(self):
+        offsets = np.flatnonzero(self.present)
+        return f"RegisterBuffer({dict(zip(offsets.tolist(), self.values[offsets].tolist()))})"
+
+    def take(self, offsets):
+        """Raw values at `offsets` and a mask of which offsets are present."""
+        in_range = (offsets >= 0) & (offsets < len(self.present))
+        clipped = np.where(in_range, offsets, 0)
+        if len(self.present) == 0:
+            return np.zeros(len(offsets), dtype=np.int64), np.zeros(len(offsets), dtype=bool)
+        return self.values[clipped], in_range & self.present[clipped]
+
+
 class Canalization(object):
     MODE_MANUAL = 0
     MODE_SEMI_AUTO = 1
@@ -1,4 +1,37 @@
 """ Simple formula parser to avoid usage of eval()"""
+import re
+
+# Compiled formula kinds, see `compile_formula`
+KIND_SCALE = 0
+KIND_GENERIC = 1
+
+_SCALE_FORMULA = re.compile(
+    r"^#(?:([x*/])(\d+(?:\.\d+)?))?(?:([+-])(\d+(?:\.\d+)?))?$"
+)
+
+
+def compile_formula(string):
+    """Compile a register formula into (kind, factor, divisor, addend).
+
+    Formulas of the form `#`, `# op k` and `# op k +/- c` (op in x, *, /) are
+    compiled to KIND_SCALE so they can be evaluated as
+    `trunc(value * factor / divisor + addend)`, which gives the same result as
+    `parser`. Anything else is KIND_GENERIC and must go through `parser`.
+    """
+    match = _SCALE_FORMULA.match(string.replace(" ", ""))
+    if match is None or match.group(2) is not None and float(match.group(2)) == 0:
+        return KIND_GENERIC, 1.0, 1.0, 0.0
+
+    operator, number, sign, addend = match.groups()
+    factor, divisor = 1.0, 1.0
+    if operator == "/":
+        divisor = float(number)
+    elif operator is not None:
+        factor = float(number)
+    addend = float(addend) if addend is not None else 0.0
+    if sign == "-":
+        addend = -addend
+    return KIND_SCALE, factor, divisor, addend
 
 
 def parser(string):
@@ -0,0 +1,166 @@
+import contextvars
+import email.utils
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+# Highest (requests per second, burst), by vendor and for all processes of the host, each process getting its
+# share of it (see `set_share`). The rate is lowered while the vendor throttles requests.
+VENDOR_RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "heatzy": (50, 100),
+    "agua_iot": (20, 40),
+    "edf_tempo": (5, 10),
+}
+DEFAULT_RATE_LIMIT = (20, 40)
+
+# Rate is divided on throttling, once for requests throttled together, and raised back by a step on each
+# accepted request
+DECREASE_FACTOR = 0.5
+INCREASE_STEP = 0.25
+MIN_RATE = 0.2
+# Wait when a throttled answer gives no `Retry-After`, and longest `Retry-After` honored
+DEFAULT_RETRY_AFTER = 1.0
+MAX_RETRY_AFTER = 60.0
+# Longest wait for a token when no deadline is set
+MAX_WAIT = 60.0
+
+# `time.monotonic()` time no token is waited for past, set by the set_heaters providers for the calls of their run
+deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("rate_limit_deadline", default=None)
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a token would only be available after the deadline."""
+    pass
+
+
+class TokenBucket:
+    """Token bucket of a vendor endpoint, its rate adapting to throttled answers (AIMD).
+
+    `acquire` blocks the calling thread until a token is available and any `Retry-After` has passed, up to a
+    deadline.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        # Counters since creation
+        self.requests = 0
+        self.throttled = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: float = None):
+        """Take a token, waiting for it if needed.
+
+        Tokens are waited for `timeout` seconds at most, up to the context `deadline` or `MAX_WAIT` by default.
+        Raise RateLimitTimeout, without waiting, when the token would only be available later.
+        """
+        if timeout is None:
+            context_deadline = deadline.get()
+            timeout = MAX_WAIT if context_deadline is None else min(MAX_WAIT, context_deadline - time.monotonic())
+        give_up = time.monotonic() + timeout
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    if waited:
+                        self.waits += 1
+                        self.wait_seconds += waited
+                    return
+                delay = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            if now + delay > give_up:
+                raise RateLimitTimeout(f"{self.name} has no token before {max(timeout, 0):.1f}s")
+            time.sleep(delay)
+            waited += delay
+
+    def on_response(self, status_code: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """Adapt the rate to an answer, and return the seconds to wait before retrying a throttled one."""
+        with self._lock:
+            if status_code != 429:
+                self.rate = min(self.max_rate, self.rate + INCREASE_STEP)
+                return None
+
+            now = time.monotonic()
+            self.throttled += 1
+            # Requests sent before the first throttled one was answered do not lower the rate again
+            if now >= self.blocked_until:
+                self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+            self.tokens = min(self.tokens, 0)
+            wait = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+            self.blocked_until = max(self.blocked_until, now + min(wait, MAX_RETRY_AFTER))
+        _LOGGER.warning(f"{self.name} throttled, rate lowered to {self.rate:.2f}/s, waiting {wait:.1f}s")
+        return wait
+
+    def get_state(self) -> dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "rate": self.rate, "max_rate": self.max_rate, "tokens": self.tokens,
+                "requests": self.requests, "throttled": self.throttled,
+                "waits": self.waits, "wait_seconds": self.wait_seconds,
+            }
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_lock = threading.Lock()
+# Share of `VENDOR_RATE_LIMITS` given to this process
+_share = 1.0
+
+
+def set_share(share: float):
+    """Set the share of the vendor rate limits given to this process, for buckets created from now on.
+
+    Processes sending requests to the same vendors at once (`--mode homes` workers) split the limits between them.
+    """
+    global _share
+    _share = share
+
+
+def get_bucket(vendor: str, host: str) -> TokenBucket:
+    """Get the token bucket of a vendor endpoint, creating it on first use."""
+    name = f"{vendor}:{host}"
+    with _lock:
+        if name not in _buckets:
+            rate, burst = VENDOR_RATE_LIMITS.get(vendor, DEFAULT_RATE_LIMIT)
+            _buckets[name] = TokenBucket(name, rate * _share, max(int(burst * _share), 1))
+        return _buckets[name]
+
+
+def get_states() -> Dict[str, dict]:
+    """Get the state of every token bucket, by `vendor:host`."""
+    with _lock:
+        buckets = list(_buckets.values())
+    return {bucket.name: bucket.get_state() for bucket in buckets}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Get the seconds to wait from a `Retry-After` header, given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_time = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_time.timestamp() - time.time(), 0.0)
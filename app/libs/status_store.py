@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+# Prefix of the override marker in the legacy status format, `changed_<epoch>`
+CHANGED_PREFIX = "changed_"
+# Key of the pending writing jobs by device in the legacy status format
+JOBS_STATUS_KEY = "_stove_jobs"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    device TEXT PRIMARY KEY,
+    provider TEXT,
+    desired_mode TEXT,
+    observed_mode TEXT,
+    override_time INTEGER,
+    last_job TEXT,
+    updated_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+@dataclass
+class DeviceRecord:
+    """Status of a device as recorded at the end of a run."""
+    device: str
+    provider: Optional[str] = None
+    # Mode scheduled on last run
+    desired_mode: Optional[str] = None
+    # Mode the device was left in, or `OFFLINE`/`not_found`
+    observed_mode: Optional[str] = None
+    # Time a manual change was detected, the schedule is not reapplied before `max_delay_reapplied`
+    override_time: Optional[int] = None
+    # Writing job sent and not confirmed yet
+    last_job: Optional[dict] = None
+    updated_at: int = 0
+
+    def to_status(self) -> Optional[str]:
+        """Get the status in the legacy format, `<mode>` or `changed_<epoch>`."""
+        if self.override_time is not None:
+            return f"{CHANGED_PREFIX}{self.override_time}"
+        return self.observed_mode
+
+
+class StatusStore:
+    """Device statuses kept in a local SQLite database, written in a single transaction by run.
+
+    The legacy flat status (`{device: mode or changed_<epoch>, "_stove_jobs": {...}, "_<key>": ...}`)
+    is still the exchange format with the controllers, see `load` and `save`.
+    """
+
+    def __init__(self, path: str, timeout: float = 30):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def is_empty(self) -> bool:
+        """Check if nothing was recorded yet."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT NOT EXISTS (SELECT 1 FROM devices) AND NOT EXISTS (SELECT 1 FROM meta)"
+            ).fetchone()[0] == 1
+
+    def get_records(self) -> Dict[str, DeviceRecord]:
+        """Get the records of all devices."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT device, provider, desired_mode, observed_mode, override_time, last_job, updated_at "
+                "FROM devices"
+            ).fetchall()
+        return {
+            row[0]: DeviceRecord(*row[:5], last_job=json.loads(row[5]) if row[5] else None, updated_at=row[6])
+            for row in rows
+        }
+
+    def get_meta(self) -> dict:
+        """Get the other recorded values, such as the last full reconcile time."""
+        with self._lock:
+            rows = self._connection.execute("SELECT key, value FROM meta").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def load(self) -> dict:
+        """Get the statuses in the legacy flat format."""
+        records = self.get_records()
+        status = self.get_meta()
+        jobs = {device: record.last_job for device, record in records.items() if record.last_job}
+        if jobs:
+            status[JOBS_STATUS_KEY] = jobs
+        for device, record in records.items():
+            device_status = record.to_status()
+            if device_status is not None:
+                status[device] = device_status
+        return status
+
+    def save(self, status: dict, desired: Dict[str, dict] = None, previous: dict = None):
+        """Record a legacy flat status, atomically.
+
+        `desired` gives the scheduled `{"mode", "type"}` by device, as merged for the run. `previous` is the status
+        the run started from (see `load`): only the devices and values the run changed since are written, so that
+        runs overlapping each other do not undo each other's changes. Everything is written without it.
+        """
+        desired = desired or {}
+        previous = previous or {}
+        jobs = status.get(JOBS_STATUS_KEY) or {}
+        previous_jobs = previous.get(JOBS_STATUS_KEY) or {}
+        meta = _get_meta(status)
+        previous_meta = _get_meta(previous)
+        devices = _get_devices(status)
+        previous_devices = _get_devices(previous)
+        updated_at = int(time.time())
+
+        rows = []
+        for device in devices.keys() | jobs.keys():
+            if device in previous_devices.keys() | previous_jobs.keys() and \
+                    devices.get(device) == previous_devices.get(device) and jobs.get(device) == previous_jobs.get(device):
+                continue
+            device_status = devices.get(device)
+            override_time = None
+            if device_status and device_status.startswith(CHANGED_PREFIX):
+                override_time, device_status = int(device_status[len(CHANGED_PREFIX):]), None
+            device_params = desired.get(device, {})
+            job = jobs.get(device)
+            rows.append((
+                device, device_params.get("type"), device_params.get("mode"), device_status or None,
+                override_time, json.dumps(job) if job else None, updated_at
+            ))
+        # Devices the run dropped, other devices being left to the run that recorded them
+        removed = (previous_devices.keys() | previous_jobs.keys()) - devices.keys() - jobs.keys()
+        meta_rows = [(key, json.dumps(value)) for key, value in meta.items() if previous_meta.get(key) != value]
+        removed_meta = previous_meta.keys() - meta.keys()
+
+        with self._lock:
+            # Writers are serialized by SQLite, readers keep seeing the previous run until commit
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(
+                    "INSERT INTO devices (device, provider, desired_mode, observed_mode, override_time, last_job, "
+                    "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(device) DO UPDATE SET "
+                    "provider = COALESCE(excluded.provider, provider), "
+                    "desired_mode = COALESCE(excluded.desired_mode, desired_mode), "
+                    "observed_mode = excluded.observed_mode, override_time = excluded.override_time, "
+                    "last_job = excluded.last_job, updated_at = excluded.updated_at", rows
+                )
+                # Scheduled modes of the devices left unchanged
+                self._connection.executemany(
+                    "UPDATE devices SET provider = ?, desired_mode = ? WHERE device = ? "
+                    "AND (provider IS NOT ? OR desired_mode IS NOT ?)",
+                    [(params.get("type"), params.get("mode"), device, params.get("type"), params.get("mode"))
+                     for device, params in desired.items()]
+                )
+                self._connection.executemany("DELETE FROM devices WHERE device = ?", [(device,) for device in removed])
+                self._connection.executemany(
+                    "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    meta_rows
+                )
+                self._connection.executemany("DELETE FROM meta WHERE key = ?", [(key,) for key in removed_meta])
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+        self.logger.debug(f"Saved {len(rows)} changed device records to {self.path}")
+
+
+def _get_meta(status: dict) -> dict:
+    return {key: value for key, value in status.items() if key.startswith("_") and key != JOBS_STATUS_KEY}
+
+
+def _get_devices(status: dict) -> dict:
+    return {key: value for key, value in status.items() if not key.startswith("_")}
@@ -0,0 +1,225 @@
+import abc
+import json
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+import yaml
+
+from libs.common import YamlLoader
+
+_LOGGER = logging.getLogger(__name__)
+
+_storages: Dict[str, "Storage"] = {}
+_lock = threading.Lock()
+
+
+class StorageConflict(Exception):
+    """Raised when an object was changed by someone else since it was read."""
+    pass
+
+
+class StorageBackendFailure(Exception):
+    pass
+
+
+class Storage(abc.ABC):
+    """Inputs and outputs of the managers (modes, schedules, status), by path."""
+
+    @abc.abstractmethod
+    def read(self, path: str) -> bytes:
+        """Read an object, raise FileNotFoundError if it does not exist."""
+
+    @abc.abstractmethod
+    def write(self, path: str, data: bytes, if_unchanged: bool = False):
+        """Write an object, replacing it atomically.
+
+        With `if_unchanged`, for objects read, modified and written back, StorageConflict is raised if the object
+        was changed (or created) by someone else since it was read. Backends without versions ignore it.
+        """
+
+    @abc.abstractmethod
+    def exists(self, path: str) -> bool:
+        pass
+
+    def read_json(self, path: str):
+        return json.loads(self.read(path))
+
+    def read_yaml(self, path: str):
+        return yaml.load(self.read(path), Loader=YamlLoader)
+
+    def write_json(self, path: str, content, if_unchanged: bool = False):
+        self.write(path, json.dumps(content, indent=2).encode(), if_unchanged=if_unchanged)
+
+
+class LocalStorage(Storage):
+    """Files on a local (or mounted) filesystem."""
+
+    def __init__(self, root: str = None):
+        self.root = root
+
+    def _get_path(self, path: str) -> str:
+        return os.path.join(self.root, path) if self.root else path
+
+    def read(self, path: str) -> bytes:
+        with open(self._get_path(path), 'rb') as file:
+            return file.read()
+
+    def write(self, path: str, data: bytes, if_unchanged: bool = False):
+        file_path = self._get_path(path)
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_file_path = f"{file_path}.tmp"
+        with open(temp_file_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_file_path, file_path)
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(self._get_path(path))
+
+
+class S3Storage(Storage):
+    """Objects of an S3 compatible bucket (AWS, MinIO...), with a local read-through cache.
+
+    Reads are conditional GETs on the ETag of the cached copy, so unchanged objects are not downloaded again.
+    Outputs (schedules, reports) are replaced whatever their remote version. Writes `if_unchanged` are conditional
+    PUTs on the ETag last read, or on the object not existing yet when it was read as missing, a concurrent change
+    raising StorageConflict. Objects are not uploaded again when their content did not change since the cached copy
+    and the remote ETag is still the cached one.
+    """
+    ETAG_SUFFIX = ".etag"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, region: str = None,
+                 cache_directory: str = ".cache/storage", client=None):
+        self.logger = logging.getLogger(__name__)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache_directory = cache_directory
+        self.client = client or self._build_client(endpoint_url, region)
+
+    @staticmethod
+    def _build_client(endpoint_url: Optional[str], region: Optional[str]):
+        try:
+            import boto3
+        except ImportError:
+            raise StorageBackendFailure(
+                "S3 storage requires boto3, install it with `pip install -r requirements-s3.txt`."
+            )
+        # Credentials are taken from the usual AWS environment variables and files
+        return boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+
+    def _get_key(self, path: str) -> str:
+        return f"{self.prefix}{path.lstrip('/')}"
+
+    def _get_cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_directory, self.bucket, key)
+
+    def _read_cache(self, key: str):
+        """Get the (content, etag) of the cached copy of an object, or (None, None)."""
+        cache_path = self._get_cache_path(key)
+        try:
+            with open(cache_path, 'rb') as file:
+                content = file.read()
+            with open(f"{cache_path}{self.ETAG_SUFFIX}") as file:
+                return content, file.read()
+        except FileNotFoundError:
+            return None, None
+
+    def _write_cache(self, key: str, content: bytes, etag: str):
+        cache_path = self._get_cache_path(key)
+        LocalStorage().write(cache_path, content)
+        LocalStorage().write(f"{cache_path}{self.ETAG_SUFFIX}", etag.encode())
+
+    def _drop_cache(self, key: str):
+        cache_path = self._get_cache_path(key)
+        for file_path in (cache_path, f"{cache_path}{self.ETAG_SUFFIX}"):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    @staticmethod
+    def _get_error_code(err) -> str:
+        return str(getattr(err, "response", {}).get("Error", {}).get("Code"))
+
+    def read(self, path: str) -> bytes:
+        key = self._get_key(path)
+        content, etag = self._read_cache(key)
+        kwargs = {"IfNoneMatch": etag} if etag else {}
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key, **kwargs)
+        except Exception as err:
+            code = self._get_error_code(err)
+            if code in ("304", "NotModified"):
+                self.logger.debug(f"s3://{self.bucket}/{key} not modified, using cached copy")
+                return content
+            if code in ("404", "NoSuchKey"):
+                self._drop_cache(key)
+                raise FileNotFoundError(f"s3://{self.bucket}/{key} not found")
+            raise
+
+        content = response["Body"].read()
+        self._write_cache(key, content, response["ETag"])
+        self.logger.debug(f"s3://{self.bucket}/{key} downloaded ({len(content)} bytes)")
+        return content
+
+    def write(self, path: str, data: bytes, if_unchanged: bool = False):
+        key = self._get_key(path)
+        content, etag = self._read_cache(key)
+        if content == data and self._get_remote_etag(key) == etag:
+            self.logger.debug(f"s3://{self.bucket}/{key} unchanged, not uploaded")
+            return
+
+        kwargs = {}
+        if if_unchanged:
+            # Objects read as missing are only created, not replaced
+            kwargs = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        try:
+            response = self.client.put_object(Bucket=self.bucket, Key=key, Body=data, **kwargs)
+        except Exception as err:
+            if self._get_error_code(err) in ("412", "PreconditionFailed"):
+                self._drop_cache(key)
+                raise StorageConflict(f"s3://{self.bucket}/{key} changed since it was read")
+            raise
+        self._write_cache(key, data, response["ETag"])
+        self.logger.debug(f"s3://{self.bucket}/{key} uploaded ({len(data)} bytes)")
+
+    def _get_remote_etag(self, key: str) -> Optional[str]:
+        """Get the ETag of an object in the bucket, or None if it does not exist."""
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ETag"]
+        except Exception as err:
+            if self._get_error_code(err) in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, path: str) -> bool:
+        return self._get_remote_etag(self._get_key(path)) is not None
+
+
+def get_storage(storage_configs: dict = None) -> Storage:
+    """Get the storage of a `storage` configuration section, shared by all managers of the process.
+
+    Local files are used when the section is not set.
+    """
+    storage_configs = storage_configs or {}
+    cache_key = json.dumps(storage_configs, sort_keys=True)
+    with _lock:
+        if cache_key not in _storages:
+            backend = storage_configs.get("backend", "local")
+            if backend == "local":
+                storage = LocalStorage(storage_configs.get("root"))
+            elif backend == "s3":
+                s3_configs = storage_configs["s3"]
+                storage = S3Storage(
+                    bucket=s3_configs["bucket"],
+                    prefix=s3_configs.get("prefix", ""),
+                    endpoint_url=s3_configs.get("endpoint_url"),
+                    region=s3_configs.get("region"),
+                    cache_directory=s3_configs.get("cache_directory", ".cache/storage"),
+                )
+            else:
+                raise StorageBackendFailure(f"Unknown storage backend {backend}, `local` or `s3` expected.")
+            _LOGGER.debug(f"Using {backend} storage")
+            _storages[cache_key] = storage
+        return _storages[cache_key]
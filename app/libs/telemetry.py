@@ -0,0 +1,207 @@
+import argparse
+import datetime
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+_LOGGER = logging.getLogger(__name__)
+
+# Samples kept by device, about 57 days at one run every 5 minutes
+DEFAULT_CAPACITY = 16384
+
+# Bumped when the sample layout changes, files of another version are not opened
+MAGIC = b"HGCTLM2"
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"), ("sample_size", "<u4"), ("reserved", "<u4"), ("capacity", "<u8"),
+    # Samples appended since the file was created, the next one going to `written % capacity`
+    ("written", "<u8"),
+])
+# Readings are NaN when the device does not report them (Heatzy devices, missing registers)
+SAMPLE_DTYPE = np.dtype([
+    ("time", "<f8"),
+    ("air_temp", "<f4"), ("gas_temp", "<f4"), ("real_power", "<f4"),
+    # Mode read from the device, mode scheduled and decision taken, see `libs.decisions.Decisions`
+    ("mode", "S32"), ("target", "S16"), ("decision", "S16"),
+])
+READINGS = ("air_temp", "gas_temp", "real_power")
+
+
+class TelemetryRing:
+    """Fixed-size ring of the samples of a device, memory-mapped from its file.
+
+    Samples are written in place, the oldest ones being overwritten once `capacity` is reached. The header count
+    is updated after the sample, readers of other processes never seeing a partial one. The capacity of an
+    existing file is kept.
+    """
+
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY, readonly: bool = False):
+        self.path = path
+        if not os.path.exists(path):
+            if readonly:
+                raise FileNotFoundError(path)
+            self._create(path, capacity)
+
+        mode = "r" if readonly else "r+"
+        self._header = np.memmap(path, dtype=HEADER_DTYPE, mode=mode, shape=(1,))
+        if self._header["magic"][0] != MAGIC or self._header["sample_size"][0] != SAMPLE_DTYPE.itemsize:
+            raise ValueError(f"{path} is not a telemetry file of this version")
+        self.capacity = int(self._header["capacity"][0])
+        self._samples = np.memmap(path, dtype=SAMPLE_DTYPE, mode=mode, offset=HEADER_SIZE, shape=(self.capacity,))
+
+    @staticmethod
+    def _create(path: str, capacity: int):
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"], header["sample_size"], header["capacity"] = MAGIC, SAMPLE_DTYPE.itemsize, capacity
+        # Written aside then moved, a reader never opens a file without its header
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as ring_file:
+            ring_file.write(header.tobytes().ljust(HEADER_SIZE, b"\0"))
+            ring_file.truncate(HEADER_SIZE + capacity * SAMPLE_DTYPE.itemsize)
+        os.replace(temporary_path, path)
+
+    @property
+    def written(self) -> int:
+        return int(self._header["written"][0])
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    def append(self, sample_time: float, mode: str = None, target: str = None, decision: str = None,
+               air_temp: float = None, gas_temp: float = None, real_power: float = None):
+        """Append a sample, readings left to None being stored as NaN."""
+        written = self.written
+        self._samples[written % self.capacity] = (
+            sample_time,
+            np.nan if air_temp is None else air_temp,
+            np.nan if gas_temp is None else gas_temp,
+            np.nan if real_power is None else real_power,
+            mode or "", target or "", decision or "",
+        )
+        self._header["written"] = written + 1
+
+    def segments(self) -> List[np.ndarray]:
+        """Views of the samples in time order, two of them once the ring wrapped around."""
+        written = self.written
+        if written <= self.capacity:
+            return [self._samples[:written]]
+        head = written % self.capacity
+        return [segment for segment in (self._samples[head:], self._samples[:head]) if len(segment)]
+
+    def query(self, start: float = None, end: float = None) -> List[np.ndarray]:
+        """Views of the samples with `start <= time < end`, in time order, without copying them.
+
+        Views read the file: they change when samples are appended over them, copy them to keep them.
+        """
+        views = []
+        for segment in self.segments():
+            times = segment["time"]
+            low = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+            high = len(segment) if end is None else int(np.searchsorted(times, end, side="left"))
+            if high > low:
+                views.append(segment[low:high])
+        return views
+
+    def read(self, start: float = None, end: float = None) -> np.ndarray:
+        """Samples with `start <= time < end` as one array, a view unless they wrap around the end of the ring."""
+        views = self.query(start, end)
+        if not views:
+            return self._samples[:0]
+        return views[0] if len(views) == 1 else np.concatenate(views)
+
+    def flush(self):
+        if self._samples.mode != "r":
+            self._samples.flush()
+            self._header.flush()
+
+
+class TelemetryRecorder:
+    """Telemetry rings of the devices, one `<device>.ring` file each in `directory`."""
+
+    def __init__(self, directory: str, capacity: int = DEFAULT_CAPACITY):
+        self.directory = directory
+        self.capacity = capacity
+        os.makedirs(directory, exist_ok=True)
+        self._rings: Dict[str, TelemetryRing] = {}
+        # Heatzy and stove devices are recorded from their own threads
+        self._lock = threading.Lock()
+
+    def get_ring(self, device: str) -> TelemetryRing:
+        with self._lock:
+            if device not in self._rings:
+                self._rings[device] = self._open_ring(get_ring_path(self.directory, device))
+            return self._rings[device]
+
+    def _open_ring(self, path: str) -> TelemetryRing:
+        try:
+            return TelemetryRing(path, self.capacity)
+        except ValueError:
+            # Files of a previous version are kept aside, a new ring being started
+            _LOGGER.warning(f"{path} is not a telemetry file of this version, moved to {path}.old")
+            os.replace(path, f"{path}.old")
+            return TelemetryRing(path, self.capacity)
+
+    def record(self, device: str, sample_time: float = None, **sample):
+        """Append a sample of a device, at the current time by default. A failing write is only logged."""
+        try:
+            self.get_ring(device).append(time.time() if sample_time is None else sample_time, **sample)
+        except (OSError, ValueError) as err:
+            _LOGGER.warning(f"Could not record telemetry of {device}: {err}")
+
+    def flush(self):
+        with self._lock:
+            rings = list(self._rings.values())
+        for ring in rings:
+            ring.flush()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._rings = {}
+
+
+# Characters of device names replaced in file names
+_UNSAFE_CHARACTERS = re.compile(r"[^\w.-]")
+
+
+def get_ring_path(directory: str, device: str) -> str:
+    return os.path.join(directory, f"{_UNSAFE_CHARACTERS.sub('_', device)}.ring")
+
+
+def open_ring(directory: str, device: str) -> TelemetryRing:
+    """Open the ring of a device for queries, read-only."""
+    return TelemetryRing(get_ring_path(directory, device), readonly=True)
+
+
+def list_devices(directory: str) -> List[str]:
+    """Devices with a ring file in `directory`, by file name."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(".ring")] for name in os.listdir(directory) if name.endswith(".ring"))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="Print the telemetry of devices")
+    parser.add_argument("--directory", required=True, help="Telemetry directory, `set_heaters.telemetry.directory`")
+    parser.add_argument("--device", default=None, help="Device name, all devices by default")
+    parser.add_argument("--since", type=float, default=86400, help="Seconds of history to print")
+    args = parser.parse_args()
+
+    start = time.time() - args.since
+    for device in [args.device] if args.device else list_devices(args.directory):
+        for samples in open_ring(args.directory, device).query(start):
+            for sample in samples:
+                readings = " ".join(f"{reading}={sample[reading]:g}" for reading in READINGS
+                                    if not np.isnan(sample[reading]))
+                print(f"{datetime.datetime.fromtimestamp(sample['time']).isoformat(timespec='seconds')} {device} "
+                      f"{sample['mode'].decode()} -> {sample['target'].decode()} {sample['decision'].decode()} "
+                      f"{readings}".rstrip())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import logging
+import threading
+from http.cookiejar import DefaultCookiePolicy
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from libs import common, instrumentation, rate_limit
+
+_LOGGER = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds, by vendor
+VENDOR_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "heatzy": (5, 15),
+    "agua_iot": (5, 10),
+    "edf_tempo": (5, 10),
+    "google": (5, 30),
+}
+DEFAULT_TIMEOUT = (5, 30)
+
+# Retries on connection errors and 5xx answers, with exponential backoff.
+# POST requests are only retried when the connection could not be established.
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+# Retries of throttled (429) requests, after their `Retry-After`
+THROTTLED_RETRIES = 2
+
+# Keep-alive connections kept per host, as many as the I/O executor workers when not set
+POOL_SIZE: Optional[int] = None
+
+# Callables notified after each request with (vendor, method, url, response, elapsed).
+# `response` is None when the request raised.
+RequestHook = Callable[[str, str, str, Optional[requests.Response], float], None]
+
+_hooks: List[RequestHook] = []
+_sessions: Dict[str, "VendorSession"] = {}
+_lock = threading.Lock()
+# Cookies are not kept when sessions are shared by several homes, see `disable_cookies`
+_cookies_enabled = True
+
+
+class VendorSession(requests.Session):
+    """Pooled session of a vendor, with default timeouts, retries, rate limits and request hooks.
+
+    Requests go through the token bucket of their vendor endpoint, see `libs.rate_limit`.
+    """
+
+    def __init__(self, vendor: str, timeout: Tuple[float, float], retries: int = DEFAULT_RETRIES,
+                 backoff_factor: float = DEFAULT_BACKOFF_FACTOR, pool_size: int = None):
+        super().__init__()
+        self.vendor = vendor
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            raise_on_status=False,
+            # Throttled answers are handed to the rate limiter instead of being waited for here
+            respect_retry_after_header=False,
+        )
+        pool_size = pool_size or get_pool_size()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        bucket = rate_limit.get_bucket(self.vendor, urlsplit(url).netloc)
+        for attempt in range(THROTTLED_RETRIES + 1):
+            try:
+                bucket.acquire()
+            except rate_limit.RateLimitTimeout as err:
+                # Not sent, handled by callers as any request that timed out
+                raise requests.exceptions.Timeout(str(err)) from err
+            response = None
+            start = time.perf_counter()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            finally:
+                _notify(self.vendor, method, url, response, time.perf_counter() - start)
+
+            retry_after = None
+            if response.status_code == 429:
+                retry_after = rate_limit.parse_retry_after(response.headers.get("Retry-After"))
+            wait = bucket.on_response(response.status_code, retry_after)
+            # Throttled requests were not processed, they are sent again once the bucket allows it
+            if wait is None or wait > rate_limit.MAX_RETRY_AFTER or attempt == THROTTLED_RETRIES:
+                return response
+
+
+def _notify(vendor: str, method: str, url: str, response: Optional[requests.Response], elapsed: float):
+    report = instrumentation.get_active_run()
+    if report is not None:
+        report.on_request(vendor, method, url, response, elapsed)
+    for hook in list(_hooks):
+        try:
+            hook(vendor, method, url, response, elapsed)
+        except Exception as err:
+            _LOGGER.warning(f"Request hook {hook} failed: {err}")
+
+
+def get_timeout(vendor: str) -> Tuple[float, float]:
+    """Get the (connect, read) timeout of a vendor."""
+    return VENDOR_TIMEOUTS.get(vendor, DEFAULT_TIMEOUT)
+
+
+def get_session(vendor: str) -> VendorSession:
+    """Get the shared session of a vendor, creating it on first use."""
+    with _lock:
+        if vendor not in _sessions:
+            _LOGGER.debug(f"Creating HTTP session for {vendor}")
+            _sessions[vendor] = VendorSession(vendor, get_timeout(vendor))
+            if not _cookies_enabled:
+                _block_cookies(_sessions[vendor])
+        return _sessions[vendor]
+
+
+def get_pool_size() -> int:
+    """Get the keep-alive connections kept per host, each I/O executor worker holding at most one."""
+    return POOL_SIZE or common.IO_MAX_WORKERS
+
+
+def set_pool_size(pool_size: int):
+    """Set the keep-alive connections kept per host by sessions created from now on."""
+    global POOL_SIZE
+    POOL_SIZE = pool_size
+
+
+def disable_cookies():
+    """Do not keep cookies in shared sessions, authentication going through headers of each home."""
+    global _cookies_enabled
+    with _lock:
+        _cookies_enabled = False
+        for session in _sessions.values():
+            _block_cookies(session)
+
+
+def _block_cookies(session: requests.Session):
+    session.cookies.clear()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+
+def close_sessions():
+    """Close all shared sessions and their pooled connections."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def add_hook(hook: RequestHook):
+    """Register a callable notified after each request."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook: RequestHook):
+    """Unregister a request hook."""
+    if hook in _hooks:
+        _hooks.remove(hook)
@@ -1,20 +1,67 @@
 import argparse
+import contextlib
 
-from managers.get_schedules import ScheduleManager
-from managers.set_heaters import HeaterManager
+from libs import instrumentation
+from libs.common import read_yaml_config
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog="Manage your heaters")
     parser.add_argument("--configs", required=False, default="configs/main.yaml", help="Set heaters config file")
     parser.add_argument("--dry-run", default=False, action='store_true', help="Run as dry run")
-    parser.add_argument("--mode", default="all", choices=["all", "set_heaters", "get_schedules"], help="Run specific mode")
+    parser.add_argument("--mode", default="all", choices=["all", "set_heaters", "get_schedules", "daemon", "homes"],
+                        help="Run specific mode, `homes` running every home listed in the --configs file")
+    parser.add_argument("--schedules-interval", type=int, default=None, help="Daemon mode, seconds between schedules fetch")
+    parser.add_argument("--heaters-interval", type=int, default=None, help="Daemon mode, seconds between heaters update")
+    parser.add_argument("--profile", default=False, action='store_true',
+                        help="Profile the run with cProfile, reports are written next to the logs")
+    parser.add_argument("--trace-malloc", default=False, action='store_true',
+                        help="Trace memory allocations of the run, reports are written next to the logs")
     args = parser.parse_args()
 
-    if args.mode == "all" or args.mode == "get_schedules":
-        schedule_manager = ScheduleManager(args.configs)
-        schedule_manager.run()
+    # Daemon tasks are reported run by run, other modes as a single run
+    if args.mode != "daemon":
+        instrumentation.start_run(args.mode)
 
-    if args.mode == "all" or args.mode == "set_heaters":
-        heater_manager = HeaterManager(args.configs)
-        heater_manager.dry_run = args.dry_run
-        heater_manager.run()
+    # Configuration is parsed once and shared, managers are imported for the selected mode only
+    with instrumentation.span("config_load"):
+        configs = read_yaml_config(args.configs)
+
+    profiler = contextlib.nullcontext()
+    if args.profile or args.trace_malloc:
+        from libs.profiling import Profiler
+        profiler = Profiler(
+            configs['logs']['directory'], args.mode, profile=args.profile, trace_malloc=args.trace_malloc
+        )
+    with profiler:
+        if args.mode == "daemon":
+            from managers.daemon import Daemon
+            daemon = Daemon(
+                args.configs, dry_run=args.dry_run, configs=configs,
+                schedules_interval=args.schedules_interval, heaters_interval=args.heaters_interval
+            )
+            daemon.run()
+
+        if args.mode == "get_schedules":
+            from managers.get_schedules import ScheduleManager
+            schedule_manager = ScheduleManager(args.configs, configs=configs)
+            schedule_manager.run()
+
+        if args.mode == "all":
+            # Provider sessions are opened while schedules are fetched, then handed over in memory
+            from managers.pipeline import PipelineRunner
+            runner = PipelineRunner(args.configs, dry_run=args.dry_run, configs=configs)
+            runner.run()
+
+        if args.mode == "homes":
+            from managers.homes import HomesRunner
+            homes_runner = HomesRunner(args.configs, dry_run=args.dry_run, configs=configs)
+            homes_runner.run()
+
+        if args.mode == "set_heaters":
+            from managers.set_heaters import HeaterManager
+            heater_manager = HeaterManager(args.configs, configs=configs)
+            heater_manager.dry_run = args.dry_run
+            heater_manager.run()
+
+    if args.mode != "daemon":
+        instrumentation.finish_run(configs)
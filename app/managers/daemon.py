@@ -0,0 +1,164 @@
+import argparse
+import logging
+import signal
+import threading
+import time
+import traceback
+
+from libs import instrumentation, transport
+from libs.calendar_watch import CalendarWatcher
+from libs.common import read_yaml_config, get_logger, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+from managers.get_schedules import ScheduleManager
+from managers.set_heaters import HeaterManager
+
+
+class Daemon:
+    """Resident process running get_schedules and set_heaters on their own cadence.
+
+    With `daemon.watch` set, calendar changes are also pushed by Google, each one running get_schedules
+    (incremental sync) then set_heaters right away.
+    """
+    DEFAULT_SCHEDULES_INTERVAL = 300
+    DEFAULT_HEATERS_INTERVAL = 300
+    # Seconds gathering the notifications of a calendar edit before syncing
+    DEFAULT_NOTIFICATION_DELAY = 1
+
+    def __init__(self, config_file_path: str, dry_run: bool = False,
+                 schedules_interval: int = None, heaters_interval: int = None, configs: dict = None):
+        """Initialize the daemon, managers being created once and kept warm"""
+        self.configs = configs if configs is not None else read_yaml_config(config_file_path)
+
+        # Initialize the logger
+        self.logger = logging.getLogger(__name__)
+        self._set_logging()
+
+        daemon_configs = self.configs.get('daemon', {})
+        self.intervals = {
+            "get_schedules": schedules_interval or daemon_configs.get(
+                'schedules_interval', self.DEFAULT_SCHEDULES_INTERVAL),
+            "set_heaters": heaters_interval or daemon_configs.get(
+                'heaters_interval', self.DEFAULT_HEATERS_INTERVAL),
+        }
+
+        self.schedule_manager = ScheduleManager(config_file_path, configs=self.configs)
+        self.heater_manager = HeaterManager(config_file_path, configs=self.configs)
+        self.heater_manager.dry_run = dry_run
+        self.heater_manager.keep_alive = True
+
+        # Last schedules fetched, handed over to set_heaters in memory
+        self.schedules = None
+
+        self._stop = threading.Event()
+        # Set on stop and on calendar notifications, to wake the loop up
+        self._wake = threading.Event()
+        self._notified = threading.Event()
+
+        # Calendar push notifications
+        self.watcher = None
+        watch_configs = daemon_configs.get('watch')
+        if watch_configs and watch_configs.get('enabled', True):
+            self.watcher = CalendarWatcher(self.schedule_manager.google_calendar_api, watch_configs, self.notify)
+            # Notifications only tell that the watched calendar changed, it is the one synced
+            self.schedule_manager.calendar_id = self.watcher.calendar_id
+            self.notification_delay = float(watch_configs.get('delay', self.DEFAULT_NOTIFICATION_DELAY))
+
+    def _set_logging(self):
+        """Set up logging based on the configuration."""
+        logs_configs = self.configs["logs"]
+        log_file_path = f'{logs_configs["directory"]}/daemon.log'
+        log_level = logs_configs["level"].upper()
+
+        return get_logger(
+            self.logger, log_file_path=log_file_path, level=log_level,
+            max_bytes=logs_configs.get("max_bytes", LOG_MAX_BYTES),
+            backup_count=logs_configs.get("backup_count", LOG_BACKUP_COUNT)
+        )
+
+    def stop(self, signum=None, frame=None):
+        """Ask the daemon to stop after the task in progress."""
+        self.logger.info(f"Stop requested (signal {signum})")
+        self._stop.set()
+        self._wake.set()
+
+    def notify(self):
+        """Ask the daemon to sync schedules and set heaters now, called on calendar changes."""
+        self._notified.set()
+        self._wake.set()
+
+    def _run_task(self, task: str):
+        self.logger.info(f"Running {task}")
+        instrumentation.start_run(task)
+        try:
+            if task == "get_schedules":
+                # Notifications tell that something changed, the changes are synced from the last sync token
+                self.schedules = self.schedule_manager.run(wait=False, incremental=self.watcher is not None)
+            else:
+                self.heater_manager.run(self.schedules)
+        except Exception as err:
+            self.logger.error(f"Task {task} failed: {err}")
+            self.logger.error(traceback.format_exc())
+        finally:
+            instrumentation.finish_run(self.configs)
+
+    def _run_notified(self, next_runs: dict):
+        """Run get_schedules then set_heaters after a calendar notification, their next runs being pushed back."""
+        # Edits notify several times in a row, they are synced together
+        self._stop.wait(self.notification_delay)
+        self._notified.clear()
+        self.logger.info("Calendar changed")
+        for task in ("get_schedules", "set_heaters"):
+            if self._stop.is_set():
+                return
+            self._run_task(task)
+            next_runs[task] = time.monotonic() + self.intervals[task]
+
+    def run(self):
+        """Run tasks until SIGTERM or SIGINT is received."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.logger.info(f"Daemon started with intervals {self.intervals}")
+
+        # Tasks are due right away, schedules being fetched before heaters are set
+        next_runs = {task: time.monotonic() for task in self.intervals}
+        next_renewal = None
+        if self.watcher is not None:
+            self.watcher.start()
+            next_renewal = self.watcher.renew()
+
+        while not self._stop.is_set():
+            if self._notified.is_set():
+                self._run_notified(next_runs)
+            for task, next_run in next_runs.items():
+                if self._stop.is_set():
+                    break
+                if time.monotonic() >= next_run:
+                    self._run_task(task)
+                    next_runs[task] = time.monotonic() + self.intervals[task]
+            if next_renewal is not None and time.monotonic() >= next_renewal and not self._stop.is_set():
+                next_renewal = self.watcher.renew()
+
+            wake_at = min([*next_runs.values(), next_renewal or float("inf")])
+            self._wake.wait(max(wake_at - time.monotonic(), 0))
+            self._wake.clear()
+
+        self.logger.info("Stopping daemon")
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.schedule_manager.wait_saved()
+        self.heater_manager.close()
+        transport.close_sessions()
+
+
+def main(config_file_path: str, dry_run: bool = False):
+    """Entry point for the Daemon"""
+    daemon = Daemon(config_file_path, dry_run=dry_run)
+    daemon.run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='Run heaters management as a daemon')
+    parser.add_argument("--configs", required=False, default="configs/main.yaml", help="General config file")
+    parser.add_argument("--dry-run", default=False, action='store_true', help="Run as dry run")
+    args = parser.parse_args()
+
+    main(args.configs, dry_run=args.dry_run)
@@ -1,9 +1,14 @@
 import argparse
+import contextvars
 import logging
 import os
+import threading
 
-from libs.common import read_yaml_config, get_logger
-from libs.google_calendar import GoogleCalendarAPI
+from libs import instrumentation
+from libs.common import read_yaml_config, get_logger, get_home_logger_name, write_credentials_file, \
+    LOG_MAX_BYTES, LOG_BACKUP_COUNT
+from libs.google_calendar import GoogleCalendarAPI, SyncTokenExpired
+from libs.storage import get_storage
 
 
 class GoogleCredentialsSourceFailure(Exception):
@@ -11,20 +16,35 @@ class GoogleCredentialsSourceFailure(Exception):
 
 
 class ScheduleManager:
-    def __init__(self, config_schedule_file_path):
-        """Initialize ScheduleManager with configuration files"""
+    # Upcoming meetings read from the calendar, by start time
+    MAX_MEETINGS = 50
+
+    def __init__(self, config_schedule_file_path, configs: dict = None):
+        """Initialize ScheduleManager with configuration files, or with configurations already parsed"""
         self.config_schedule_file_path = config_schedule_file_path
 
         # Read the configuration files
-        self.configs = self._load_configs()
+        self.configs = configs if configs is not None else self._load_configs()
 
         # Initialize the logger
-        self.logger = logging.getLogger(__name__)
+        self.logger = logging.getLogger(get_home_logger_name(__name__, self.configs))
         self._set_logging()
 
+        # Schedules file
+        self.storage = get_storage(self.configs.get('storage'))
+
         # Initialize the Google Calendar API
         self.google_calendar_api = self._init_google_calendar()
 
+        # Background writing of the schedules file
+        self._save_thread = None
+
+        # Events by id and token of the last incremental sync, see `get_and_save_meetings`
+        self.events = {}
+        self.sync_token = None
+        # Calendar the meetings are read from, the one watched by the daemon
+        self.calendar_id = 'primary'
+
     def _load_configs(self) -> dict:
         """Load configurations from YAML files."""
         #self.logger.debug(f"Reading configs from {self.config_schedule_file_path}")
@@ -33,10 +53,15 @@ class ScheduleManager:
 
     def _set_logging(self):
         """Set up logging based on the configuration."""
-        log_file_path = f'{self.configs["logs"]["directory"]}/get_schedules.log'
-        log_level = self.configs["logs"]["level"].upper()
+        logs_configs = self.configs["logs"]
+        log_file_path = f'{logs_configs["directory"]}/get_schedules.log'
+        log_level = logs_configs["level"].upper()
 
-        return get_logger(self.logger, log_file_path=log_file_path, level=log_level)
+        return get_logger(
+            self.logger, log_file_path=log_file_path, level=log_level,
+            max_bytes=logs_configs.get("max_bytes", LOG_MAX_BYTES),
+            backup_count=logs_configs.get("backup_count", LOG_BACKUP_COUNT)
+        )
 
     def _init_google_calendar(self) -> GoogleCalendarAPI:
         """Initialize the GoogleCalendarAPI with credentials."""
@@ -46,9 +71,7 @@ class ScheduleManager:
             credentials_file_path = credentials_source.split("file://")[1]
         elif credentials_source.startswith("env://"):
             env_var = os.getenv(credentials_source.split("env://")[1])
-            credentials_file_path = "google_credentials.json"
-            with open(credentials_file_path, "w") as credentials_file:
-                credentials_file.write(env_var)
+            credentials_file_path = write_credentials_file("google", env_var)
         else:
             self.logger.error(f"Cannot get credentials from {credentials_source}")
             raise GoogleCredentialsSourceFailure(
@@ -56,23 +79,90 @@ class ScheduleManager:
             )
 
         timezone = self.configs['timezone']
-        return GoogleCalendarAPI(credentials_file_path, timezone)
-
-    def get_and_save_meetings(self):
-        """Get meetings from Google Calendar and save them to a file."""
+        api_endpoint = self.configs['get_schedules']["providers"]["google"].get("api_endpoint")
+        google_calendar_api = GoogleCalendarAPI(credentials_file_path, timezone, api_endpoint=api_endpoint)
+        if credentials_source.startswith("env://"):
+            os.remove(credentials_file_path)
+        return google_calendar_api
+
+    def get_and_save_meetings(self, wait: bool = True, incremental: bool = False) -> list:
+        """Get meetings from Google Calendar, save them to a file and return them as schedules.
+
+        When `wait` is False, the file is written in background, see `wait_saved`.
+        When `incremental` is True, only events changed since the previous call are fetched.
+        """
         output_file = self.configs['get_schedules']["outputs"]["schedules"]
 
         # Get HeatZy meetings from Google Calendar API
         self.logger.debug("Fetching meetings from Google Calendar")
-        heatzy_meetings = self.google_calendar_api.get_meetings()
+        with instrumentation.span("calendar_fetch"):
+            if incremental:
+                heatzy_meetings = self._sync_meetings()
+            else:
+                heatzy_meetings = self.google_calendar_api.get_meetings(
+                    calendar_id=self.calendar_id, max_results=self.MAX_MEETINGS
+                )
+        schedules = GoogleCalendarAPI.to_schedules(heatzy_meetings)
 
         # Save meetings to JSON
         self.logger.debug(f"Saving meetings to {output_file}")
-        GoogleCalendarAPI.save_to_json(heatzy_meetings, output_file)
-
-    def run(self):
+        self.wait_saved()
+        # Saved in the context of the run, its phase being recorded with it
+        self._save_thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(self._save_schedules, schedules, output_file),
+            name="save-schedules"
+        )
+        self._save_thread.start()
+        if wait:
+            self.wait_saved()
+        return schedules
+
+    def _sync_meetings(self) -> list:
+        """Update the events kept in memory with the changes since the last sync, and return upcoming ones."""
+        try:
+            changes, sync_token = self.google_calendar_api.sync_meetings(
+                calendar_id=self.calendar_id, sync_token=self.sync_token
+            )
+        except SyncTokenExpired:
+            self.logger.warning("Calendar sync token expired, syncing all events again")
+            self.sync_token = None
+            changes, sync_token = self.google_calendar_api.sync_meetings(calendar_id=self.calendar_id)
+        if self.sync_token is None:
+            self.events = {}
+        self.sync_token = sync_token
+
+        for event in changes:
+            if event.get('status') == 'cancelled':
+                self.events.pop(event['id'], None)
+            else:
+                self.events[event['id']] = event
+        self.logger.debug(f"{len(changes)} calendar events changed, {len(self.events)} known")
+
+        upcoming = self.google_calendar_api.upcoming_meetings(self.events.values())
+        # Ended events are forgotten, an edit moving them to the future comes back as a change
+        self.events = {event['id']: event for event in upcoming}
+        return upcoming[:self.MAX_MEETINGS]
+
+    def _save_schedules(self, schedules: list, output_file: str):
+        try:
+            with instrumentation.span("schedules_save"):
+                self.storage.write_json(output_file, schedules)
+        except Exception as err:
+            self.logger.error(f"Could not save schedules to {output_file}: {err}")
+
+    def wait_saved(self):
+        """Wait for the schedules file written in background, if any."""
+        if self._save_thread is not None:
+            self._save_thread.join()
+            self._save_thread = None
+
+    def run(self, wait: bool = True, incremental: bool = False) -> list:
         """Run the full schedule manager process."""
-        self.get_and_save_meetings()
+        instrumentation.start_run("get_schedules")
+        try:
+            return self.get_and_save_meetings(wait=wait, incremental=incremental)
+        finally:
+            instrumentation.finish_run(self.configs)
 
 
 def main(config_schedule_file_path: str):
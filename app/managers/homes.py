@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Tuple
+
+from libs import instrumentation, rate_limit, transport
+from libs.common import read_yaml_config, get_logger, run_blocking, set_io_max_workers, LOG_MAX_BYTES, \
+    LOG_BACKUP_COUNT
+
+
+class HomesRunner:
+    """Run get_schedules and set_heaters for several homes, each one with its own `main.yaml`.
+
+    Homes are sharded across `workers` processes, each one running up to `concurrency` homes at once from its
+    event loop. HTTP connection pools and EDF Tempo colors are shared by the homes of a worker, calendars and
+    credentials are not. A failing home only fails its own run, and each home writes its own run report with its
+    `metrics` configuration.
+    """
+    DEFAULT_CONCURRENCY = 8
+    # Threads of the I/O executor and connections kept per host, by home run at once
+    IO_WORKERS_BY_HOME = 4
+
+    def __init__(self, config_file_path: str, dry_run: bool = False, configs: dict = None):
+        """Initialize the runner from the homes configuration file"""
+        self.configs = configs if configs is not None else read_yaml_config(config_file_path)
+        self.dry_run = dry_run
+
+        # Initialize the logger
+        self.logger = logging.getLogger(__name__)
+        _set_logging(self.logger, self.configs, "homes")
+
+        # Homes by name, sorted so that shards stay the same from one run to the next
+        self.homes: List[Tuple[str, str]] = sorted(self.configs['homes'].items())
+        self.concurrency = int(self.configs.get('concurrency', self.DEFAULT_CONCURRENCY))
+        workers = int(self.configs.get('workers') or os.cpu_count() or 1)
+        self.workers = max(min(workers, len(self.homes)), 1)
+
+        # Result of each home on last run
+        self.results = []
+
+    def _get_shards(self) -> List[List[Tuple[str, str]]]:
+        return [self.homes[index::self.workers] for index in range(self.workers)]
+
+    def run(self) -> List[dict]:
+        """Run all homes and return a result by home."""
+        self.logger.info(f"Running {len(self.homes)} homes on {self.workers} workers")
+        start = time.perf_counter()
+        instrumentation.start_run("homes")
+        try:
+            self.results = self._run_shards()
+        finally:
+            instrumentation.finish_run(self.configs)
+
+        failed = [result for result in self.results if not result["ok"]]
+        for result in failed:
+            self.logger.error(f"Home {result['home']} failed: {result['error']}")
+        self.logger.info(
+            f"{len(self.results) - len(failed)}/{len(self.results)} homes run in {time.perf_counter() - start:.1f}s"
+        )
+        return self.results
+
+    def _run_shards(self) -> List[dict]:
+        shards = self._get_shards()
+        if self.workers == 1:
+            return run_shard(0, shards[0], self.concurrency, self.dry_run, self.configs, self.workers)
+
+        # Workers are spawned, the parent process already running logging threads
+        results = []
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+            futures = {
+                executor.submit(
+                    run_shard, index, shard, self.concurrency, self.dry_run, self.configs, self.workers
+                ): shard
+                for index, shard in enumerate(shards)
+            }
+            for future in as_completed(futures):
+                try:
+                    results.extend(future.result())
+                except Exception as err:
+                    self.logger.error(f"Worker failed: {err}")
+                    results.extend(
+                        {"home": home, "ok": False, "seconds": None, "error": f"Worker failed: {err}"}
+                        for home, _ in futures[future]
+                    )
+        return sorted(results, key=lambda result: result["home"])
+
+
+def run_shard(shard: int, homes: List[Tuple[str, str]], concurrency: int, dry_run: bool, configs: dict,
+              workers: int = 1) -> List[dict]:
+    """Run the homes of a shard, in a worker process or in the runner process, and return a result by home.
+
+    Vendor rate limits are split between the `workers` running shards at once.
+    """
+    logger = _set_logging(logging.getLogger(f"{__name__}.shard{shard}"), configs, f"homes-{shard}")
+
+    io_workers = max(concurrency, 1) * HomesRunner.IO_WORKERS_BY_HOME
+    try:
+        set_io_max_workers(io_workers)
+    except RuntimeError:
+        logger.warning("I/O executor already started, its workers are not resized")
+    transport.set_pool_size(io_workers)
+    rate_limit.set_share(1 / workers)
+    # Sessions are shared by homes, each one authenticating through its own headers
+    transport.disable_cookies()
+
+    instrumentation.start_run(f"homes-{shard}")
+    try:
+        return asyncio.run(_run_homes(logger, homes, concurrency, dry_run))
+    finally:
+        instrumentation.finish_run(configs)
+        transport.close_sessions()
+
+
+async def _run_homes(logger: logging.Logger, homes: List[Tuple[str, str]], concurrency: int, dry_run: bool) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_home(home: str, config_file_path: str) -> dict:
+        async with semaphore:
+            return await _run_home(logger, home, config_file_path, dry_run)
+
+    return list(await asyncio.gather(*[run_home(home, config_file_path) for home, config_file_path in homes]))
+
+
+async def _run_home(logger: logging.Logger, home: str, config_file_path: str, dry_run: bool) -> dict:
+    """Run get_schedules and set_heaters for a home, any failure being reported in its result."""
+    from managers.pipeline import PipelineRunner
+
+    logger.info(f"Running home {home} from {config_file_path}")
+    start = time.perf_counter()
+    error = None
+    configs = None
+    # Each home records its own run, in the context of its task
+    instrumentation.start_run("all", home=home)
+    try:
+        configs = await run_blocking(read_yaml_config, config_file_path)
+        # Loggers are set by home
+        configs.setdefault('home', home)
+        runner = await run_blocking(PipelineRunner, config_file_path, dry_run=dry_run, configs=configs)
+        try:
+            await runner.run_async()
+        finally:
+            runner.heater_manager.close()
+    except (Exception, SystemExit) as err:
+        # `SystemExit` is raised by managers missing an input file
+        error = repr(err)
+        logger.error(f"Home {home} failed: {error}")
+        logger.debug(traceback.format_exc())
+    finally:
+        # Written with the configuration of the home, nothing being written if it could not be read
+        await run_blocking(instrumentation.finish_run, configs or {})
+    seconds = time.perf_counter() - start
+    logger.info(f"Home {home} run in {seconds:.1f}s")
+    return {"home": home, "ok": error is None, "seconds": seconds, "error": error}
+
+
+def _set_logging(logger: logging.Logger, configs: dict, name: str) -> logging.Logger:
+    """Set up logging based on the homes configuration."""
+    logs_configs = configs["logs"]
+    return get_logger(
+        logger, log_file_path=f'{logs_configs["directory"]}/{name}.log', level=logs_configs["level"].upper(),
+        max_bytes=logs_configs.get("max_bytes", LOG_MAX_BYTES),
+        backup_count=logs_configs.get("backup_count", LOG_BACKUP_COUNT)
+    )
+
+
+def main(config_file_path: str, dry_run: bool = False):
+    """Entry point for the HomesRunner"""
+    runner = HomesRunner(config_file_path, dry_run=dry_run)
+    runner.run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='Get schedules and set heaters mode of several homes')
+    parser.add_argument("--configs", required=False, default="configs/homes.yaml", help="Homes config file")
+    parser.add_argument("--dry-run", default=False, action='store_true', help="Run as dry run")
+    args = parser.parse_args()
+
+    main(args.configs, dry_run=args.dry_run)
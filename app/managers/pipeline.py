@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import time
+import traceback
+
+from libs import instrumentation
+from libs.common import read_yaml_config, run_blocking
+from managers.get_schedules import ScheduleManager
+from managers.set_heaters import HeaterManager
+
+
+class PipelineRunner:
+    """Run get_schedules and set_heaters, provider sessions being opened while the calendar is fetched."""
+
+    def __init__(self, config_file_path: str, dry_run: bool = False, configs: dict = None):
+        self.config_file_path = config_file_path
+        self.configs = configs if configs is not None else read_yaml_config(config_file_path)
+
+        self.heater_manager = HeaterManager(config_file_path, configs=self.configs)
+        self.heater_manager.dry_run = dry_run
+        self.logger = self.heater_manager.logger
+
+        self.schedule_manager = None
+
+    def _fetch_schedules(self):
+        """Fetch schedules from Google Calendar, or return None to fall back on the schedules file."""
+        try:
+            self.schedule_manager = ScheduleManager(self.config_file_path, configs=self.configs)
+            return self.schedule_manager.run(wait=False)
+        except Exception as err:
+            self.logger.error(f"Could not fetch schedules, using schedules file: {err}")
+            self.logger.error(traceback.format_exc())
+
+    async def run_async(self):
+        """Fetch schedules while providers log in and EDF Tempo is looked up, then apply them."""
+        # The run deadline of set_heaters counts from here
+        started = time.monotonic()
+        schedules, _ = await asyncio.gather(
+            run_blocking(self._fetch_schedules),
+            self.heater_manager.prepare_async(),
+        )
+        await self.heater_manager.run_async(schedules, started=started)
+
+        if self.schedule_manager is not None:
+            await run_blocking(self.schedule_manager.wait_saved)
+
+    def run(self):
+        instrumentation.start_run("all")
+        try:
+            asyncio.run(self.run_async())
+        finally:
+            instrumentation.finish_run(self.configs)
+
+
+def main(config_file_path: str, dry_run: bool = False):
+    """Entry point for the PipelineRunner"""
+    runner = PipelineRunner(config_file_path, dry_run=dry_run)
+    runner.run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='Get schedules and set heaters mode')
+    parser.add_argument("--configs", required=False, default="configs/main.yaml", help="General config file")
+    parser.add_argument("--dry-run", default=False, action='store_true', help="Run as dry run")
+    args = parser.parse_args()
+
+    main(args.configs, dry_run=args.dry_run)
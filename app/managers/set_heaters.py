@@ -1,35 +1,67 @@
 import argparse
+import asyncio
+import copy
 import datetime
-import json
 import logging
 import os
+import time
 import traceback
 from collections import defaultdict
 from datetime import datetime
 import pytz
 
-from libs.common import read_yaml_config, get_logger
-from controllers.heatzy import HeatzyManager
-from controllers.stove import StoveManager
+from libs import instrumentation, rate_limit
+from libs.common import read_yaml_config, get_logger, get_home_logger_name, run_blocking, LOG_MAX_BYTES, \
+    LOG_BACKUP_COUNT
+from libs.status_store import StatusStore
+from libs.storage import StorageConflict, get_storage
+
+
+class RunDeadlineExceeded(Exception):
+    pass
+
 
 class HeaterManager:
-    def __init__(self, config_heater_file_path: str):
-        """Initialize HeaterManager with configuration files"""
+    # Key of the last full reconcile time in the status file
+    RECONCILE_STATUS_KEY = "_last_reconcile"
+    # Key of the desired mode of each device and the time it was first scheduled, `{device: [mode, epoch]}`
+    DESIRED_STATUS_KEY = "_desired_since"
+    # Seconds kept before `run_deadline` to save the status
+    STATUS_SAVE_MARGIN = 15
+    # Seconds of `STATUS_SAVE_MARGIN` given to provider writes in progress at the deadline
+    WRITES_GRACE = 10
+
+    def __init__(self, config_heater_file_path: str, configs: dict = None):
+        """Initialize HeaterManager with configuration files, or with configurations already parsed"""
         self.config_heater_file_path = config_heater_file_path
 
         # Read the configuration files
-        self.configs = self._load_configs()
+        self.configs = configs if configs is not None else self._load_configs()
 
         # Initialize the logger
-        self.logger = logging.getLogger(__name__)
+        self.logger = logging.getLogger(get_home_logger_name(__name__, self.configs))
         self._set_logging()
 
+        # Modes, schedules and status files
+        self.storage = get_storage(self.configs.get('storage'))
+
         # Load mode configurations
         self.modes = self._load_modes()
 
         # Run in dry run, do not apply changes
         self.dry_run = False
 
+        # Keep provider sessions open between runs (daemon mode)
+        self.keep_alive = False
+        self._hz_manager = None
+        self._stove_manager = None
+
+        # Local status database, when configured
+        self.status_store = self._open_status_store()
+
+        # Devices telemetry, when configured
+        self.telemetry = self._open_telemetry()
+
     def _load_configs(self) -> dict:
         """Load configurations from YAML files."""
         configs_heater = read_yaml_config(self.config_heater_file_path)
@@ -37,49 +69,123 @@ class HeaterManager:
 
     def _set_logging(self):
         """Set up logging based on the configuration."""
-        log_file_path = f'{self.configs["logs"]["directory"]}/set_heaters.log'
-        log_level = self.configs["logs"]["level"].upper()
+        logs_configs = self.configs["logs"]
+        log_file_path = f'{logs_configs["directory"]}/set_heaters.log'
+        log_level = logs_configs["level"].upper()
 
-        return get_logger(self.logger, log_file_path=log_file_path, level=log_level)
+        return get_logger(
+            self.logger, log_file_path=log_file_path, level=log_level,
+            max_bytes=logs_configs.get("max_bytes", LOG_MAX_BYTES),
+            backup_count=logs_configs.get("backup_count", LOG_BACKUP_COUNT)
+        )
 
     def _load_modes(self) -> dict:
         """Load heating modes from the configuration."""
         self.logger.debug("Reading modes configuration")
         set_heaters_configs = self.configs['set_heaters']
         modes_file_path = set_heaters_configs["inputs"]["modes"]
-        return read_yaml_config(modes_file_path)
+        return self.storage.read_yaml(modes_file_path)
 
     def _get_schedules(self) -> dict:
         """Get schedules from the configuration file."""
         set_heaters_configs = self.configs['set_heaters']
         schedule_file_path = set_heaters_configs["inputs"]["schedules"]
 
-        if os.path.exists(schedule_file_path):
+        try:
             self.logger.debug(f"Reading schedule file from {schedule_file_path}")
-            return read_yaml_config(schedule_file_path)
-        else:
+            return self.storage.read_json(schedule_file_path)
+        except FileNotFoundError:
             self.logger.error(f"Schedule file {schedule_file_path} not found. Run get_schedules.py first.")
             exit(1)
 
+    def _open_status_store(self):
+        """Open the status database configured in `set_heaters.status_store`, if any."""
+        status_store_configs = self.configs['set_heaters'].get('status_store')
+        if not status_store_configs:
+            return None
+        self.logger.debug(f"Using status database {status_store_configs['path']}")
+        return StatusStore(status_store_configs['path'])
+
+    def _open_telemetry(self):
+        """Open the telemetry recorder configured in `set_heaters.telemetry`, if any."""
+        telemetry_configs = self.configs['set_heaters'].get('telemetry')
+        if not telemetry_configs:
+            return None
+        # numpy is only loaded when telemetry is enabled
+        from libs.telemetry import TelemetryRecorder, DEFAULT_CAPACITY
+        self.logger.debug(f"Recording telemetry to {telemetry_configs['directory']}")
+        return TelemetryRecorder(telemetry_configs['directory'], telemetry_configs.get('capacity', DEFAULT_CAPACITY))
+
     def _get_last_status(self) -> dict:
-        """Get last status from file, or return an empty dictionary if not found."""
+        """Get last status from the status database or file, or return an empty dictionary if not found."""
         set_heaters_configs = self.configs['set_heaters']
         last_status_file_path = set_heaters_configs["inputs"]["status"]
 
-        if os.path.exists(last_status_file_path):
+        if self.status_store is not None:
+            # Statuses of the status file are imported on first run
+            if self.status_store.is_empty() and self.storage.exists(last_status_file_path):
+                self.logger.info(f"Importing last status from {last_status_file_path}")
+                self.status_store.save(self.storage.read_json(last_status_file_path))
+            self.logger.debug(f"Reading last status from {self.status_store.path}")
+            return self.status_store.load()
+
+        try:
             self.logger.debug(f"Reading last status from {last_status_file_path}")
-            return read_yaml_config(last_status_file_path)
-        else:
+            return self.storage.read_json(last_status_file_path)
+        except FileNotFoundError:
             self.logger.info(f"Last status file {last_status_file_path} not found, initializing empty status.")
             return {}
 
+    def _save_status(self, status: dict, merged_schedule: dict, last_status: dict = None):
+        """Save devices status to the status database or file.
+
+        The status database only records what changed since `last_status`, the status the run started from.
+        """
+        set_heaters_configs = self.configs['set_heaters']
+        last_status_file_path = set_heaters_configs["inputs"]["status"]
+
+        if self.status_store is not None:
+            self.logger.debug(f"Write {self.status_store.path} status")
+            self.status_store.save(status, desired=merged_schedule['to_set']['devices'], previous=last_status)
+            if set_heaters_configs['status_store'].get('export_json', True):
+                # The database is the reference, the export replaces whatever was written before
+                self.storage.write_json(last_status_file_path, self.status_store.load())
+            return
+
+        self.logger.debug(f"Write {last_status_file_path} status")
+        try:
+            self.storage.write_json(last_status_file_path, status, if_unchanged=True)
+        except StorageConflict as err:
+            self.logger.warning(f"{err}, merging the changes of this run into the new status")
+            try:
+                self.storage.write_json(last_status_file_path,
+                                        merge_status(self.storage.read_json(last_status_file_path),
+                                                     status, last_status or {}), if_unchanged=True)
+            except (StorageConflict, FileNotFoundError) as err:
+                self.logger.error(f"Status not saved, changes of this run are lost: {err}")
+
     def _merge_schedules(self, schedules: list) -> dict:
         """Merge applicable schedules by priority."""
         self.logger.debug("Merging schedules based on priority")
         return merge_definitions(schedules)
 
-    def run(self):
-        """Run the heater manager process to set modes."""
+    def run(self, schedules: list = None):
+        """Run the heater manager process to set modes.
+
+        Schedules fetched in the same process can be given, otherwise they are read from the schedules file.
+        """
+        instrumentation.start_run("set_heaters")
+        try:
+            asyncio.run(self.run_async(schedules))
+        finally:
+            instrumentation.finish_run(self.configs)
+
+    async def run_async(self, schedules: list = None, started: float = None):
+        """Run the heater manager process to set modes, providers being driven from the event loop.
+
+        `started` is the `time.monotonic()` the run deadline counts from, when the run began earlier.
+        """
+        started = time.monotonic() if started is None else started
         set_heaters_configs = self.configs['set_heaters']
         max_delay_reapplied = set_heaters_configs['max_delay_reapplied']
         self.logger.info(f"Max delay reapplied: {max_delay_reapplied}")
@@ -89,7 +195,9 @@ class HeaterManager:
 
         # Get the default mode and applicable schedules
         default_mode = self.modes['default']
-        schedules = self._get_schedules()
+        if schedules is None:
+            with instrumentation.span("schedules_load"):
+                schedules = self._get_schedules()
         applicable_schedules = [self.modes[schedule['title']] for schedule in schedules if is_current_time_between(schedule, timezone)]
         applicable_schedules.append(default_mode)
 
@@ -97,53 +205,376 @@ class HeaterManager:
         merged_schedule = self._merge_schedules(applicable_schedules)
 
         # Get last device statuses
-        last_status = self._get_last_status()
-
-        # Apply settings for Heatzy devices
-        status_devices_heatzy = {}
-        if "heatzy" in set_heaters_configs["providers"]:
-            hz_manager = HeatzyManager(self.configs, max_delay_reapplied, logger=self.logger)
-            hz_manager.dry_run = self.dry_run
-            if "edf_tempo" in set_heaters_configs["providers"]:
-                if set_heaters_configs["providers"]["edf_tempo"]['enabled']:
-                    self.logger.info("EDF tempo activated, applying for Heatzy Devices...")
-                    hz_manager.use_tempo = True
-
-            status_devices_heatzy = hz_manager.run_hz_devices(
-                merged_schedule, last_status
-            )
-
-        # Apply settings for Stove devices
-        status_devices_stove = {}
-        if "stove" in set_heaters_configs["providers"]:
-            if set_heaters_configs["providers"]["stove"]['enabled']:
-                try:
-                    stove_manager = StoveManager(
-                        self.configs['set_heaters']["providers"]["stove"],
-                        max_delay_reapplied, logger=self.logger
-                    )
-                    stove_manager.dry_run = self.dry_run
-                    status_devices_stove = stove_manager.run_stove_devices(
-                        merged_schedule, last_status
-                    )
-                except Exception as err:
-                    self.logger.error(f"Could not start NOBIS services: {err}")
-                    self.logger.error(f"Make sure than your device is connected properly.")
-                    self.logger.error(traceback.format_exc())
-        else:
+        with instrumentation.span("status_load"):
+            last_status = self._get_last_status()
+
+        # Providers are not contacted when devices are already known in their scheduled mode
+        reconcile_time = int(time.time())
+        if self._is_up_to_date(merged_schedule, last_status, reconcile_time):
+            self.logger.info("Devices already in their scheduled mode, providers not contacted")
+            return
+
+        # Most urgent changes are applied first, in case the run deadline is reached
+        desired_since = self._get_desired_since(merged_schedule, last_status, reconcile_time)
+        red_time = await run_blocking(self._is_tempo_red_time, reconcile_time)
+        merged_schedule = self._order_by_urgency(merged_schedule, desired_since, red_time)
+        save_by = self._get_save_by(started)
+
+        # Apply settings for each provider concurrently, from the same schedule and status snapshot
+        run_providers = {"heatzy": self._run_heatzy, "stove": self._run_stove}
+        providers = {provider: run_providers[provider] for provider in self._get_providers()}
+        if "stove" not in providers:
             self.logger.info("Stove devices not enabled.")
 
+        results = await asyncio.gather(*[
+            self._timed(provider, self._bounded(provider, run_provider(
+                copy.deepcopy(merged_schedule), copy.deepcopy(last_status),
+                deadline=self._get_provider_deadline(provider, started, save_by)
+            ), save_by))
+            for provider, run_provider in providers.items()
+        ], return_exceptions=True)
+
+        status_devices = {}
+        reconciled = True
+        for provider, result in zip(providers, results):
+            if isinstance(result, RunDeadlineExceeded):
+                self.logger.error(f"Could not run {provider} devices before the run deadline, changes deferred")
+                result = self._carry_over_status(provider, merged_schedule, last_status)
+                result[self.get_deferred_status_key(provider)] = self._get_pending_changes(
+                    provider, merged_schedule, last_status
+                )
+                reconciled = False
+            elif isinstance(result, Exception):
+                self.logger.error(f"Could not run {provider} devices: {result}")
+                self.logger.error("".join(traceback.format_exception(result)))
+                result = self._carry_over_status(provider, merged_schedule, last_status)
+                reconciled = False
+            status_devices[provider] = result
+
         # Save last status
-        last_status_file_path = set_heaters_configs["inputs"]["status"]
-        self.logger.debug(f"Write {last_status_file_path} status")
-        data = {**status_devices_heatzy, **status_devices_stove}
+        data = {}
+        # A full reconcile is only recorded once all providers have been read
+        if reconciled:
+            data[self.RECONCILE_STATUS_KEY] = reconcile_time
+        elif self.RECONCILE_STATUS_KEY in last_status:
+            data[self.RECONCILE_STATUS_KEY] = last_status[self.RECONCILE_STATUS_KEY]
+        data[self.DESIRED_STATUS_KEY] = desired_since
+        for provider_status in status_devices.values():
+            data.update(provider_status)
         if not self.dry_run:
-            json_content = json.dumps(data, indent=2)
-            with open(last_status_file_path, 'w') as file:
-                file.write(json_content)
+            with instrumentation.span("status_save"):
+                self._save_status(data, merged_schedule, last_status)
+            if self.telemetry is not None:
+                self.telemetry.flush()
         else:
             self.logger.info("Dry run activated, status file not updated")
-        self.logger.debug(json.dumps(data))
+        # Formatted by the logging call, only when debug is enabled
+        self.logger.debug("Status: %s", data)
+
+    async def prepare_async(self):
+        """Open provider sessions and look up EDF Tempo ahead of `run_async`.
+
+        Failures are only logged, sessions being opened again by `run_async`.
+        Nothing is prepared until a full reconcile is due, steady runs not contacting providers.
+        """
+        if not self._is_reconcile_due(self._get_last_status(), int(time.time())):
+            self.logger.debug("Full reconcile not due, provider sessions not prepared")
+            return
+
+        prepare_providers = {"heatzy": self._prepare_heatzy, "stove": self._prepare_stove}
+        tasks = {provider: prepare_providers[provider]() for provider in self._get_providers()}
+
+        results = await asyncio.gather(*[
+            self._timed(f"{provider}.prepare", task) for provider, task in tasks.items()
+        ], return_exceptions=True)
+        for provider, result in zip(tasks, results):
+            if isinstance(result, Exception):
+                self.logger.warning(f"Could not prepare {provider} session: {result}")
+
+    @staticmethod
+    async def _timed(phase: str, coroutine):
+        """Await a coroutine, timed as a phase of the run."""
+        with instrumentation.span(phase):
+            return await coroutine
+
+    async def _bounded(self, provider: str, coroutine, save_by: float = None):
+        """Await a provider coroutine, given up after `save_by` so the status can still be saved in time.
+
+        Providers start no change after `save_by`, writes in progress then are waited for `WRITES_GRACE` seconds
+        so that the status records them. Past that, blocking calls are not interrupted and their result is dropped.
+        """
+        if save_by is None:
+            return await coroutine
+        task = asyncio.ensure_future(coroutine)
+        done, _ = await asyncio.wait({task}, timeout=max(save_by - time.monotonic(), 0))
+        if not done:
+            self.logger.warning(f"{provider} still running at the run deadline, waiting for writes in progress")
+            done, _ = await asyncio.wait({task}, timeout=self.WRITES_GRACE)
+        if not done:
+            task.cancel()
+            raise RunDeadlineExceeded(f"{provider} still running at the run deadline")
+        return task.result()
+
+    @staticmethod
+    def get_deferred_status_key(provider: str) -> str:
+        """Key of the changes of a provider deferred to next run, `{device: mode}`."""
+        return f"_{provider}_deferred"
+
+    def _get_save_by(self, started: float):
+        """Get the `time.monotonic()` providers must be done by, None without `run_deadline`."""
+        run_deadline = self.configs['set_heaters'].get('run_deadline')
+        if not run_deadline:
+            return None
+        return started + run_deadline - self.STATUS_SAVE_MARGIN
+
+    def _get_provider_deadline(self, provider: str, started: float, save_by: float = None):
+        """Get the `time.monotonic()` after which a provider starts no more changes.
+
+        The earliest of the provider `time_budget` and the run deadline, None if neither is set.
+        """
+        time_budget = self.configs['set_heaters']["providers"][provider].get('time_budget')
+        deadlines = [deadline for deadline in (save_by, started + time_budget if time_budget else None) if deadline]
+        return min(deadlines) if deadlines else None
+
+    def _get_desired_since(self, merged_schedule: dict, last_status: dict, current_time: int) -> dict:
+        """Get the desired mode of each device and the time it was first scheduled, `{device: [mode, epoch]}`."""
+        previous = last_status.get(self.DESIRED_STATUS_KEY) or {}
+        desired_since = {}
+        for device, device_params in merged_schedule['to_set']['devices'].items():
+            mode, since = previous.get(device) or (None, None)
+            desired_since[device] = [device_params['mode'], since if mode == device_params['mode'] else current_time]
+        return desired_since
+
+    @staticmethod
+    def _order_by_urgency(merged_schedule: dict, desired_since: dict, red_time: bool = False) -> dict:
+        """Order devices by urgency: EDF Tempo red time shutdowns, then the most recent desired mode changes."""
+        def urgency(item):
+            device, device_params = item
+            red_shutdown = red_time and device_params['type'] == "heatzy" and device_params['mode'] != "OFF"
+            return not red_shutdown, -desired_since[device][1]
+
+        devices = merged_schedule['to_set']['devices']
+        merged_schedule['to_set']['devices'] = defaultdict(dict, sorted(devices.items(), key=urgency))
+        return merged_schedule
+
+    @staticmethod
+    def _get_pending_changes(provider: str, merged_schedule: dict, last_status: dict) -> dict:
+        """Get the devices of a provider not recorded in their scheduled mode, `{device: mode}`."""
+        return {
+            device: device_params['mode']
+            for device, device_params in merged_schedule['to_set']['devices'].items()
+            if device_params['type'] == provider and last_status.get(device) != device_params['mode']
+        }
+
+    def _get_providers(self) -> list:
+        """Get the enabled providers."""
+        providers_configs = self.configs['set_heaters']["providers"]
+        providers = []
+        if "heatzy" in providers_configs:
+            providers.append("heatzy")
+        if "stove" in providers_configs and providers_configs["stove"]['enabled']:
+            providers.append("stove")
+        return providers
+
+    def _is_up_to_date(self, merged_schedule: dict, last_status: dict, current_time: int) -> bool:
+        """Check if devices are known in their scheduled mode since a recent full reconcile.
+
+        A full reconcile is forced every `full_reconcile_interval` seconds, to catch manual changes.
+        """
+        if self._is_reconcile_due(last_status, current_time):
+            return False
+
+        last_reconcile = last_status[self.RECONCILE_STATUS_KEY]
+        providers = self._get_providers()
+        for device, device_params in merged_schedule['to_set']['devices'].items():
+            if device_params['type'] not in providers:
+                continue
+            if last_status.get(device) != device_params['mode']:
+                self.logger.debug(
+                    f"Device {device} recorded as {last_status.get(device)}, scheduled to {device_params['mode']}"
+                )
+                return False
+
+        # Provider records such as `_stove_jobs` are work in progress
+        for provider in providers:
+            if any(value for key, value in last_status.items() if key.startswith(f"_{provider}_")):
+                self.logger.debug(f"Pending {provider} records to confirm")
+                return False
+
+        if self._tempo_may_have_changed(last_reconcile, current_time):
+            self.logger.debug("EDF Tempo red time may have changed since last full reconcile")
+            return False
+        return True
+
+    def _is_reconcile_due(self, last_status: dict, current_time: int) -> bool:
+        """Check if the last full reconcile is older than `full_reconcile_interval` seconds."""
+        full_reconcile_interval = int(self.configs['set_heaters'].get('full_reconcile_interval', 0))
+        last_reconcile = last_status.get(self.RECONCILE_STATUS_KEY)
+        if not full_reconcile_interval or last_reconcile is None:
+            return True
+        if current_time - last_reconcile >= full_reconcile_interval:
+            self.logger.info(f"Last full reconcile {current_time - last_reconcile}s ago, reconciling")
+            return True
+        return False
+
+    def _tempo_may_have_changed(self, last_reconcile: int, current_time: int) -> bool:
+        """Check if EDF Tempo red time may have changed between two times, without calling the API.
+
+        The color of the day only changes with the date, red hours come from the configuration.
+        """
+        edf_tempo_api = self._get_edf_tempo_api()
+        if edf_tempo_api is None:
+            return False
+
+        tz = pytz.timezone(edf_tempo_api.timezone)
+        last_time = datetime.fromtimestamp(last_reconcile, tz)
+        now = datetime.fromtimestamp(current_time, tz)
+        return (
+            last_time.date() != now.date()
+            or edf_tempo_api.in_red_hours(last_time) != edf_tempo_api.in_red_hours(now)
+        )
+
+    def _is_tempo_red_time(self, current_time: int) -> bool:
+        """Check if EDF Tempo red time applies, red hours of the configuration on a red day.
+
+        The color of the day is only looked up during red hours, from the value prefetched by the Heatzy session
+        if any. EDF Tempo responses are cached, the Heatzy run reusing this one.
+        """
+        edf_tempo_api = self._get_edf_tempo_api()
+        if edf_tempo_api is None:
+            return False
+        if not edf_tempo_api.in_red_hours(datetime.fromtimestamp(current_time, pytz.timezone(edf_tempo_api.timezone))):
+            return False
+        if self._hz_manager is not None and self._hz_manager.red_time is not None:
+            return self._hz_manager.red_time
+        with instrumentation.span("edf_tempo.check"):
+            return edf_tempo_api.red_time().is_red
+
+    def _get_edf_tempo_api(self):
+        """Get the EDF Tempo API when it applies to Heatzy devices, None otherwise."""
+        providers_configs = self.configs['set_heaters']["providers"]
+        if "heatzy" not in self._get_providers() or not providers_configs.get("edf_tempo", {}).get('enabled'):
+            return None
+
+        from controllers.heatzy import HeatzyManager
+        from libs.provider_edf_tempo import EDFTempoAPI
+        return EDFTempoAPI(tz=HeatzyManager.DEFAULT_TIMEZONE, tempo_config=providers_configs["edf_tempo"])
+
+    async def _prepare_heatzy(self):
+        from controllers.heatzy import HeatzyManager
+        set_heaters_configs = self.configs['set_heaters']
+        if self._hz_manager is None:
+            self._hz_manager = await run_blocking(
+                HeatzyManager, self.configs, set_heaters_configs['max_delay_reapplied'], logger=self.logger
+            )
+        await self._hz_manager.async_prefetch_tempo()
+
+    async def _prepare_stove(self):
+        from controllers.stove import StoveManager
+        set_heaters_configs = self.configs['set_heaters']
+        if self._stove_manager is None:
+            self._stove_manager = await run_blocking(
+                StoveManager, set_heaters_configs["providers"]["stove"],
+                set_heaters_configs['max_delay_reapplied'], logger=self.logger
+            )
+
+    async def _run_heatzy(self, merged_schedule: dict, last_status: dict, deadline: float = None) -> dict:
+        """Apply the schedule on Heatzy devices and return their status, deferred changes included.
+
+        No change is started after `deadline`, a `time.monotonic()` time.
+        """
+        from controllers.heatzy import HeatzyManager
+        set_heaters_configs = self.configs['set_heaters']
+        hz_manager = self._hz_manager
+        if hz_manager is None:
+            hz_manager = await run_blocking(
+                HeatzyManager, self.configs, set_heaters_configs['max_delay_reapplied'], logger=self.logger
+            )
+        hz_manager.dry_run = self.dry_run
+        hz_manager.deadline = deadline
+        # Requests of this task and its blocking calls wait for rate limits up to the deadline only
+        rate_limit.deadline.set(deadline)
+        # Decisions of a dry run are not applied, they are not recorded
+        hz_manager.telemetry = None if self.dry_run else self.telemetry
+        if "edf_tempo" in set_heaters_configs["providers"]:
+            if set_heaters_configs["providers"]["edf_tempo"]['enabled']:
+                self.logger.info("EDF tempo activated, applying for Heatzy Devices...")
+                hz_manager.use_tempo = True
+
+        # A failing session is dropped, so next run logs in again
+        self._hz_manager = None
+        status_devices = dict(await hz_manager.async_run_hz_devices(merged_schedule, last_status))
+        if self.keep_alive:
+            self._hz_manager = hz_manager
+        if hz_manager.deferred:
+            status_devices[self.get_deferred_status_key("heatzy")] = hz_manager.deferred
+        return status_devices
+
+    async def _run_stove(self, merged_schedule: dict, last_status: dict, deadline: float = None) -> dict:
+        """Apply the schedule on Stove devices and return their status, pending writing jobs included."""
+        return await run_blocking(self._run_stove_sync, merged_schedule, last_status, deadline)
+
+    def _run_stove_sync(self, merged_schedule: dict, last_status: dict, deadline: float = None) -> dict:
+        """Apply the schedule on Stove devices and return their status, pending writing jobs and deferred changes
+        included.
+
+        No change is started after `deadline`, a `time.monotonic()` time.
+        """
+        from controllers.stove import StoveManager
+        set_heaters_configs = self.configs['set_heaters']
+        stove_manager = self._stove_manager
+        if stove_manager is None:
+            try:
+                stove_manager = StoveManager(
+                    set_heaters_configs["providers"]["stove"],
+                    set_heaters_configs['max_delay_reapplied'], logger=self.logger
+                )
+            except Exception:
+                self.logger.error("Could not start NOBIS services, make sure than your device is connected properly.")
+                raise
+        stove_manager.dry_run = self.dry_run
+        stove_manager.deadline = deadline
+        rate_limit.deadline.set(deadline)
+        stove_manager.telemetry = None if self.dry_run else self.telemetry
+
+        # A failing session is dropped, so next run connects again
+        self._stove_manager = None
+        status_devices = dict(stove_manager.run_stove_devices(
+            merged_schedule, last_status, disconnect=not self.keep_alive
+        ))
+        if self.keep_alive:
+            self._stove_manager = stove_manager
+        if stove_manager.pending_jobs:
+            status_devices[StoveManager.JOBS_STATUS_KEY] = stove_manager.pending_jobs
+        if stove_manager.deferred:
+            status_devices[self.get_deferred_status_key("stove")] = stove_manager.deferred
+        return status_devices
+
+    def close(self):
+        """Close provider sessions kept open between runs."""
+        if self._stove_manager is not None:
+            self._stove_manager.stove.disconnect()
+        self._hz_manager = None
+        self._stove_manager = None
+        if self.status_store is not None:
+            self.status_store.close()
+            self.status_store = None
+        if self.telemetry is not None:
+            self.telemetry.close()
+            self.telemetry = None
+
+    def _carry_over_status(self, provider: str, merged_schedule: dict, last_status: dict) -> dict:
+        """Keep the last known status of the devices of a provider that failed."""
+        status_devices = {
+            device: last_status[device]
+            for device, device_params in merged_schedule['to_set']['devices'].items()
+            if device_params['type'] == provider and device in last_status
+        }
+        # Provider records such as `_stove_jobs`
+        status_devices.update(
+            (key, value) for key, value in last_status.items() if key.startswith(f"_{provider}_")
+        )
+        return status_devices
 
 
 def merge_definitions(definitions: list) -> dict:
@@ -159,6 +590,19 @@ def merge_definitions(definitions: list) -> dict:
     return result
 
 
+def merge_status(current: dict, status: dict, last_status: dict) -> dict:
+    """Apply to `current` the keys `status` changed since `last_status`, keeping the other changes of `current`."""
+    result = dict(current)
+    for key in status.keys() | last_status.keys():
+        if status.get(key) == last_status.get(key):
+            continue
+        if key in status:
+            result[key] = status[key]
+        else:
+            result.pop(key, None)
+    return result
+
+
 def is_current_time_between(schedule: dict, timezone: str) -> bool:
     """Check if the current time falls between the start and end times of a schedule."""
     start_time = schedule['start_time']
@@ -0,0 +1,173 @@
+"""End-to-end benchmark of `main.py --mode all` against the local vendor stand-ins.
+
+For each device count, a configuration pointing every provider at `mock_servers` is generated and
+`main.py` is run twice: a first run writing every device, then a steady run with devices already set.
+
+    python benchmarks/e2e.py                               # 1, 10, 100 and 1000 devices
+    python benchmarks/e2e.py --devices 1 50 --latency 0.05 --output results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from mock_servers import MockServers, calendar_event
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT_DIR, "app")
+
+
+def _google_credentials(token_uri: str) -> dict:
+    """Service account with a throwaway key, tokens being asked to the stand-in."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    return {
+        "type": "service_account", "project_id": "bench", "private_key_id": "bench",
+        "private_key": private_key, "client_email": "bench@bench.iam.gserviceaccount.com",
+        "client_id": "0", "token_uri": token_uri,
+    }
+
+
+def write_configs(directory: str, servers: MockServers, heatzy_devices: int, stove_devices: int) -> str:
+    """Write main.yaml, modes.yaml and credentials for the stand-ins, and return the main.yaml path."""
+    urls = servers.urls
+
+    def path(name):
+        return os.path.join(directory, name)
+
+    with open(path("heatzy.json"), "w") as file:
+        json.dump({"username": "bench", "password": "bench"}, file)
+    with open(path("stove.json"), "w") as file:
+        json.dump({"email": "bench", "password": "bench", "uuid": "bench"}, file)
+    with open(path("google.json"), "w") as file:
+        json.dump(_google_credentials(urls["google_token"]), file)
+
+    heatzy = {f"heater{i}": "heatzy" for i in range(heatzy_devices)}
+    stoves = {f"stove{i}": "stove" for i in range(stove_devices)}
+    # Devices start in ECO (heatzy) and OFF (stoves), the calendar event switches them all to COMFORT,
+    # lower priorities being applied last
+    modes = {
+        "default": {"priority": 10, "devices": {
+            **{device: {"type": kind, "mode": "ECO", "sequences": []} for device, kind in heatzy.items()},
+            **{device: {"type": kind, "mode": "OFF", "sequences": []} for device, kind in stoves.items()},
+        }},
+        "bench": {"priority": 1, "devices": {
+            device: {"type": kind, "mode": "COMFORT", "sequences": []}
+            for device, kind in {**heatzy, **stoves}.items()
+        }},
+    }
+    with open(path("modes.yaml"), "w") as file:
+        yaml.safe_dump(modes, file)
+
+    configs = {
+        "timezone": "Europe/Paris",
+        "logs": {"level": "warning", "directory": path("logs")},
+        "metrics": {"report_directory": path("reports")},
+        "get_schedules": {
+            "providers": {"google": {"credentials": f"file://{path('google.json')}", "api_endpoint": urls["google"]}},
+            "outputs": {"schedules": path("schedules.json")},
+        },
+        "set_heaters": {
+            "max_delay_reapplied": 10800,
+            "full_reconcile_interval": 0,
+            "providers": {
+                "heatzy": {"credentials": f"file://{path('heatzy.json')}", "enabled": True,
+                           "api_url": urls["heatzy"]},
+                "edf_tempo": {"enabled": True, "api_url": urls["edf_tempo"], "red_hour_margin": 5,
+                              "off_red_hour": True, "schedules": [{"red_hour_start": 6, "red_hour_stop": 23}]},
+                "stove": {"enabled": stove_devices > 0, "credentials": f"file://{path('stove.json')}",
+                          "api_url": urls["stove"], "async_writes": False,
+                          "temperatures": {"COMFORT_PLUS": 23, "COMFORT": 21, "COMFORT_ECO": 19, "LOW_MODE": 16}},
+            },
+            "inputs": {"status": path("last-status.json"), "schedules": path("schedules.json"),
+                       "modes": path("modes.yaml")},
+        },
+    }
+    with open(path("main.yaml"), "w") as file:
+        yaml.safe_dump(configs, file)
+    return path("main.yaml")
+
+
+def run_main(config_file_path: str) -> dict:
+    """Run `main.py --mode all` and return its wall time and run report."""
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "main.py", "--configs", config_file_path, "--mode", "all"],
+        cwd=APP_DIR, capture_output=True, text=True,
+    )
+    wall_time = time.perf_counter() - start
+    report_path = os.path.join(os.path.dirname(config_file_path), "reports", "run-report-all.json")
+    report = None
+    if os.path.exists(report_path):
+        with open(report_path) as json_file:
+            report = json.load(json_file)
+    return {"wall_time": wall_time, "returncode": process.returncode, "report": report,
+            "stderr": process.stderr[-2000:] if process.returncode else ""}
+
+
+def benchmark(devices: int, stove_ratio: float, latency: float, error_rate: float, rate_limit: float = 0.0) -> list:
+    stove_devices = max(1, round(devices * stove_ratio)) if stove_ratio else 0
+    heatzy_devices = max(devices - stove_devices, 1)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    events = [calendar_event("bench", now - datetime.timedelta(hours=1), now + datetime.timedelta(hours=1))]
+
+    results = []
+    with MockServers(heatzy_devices, stove_devices, latency, error_rate, events=events,
+                     rate_limit=rate_limit) as servers, \
+            tempfile.TemporaryDirectory(prefix="heaters-bench-") as directory:
+        config_file_path = write_configs(directory, servers, heatzy_devices, stove_devices)
+        for run in ("first", "steady"):
+            servers.reset_stats()
+            result = run_main(config_file_path)
+            stats = servers.stats()
+            results.append({
+                "devices": devices, "heatzy_devices": heatzy_devices, "stove_devices": stove_devices,
+                "run": run, "wall_time": result["wall_time"], "returncode": result["returncode"],
+                "requests": {vendor: vendor_stats["requests"] for vendor, vendor_stats in stats.items()},
+                "bytes_sent": sum(vendor_stats["bytes_sent"] for vendor_stats in stats.values()),
+                "phases": (result["report"] or {}).get("phases", {}),
+            })
+            if result["returncode"]:
+                print(result["stderr"], file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="End-to-end benchmark")
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 10, 100, 1000], help="Device counts")
+    parser.add_argument("--stove-ratio", type=float, default=0.1, help="Share of the devices being stoves")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each stand-in answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 503")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Requests per second accepted by each vendor")
+    parser.add_argument("--output", default=None, help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'devices':>8} {'run':<7} {'wall (s)':>9} {'heatzy':>7} {'agua':>6} {'tempo':>6} {'google':>7}")
+    for devices in args.devices:
+        for result in benchmark(devices, args.stove_ratio, args.latency, args.error_rate, args.rate_limit):
+            requests = result["requests"]
+            print(f"{result['devices']:>8} {result['run']:<7} {result['wall_time']:>9.2f} "
+                  f"{requests['heatzy']:>7} {requests['agua_iot']:>6} {requests['edf_tempo']:>6} "
+                  f"{requests['google']:>7}" + ("" if result["returncode"] == 0 else "  FAILED"))
+            results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+    return 1 if any(result["returncode"] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Measure the import time of each main.py mode, to catch startup regressions.
+
+Each mode is imported in a fresh interpreter, best of several runs is kept.
+
+    python benchmarks/import_time.py            # compare with the stored baseline
+    python benchmarks/import_time.py --update   # store a new baseline
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT_DIR, "app")
+BASELINE_FILE = os.path.join(ROOT_DIR, "benchmarks", "baselines", "import_time.json")
+
+# Modules imported by main.py for each mode, `startup` being main.py itself, paid by every mode
+MODE_IMPORTS = {
+    "startup": "main",
+    "get_schedules": "managers.get_schedules",
+    "set_heaters": "managers.set_heaters",
+    "all": "managers.pipeline",
+    "daemon": "managers.daemon",
+}
+
+# Modules a mode should not pay for until it needs them
+HEAVY_MODULES = ("googleapiclient", "pydantic", "jwt", "numpy")
+
+SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import libs.common
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeat: int) -> dict:
+    """Import a module in fresh interpreters and keep the best time."""
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", SNIPPET.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=APP_DIR, check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return min(results, key=lambda result: result["seconds"])
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="Import time by mode")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs by mode, best one is kept")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed ratio over the baseline")
+    parser.add_argument("--update", default=False, action='store_true', help="Store results as the new baseline")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as json_file:
+            baseline = json.load(json_file)
+
+    results = {}
+    regressions = []
+    for mode, module in MODE_IMPORTS.items():
+        result = measure(module, args.repeat)
+        results[mode] = result
+        reference = baseline.get(mode)
+        line = f"{mode:<14} {result['seconds'] * 1000:8.1f} ms  loaded: {', '.join(result['loaded']) or '-'}"
+        if reference:
+            ratio = result["seconds"] / reference["seconds"]
+            line += f"  ({ratio:.2f}x baseline)"
+            if ratio > args.tolerance:
+                regressions.append(f"{mode} import time is {ratio:.2f}x the baseline")
+            new_modules = set(result["loaded"]) - set(reference["loaded"])
+            if new_modules:
+                regressions.append(f"{mode} now imports {', '.join(sorted(new_modules))}")
+        print(line)
+
+    if args.update:
+        with open(BASELINE_FILE, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+        print(f"Baseline saved to {BASELINE_FILE}")
+        return 0
+
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
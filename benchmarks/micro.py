@@ -0,0 +1,203 @@
+"""Micro-benchmarks of the pure-Python hot paths, on synthetic inputs.
+
+Inputs are generated from a fixed seed and scale with `--scale` (1 gives 10k events, 500 modes and full
+registers maps). Each case keeps the best of several repeats, compared with the stored baseline.
+
+    python benchmarks/micro.py                     # compare with benchmarks/baselines/micro.json
+    python benchmarks/micro.py --case merge        # only cases whose name contains `merge`
+    python benchmarks/micro.py --update            # store a new baseline
+"""
+import argparse
+import copy
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+from types import SimpleNamespace
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT_DIR, "app")
+BASELINE_FILE = os.path.join(ROOT_DIR, "benchmarks", "baselines", "micro.json")
+sys.path.insert(0, APP_DIR)
+
+from controllers.heatzy import HeatzyManager  # noqa: E402
+from controllers.stove import StoveManager  # noqa: E402
+from libs.google_calendar import GoogleCalendarAPI  # noqa: E402
+from libs.py_agua_iot import Device, RegisterBuffer, RegisterTable, formula_parser  # noqa: E402
+from managers.set_heaters import is_current_time_between, merge_definitions  # noqa: E402
+
+TIMEZONE = "Europe/Paris"
+MODES = ["COMFORT", "ECO", "OFF", "HGEL"]
+FORMULAS = ["#", "#/10", "#x2", "#*5", "#-100", "#/10+5", "#x3-7", "#/2-1"]
+REGISTERS_MAP_SIZE = 600
+
+_SILENT_LOGGER = logging.getLogger("benchmarks.micro")
+_SILENT_LOGGER.disabled = True
+
+
+def make_modes(count: int, devices: int, rng: random.Random) -> list:
+    """Mode definitions, each setting a random subset of the devices."""
+    return [
+        {"priority": rng.randint(1, 20), "devices": {
+            f"device{device}": {"type": rng.choice(["heatzy", "stove"]), "mode": rng.choice(MODES), "sequences": []}
+            for device in rng.sample(range(devices), k=min(devices, rng.randint(1, 20)))
+        }}
+        for _ in range(count)
+    ]
+
+
+def make_events(count: int, rng: random.Random) -> list:
+    """Calendar events spread over a month around now, naive or with an offset."""
+    now = datetime.datetime.now().replace(microsecond=0)
+    events = []
+    for index in range(count):
+        start = now + datetime.timedelta(minutes=rng.randint(-20000, 20000))
+        end = start + datetime.timedelta(minutes=rng.randint(30, 600))
+        if index % 2:
+            start_time, end_time = f"{start.isoformat()}+01:00", f"{end.isoformat()}+01:00"
+        else:
+            start_time, end_time = start.isoformat(), end.isoformat()
+        events.append({
+            "summary": f"mode{index % 500}",
+            "start": {"dateTime": start_time}, "end": {"dateTime": end_time},
+        })
+    return events
+
+
+def make_registers(count: int, rng: random.Random) -> list:
+    return [
+        {"reg_key": f"register_{index}_get", "reg_type": "DATA", "offset": index,
+         "formula": rng.choice(FORMULAS), "formula_inverse": "#", "format_string": "{0:.0f}",
+         "set_min": 0, "set_max": 65535, "mask": 65535, "enc_val": []}
+        for index in range(count)
+    ]
+
+
+def make_device(registers: list, rng: random.Random) -> Device:
+    """Agua IoT device with its registers map and buffer loaded, without any connection."""
+    connection = SimpleNamespace(register_tables={"map": RegisterTable(registers)})
+    device = Device(1, "dev", "product", "serial", "stove", True, "NOBIS", "map", connection)
+    offsets = [register["offset"] for register in registers]
+    device._Device__buffer = RegisterBuffer(offsets, [rng.randint(0, 1000) for _ in offsets])
+    return device
+
+
+def make_statuses(count: int, rng: random.Random):
+    """Current modes and last statuses covering every branch: unchanged, changed, recently and long changed."""
+    now = int(time.time())
+    current, last = {}, {}
+    for index in range(count):
+        device = f"device{index}"
+        current[device] = rng.choice(MODES)
+        kind = index % 4
+        if kind == 0:
+            last[device] = current[device]
+        elif kind == 1:
+            last[device] = rng.choice([mode for mode in MODES if mode != current[device]])
+        elif kind == 2:
+            last[device] = f"changed_{now - 60}"
+        else:
+            last[device] = f"changed_{now - 100000}"
+    return current, last
+
+
+def build_cases(scale: float) -> dict:
+    """Benchmark cases by name, as (callable, calls per repeat)."""
+    rng = random.Random(0)
+    events = max(1, int(10000 * scale))
+    modes = max(1, int(500 * scale))
+    registers_map_size = max(1, int(REGISTERS_MAP_SIZE * min(scale, 1)))
+
+    definitions = make_modes(modes, 200, rng)
+    meetings = make_events(events, rng)
+    schedules = GoogleCalendarAPI.to_schedules(meetings)
+    formulas = [rng.choice(FORMULAS).replace("#", str(rng.randint(0, 5000))) for _ in range(events)]
+    device = make_device(make_registers(registers_map_size, rng), rng)
+    register_keys = device._register_table.keys
+    current, last = make_statuses(events, rng)
+
+    heatzy_manager = object.__new__(HeatzyManager)
+    heatzy_manager.logger, heatzy_manager.max_delay_reapplied = _SILENT_LOGGER, 10800
+    stove_manager = object.__new__(StoveManager)
+    stove_manager.logger, stove_manager.max_delay_reapplied = _SILENT_LOGGER, 10800
+
+    output_directory = tempfile.mkdtemp(prefix="heaters-micro-")
+    output_file = os.path.join(output_directory, "schedules.json")
+
+    def heatzy_should_skip():
+        last_status = dict(last)
+        for device_name, current_mode in current.items():
+            heatzy_manager._should_skip_due_to_status_change(device_name, current_mode, last_status)
+
+    def stove_should_skip():
+        last_status = dict(last)
+        for device_name in current:
+            stove_manager._should_skip_due_to_status_change(device_name, current, last_status)
+
+    return {
+        f"merge_definitions[{modes} modes]": (lambda: merge_definitions(copy.copy(definitions)), 50),
+        f"is_current_time_between[{events} events]": (
+            lambda: [is_current_time_between(schedule, TIMEZONE) for schedule in schedules], 1),
+        f"formula_parser.parser[{events} formulas]": (
+            lambda: [formula_parser.parser(formula) for formula in formulas], 1),
+        f"Device.get_item_value[{registers_map_size} registers]": (
+            lambda: [device.get_item_value(key) for key in register_keys], 20),
+        f"Device.full_data_map[{registers_map_size} registers]": (lambda: device.full_data_map, 20),
+        f"GoogleCalendarAPI.save_to_json[{events} events]": (
+            lambda: GoogleCalendarAPI.save_to_json(meetings, output_file), 1),
+        f"HeatzyManager._should_skip_due_to_status_change[{events} devices]": (heatzy_should_skip, 5),
+        f"StoveManager._should_skip_due_to_status_change[{events} devices]": (stove_should_skip, 5),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="Micro-benchmarks")
+    parser.add_argument("--scale", type=float, default=1.0, help="Inputs size factor")
+    parser.add_argument("--repeat", type=int, default=7, help="Repeats by case, best one is kept")
+    parser.add_argument("--case", default=None, help="Only run cases whose name contains this text")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed ratio over the baseline")
+    parser.add_argument("--update", default=False, action='store_true', help="Store results as the new baseline")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE) and args.scale == 1.0:
+        with open(BASELINE_FILE) as json_file:
+            baseline = json.load(json_file)
+
+    results = {}
+    regressions = []
+    for name, (function, number) in build_cases(args.scale).items():
+        if args.case and args.case not in name:
+            continue
+        seconds = min(timeit.repeat(function, number=number, repeat=args.repeat)) / number
+        results[name] = seconds
+        line = f"{name:<70} {seconds * 1000:10.3f} ms"
+        if name in baseline:
+            ratio = seconds / baseline[name]
+            line += f"  ({ratio:.2f}x baseline)"
+            if ratio > args.tolerance:
+                regressions.append(f"{name} is {ratio:.2f}x the baseline")
+        print(line)
+
+    if args.update:
+        if args.scale != 1.0:
+            print("Baselines are only stored for --scale 1")
+            return 1
+        baseline.update(results)
+        with open(BASELINE_FILE, "w") as json_file:
+            json.dump(baseline, json_file, indent=2)
+        print(f"Baseline saved to {BASELINE_FILE}")
+        return 0
+
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
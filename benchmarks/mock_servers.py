@@ -0,0 +1,448 @@
+"""Local stand-ins of the vendor APIs, for load tests and benchmarks.
+
+Emulated endpoints:
+    heatzy      Gizwits API: login, bindings, devices, devdata, control
+    agua_iot    Agua IoT API: appSignup, userLogin, refreshToken, deviceList, deviceGetInfo,
+                deviceGetRegistersMap, deviceGetBufferReading, deviceJobStatus, deviceRequestWriting
+    edf_tempo   api-couleur-tempo.fr: jourTempo
+    google      OAuth token endpoint and Calendar events.list (sync tokens), events.watch and channels.stop,
+                `GoogleState.set_events` notifying the open channels like Google does
+
+Each vendor is served on its own port, with a configurable latency, error rate, rate limit and device count.
+
+    python benchmarks/mock_servers.py --heatzy-devices 100 --stove-devices 10 --latency 0.05
+"""
+import argparse
+import base64
+import datetime
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# Gizwits modes by binary value, see `HeaterBinaryModes`
+HEATZY_MODES = {0: "cft", 1: "eco", 2: "fro", 3: "stop", 4: "cft", 5: "cft"}
+
+# Registers of the Agua IoT registers map, offsets in the device buffer
+AGUA_STATUS_OFFSET = 0
+AGUA_TEMP_AIR_GET_OFFSET = 1
+AGUA_TEMP_AIR_SET_OFFSET = 2
+AGUA_STATUS_MANAGED_OFFSET = 3
+AGUA_TEMP_GAS_OFFSET = 4
+AGUA_REAL_POWER_OFFSET = 5
+AGUA_STATUS_ON = 4
+
+
+def _register(reg_key, offset, formula="#", formula_inverse="#", set_min=0, set_max=65535, enc_val=None):
+    return {
+        "reg_key": reg_key, "reg_type": "DATA", "offset": offset, "formula": formula,
+        "formula_inverse": formula_inverse, "format_string": "{0:.0f}", "set_min": set_min,
+        "set_max": set_max, "mask": 65535, "enc_val": enc_val or [],
+    }
+
+
+def _unsigned_jwt(lifetime: int) -> str:
+    """Token the Agua IoT client can decode without signature."""
+    def encode(content):
+        return base64.urlsafe_b64encode(json.dumps(content).encode()).rstrip(b"=").decode()
+    return f'{encode({"alg": "none", "typ": "JWT"})}.{encode({"exp": int(time.time()) + lifetime})}.'
+
+
+class VendorState:
+    """Behaviour and request counters of a vendor stand-in."""
+
+    def __init__(self, vendor: str, latency: float = 0.0, error_rate: float = 0.0, rate_limit: float = 0.0):
+        self.vendor = vendor
+        self.latency = latency
+        self.error_rate = error_rate
+        # Requests accepted per second, others being answered with a 429
+        self.rate_limit = rate_limit
+        self._accepted = deque()
+        self.requests = Counter()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    def count(self, route: str, received: int, sent: int):
+        with self.lock:
+            self.requests[route] += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": sum(self.requests.values()),
+                "routes": dict(self.requests),
+                "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent,
+            }
+
+    def reset(self):
+        with self.lock:
+            self.requests.clear()
+            self.bytes_received = self.bytes_sent = 0
+
+    def throttled(self) -> bool:
+        """Check if a request goes over `rate_limit`, counting it otherwise."""
+        if not self.rate_limit:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            while self._accepted and now - self._accepted[0] >= 1:
+                self._accepted.popleft()
+            if len(self._accepted) >= self.rate_limit:
+                return True
+            self._accepted.append(now)
+            return False
+
+    def handle(self, method: str, path: str, body: dict):
+        """Return (route, status, content) for a request, or None if the route is unknown."""
+        raise NotImplementedError
+
+
+class HeatzyState(VendorState):
+    def __init__(self, devices: int, initial_mode: int = 1, **kwargs):
+        super().__init__("heatzy", **kwargs)
+        self.modes = {f"did{i}": initial_mode for i in range(devices)}
+
+    def handle(self, method, path, body):
+        if method == "POST" and path == "/app/login":
+            return "login", 200, {"token": "heatzy-token", "uid": "user", "expire_at": int(time.time()) + 86400}
+        if method == "GET" and path == "/app/bindings":
+            return "bindings", 200, {"devices": [
+                {"did": did, "dev_alias": f"heater{did[3:]}", "product_name": "Pilote"} for did in self.modes
+            ]}
+        match = re.fullmatch(r"/app/devices/(\w+)", path)
+        if method == "GET" and match and match.group(1) in self.modes:
+            return "devices", 200, {"did": match.group(1), "is_online": True}
+        match = re.fullmatch(r"/app/devdata/(\w+)/latest", path)
+        if method == "GET" and match and match.group(1) in self.modes:
+            return "devdata", 200, {"did": match.group(1), "attr": {"mode": HEATZY_MODES[self.modes[match.group(1)]]}}
+        match = re.fullmatch(r"/app/control/(\w+)", path)
+        if method == "POST" and match and match.group(1) in self.modes:
+            with self.lock:
+                self.modes[match.group(1)] = body["attrs"]["mode"]
+            return "control", 200, {}
+        return None
+
+
+class AguaIotState(VendorState):
+    def __init__(self, devices: int, extra_registers: int = 200, **kwargs):
+        super().__init__("agua_iot", **kwargs)
+        self.buffers = {f"dev{i}": {AGUA_STATUS_OFFSET: 0, AGUA_TEMP_AIR_GET_OFFSET: 195,
+                                    AGUA_TEMP_AIR_SET_OFFSET: 19, AGUA_STATUS_MANAGED_OFFSET: 0,
+                                    AGUA_TEMP_GAS_OFFSET: 35, AGUA_REAL_POWER_OFFSET: 0}
+                        for i in range(devices)}
+        # Real registers maps hold a few hundred registers
+        self.registers = [
+            _register("status_get", AGUA_STATUS_OFFSET),
+            _register("temp_air_get", AGUA_TEMP_AIR_GET_OFFSET, formula="#/10"),
+            _register("temp_air_set", AGUA_TEMP_AIR_SET_OFFSET, set_min=5, set_max=30),
+            _register("status_managed_get", AGUA_STATUS_MANAGED_OFFSET, set_max=1, enc_val=[
+                {"lang": "ENG", "description": "ON", "value": 1},
+                {"lang": "ENG", "description": "OFF", "value": 0},
+            ]),
+            _register("temp_gas_flue_get", AGUA_TEMP_GAS_OFFSET),
+            _register("real_power_get", AGUA_REAL_POWER_OFFSET),
+        ] + [_register(f"extra_{i}_get", 100 + i) for i in range(extra_registers)]
+        self.jobs = {}
+        self.job_ids = itertools.count()
+
+    def _new_job(self, answer: dict) -> str:
+        id_request = f"job-{next(self.job_ids)}"
+        with self.lock:
+            self.jobs[id_request] = answer
+        return id_request
+
+    def handle(self, method, path, body):
+        if path == "/appSignup":
+            return "appSignup", 201, {}
+        if path == "/userLogin":
+            return "userLogin", 200, {"token": _unsigned_jwt(3600), "refresh_token": "agua-refresh"}
+        if path == "/refreshToken":
+            return "refreshToken", 201, {"token": _unsigned_jwt(3600)}
+        if path == "/deviceList":
+            return "deviceList", 200, {"device": [
+                {"id": i, "id_device": id_device, "id_product": "nobis", "product_serial": f"SN{i}",
+                 "name": f"stove{id_device[3:]}", "is_online": True, "name_product": "NOBIS"}
+                for i, id_device in enumerate(self.buffers)
+            ]}
+        if path == "/deviceGetInfo":
+            return "deviceGetInfo", 200, {"device_info": [{"id_registers_map": "map-nobis"}]}
+        if path == "/deviceGetRegistersMap":
+            return "deviceGetRegistersMap", 200, {"device_registers_map": {"registers_map": [
+                {"id": "map-nobis", "registers": self.registers}
+            ]}}
+        if path == "/deviceGetBufferReading" and body.get("id_device") in self.buffers:
+            buffer = self.buffers[body["id_device"]]
+            id_request = self._new_job({"jobAnswerStatus": "completed", "jobAnswerData": {
+                "Items": list(buffer), "Values": list(buffer.values()),
+            }})
+            return "deviceGetBufferReading", 200, {"idRequest": id_request}
+        if path == "/deviceRequestWriting" and body.get("id_device") in self.buffers:
+            buffer = self.buffers[body["id_device"]]
+            with self.lock:
+                for offset, value in zip(body["Items"], body["Values"]):
+                    buffer[offset] = value
+                    if offset == AGUA_STATUS_MANAGED_OFFSET:
+                        buffer[AGUA_STATUS_OFFSET] = AGUA_STATUS_ON if value else 0
+                        buffer[AGUA_REAL_POWER_OFFSET] = 3 if value else 0
+                        buffer[AGUA_TEMP_GAS_OFFSET] = 140 if value else 35
+            id_request = self._new_job({"jobAnswerStatus": "completed", "jobAnswerData": {"Cmd": "W"}})
+            return "deviceRequestWriting", 200, {"idRequest": id_request}
+        match = re.fullmatch(r"/deviceJobStatus/([\w-]+)", path)
+        if match and match.group(1) in self.jobs:
+            return "deviceJobStatus", 200, self.jobs[match.group(1)]
+        return None
+
+
+class EDFTempoState(VendorState):
+    def __init__(self, color: int = 1, **kwargs):
+        super().__init__("edf_tempo", **kwargs)
+        self.color = color
+
+    def handle(self, method, path, body):
+        match = re.fullmatch(r"/api/jourTempo/([\d-]+)", path)
+        if method == "GET" and match:
+            return "jourTempo", 200, {"dateJour": match.group(1), "codeJour": self.color, "periode": ""}
+        return None
+
+
+class GoogleState(VendorState):
+    def __init__(self, events: list = None, **kwargs):
+        super().__init__("google", **kwargs)
+        self.events = events or []
+        # Changed events by version, sync tokens being the version they were given at
+        self.version = 0
+        self.changes = []
+        # Open notification channels by id
+        self.channels = {}
+        self.notifications = Counter()
+
+    def set_events(self, events: list):
+        """Replace the calendar events, recording the changes and notifying the open channels."""
+        with self.lock:
+            self.version += 1
+            new_ids = {event["id"] for event in events}
+            previous = {event["id"]: event for event in self.events}
+            for event in events:
+                if previous.get(event["id"]) != event:
+                    self.changes.append((self.version, event))
+            for event_id in previous.keys() - new_ids:
+                self.changes.append((self.version, {"kind": "calendar#event", "id": event_id, "status": "cancelled"}))
+            self.events = list(events)
+            channels = list(self.channels.values())
+        for channel in channels:
+            self.notify(channel, "exists")
+
+    def notify(self, channel: dict, state: str):
+        """Send a notification to a channel address from a background thread, as Google does."""
+        with self.lock:
+            channel["messages"] += 1
+            headers = {
+                "X-Goog-Channel-ID": channel["id"], "X-Goog-Channel-Token": channel.get("token", ""),
+                "X-Goog-Resource-ID": channel["resourceId"], "X-Goog-Resource-State": state,
+                "X-Goog-Message-Number": str(channel["messages"]),
+            }
+
+        def send():
+            request = urllib.request.Request(channel["address"], data=b"", headers=headers, method="POST")
+            try:
+                with urllib.request.urlopen(request, timeout=5) as response:
+                    result = str(response.status)
+            except Exception as err:
+                result = type(err).__name__
+            with self.lock:
+                self.notifications[f"{state}:{result}"] += 1
+
+        threading.Thread(target=send, name="mock-notifier", daemon=True).start()
+
+    def handle(self, method, path, body):
+        if method == "POST" and path == "/token":
+            return "token", 200, {"access_token": "google-token", "expires_in": 3600, "token_type": "Bearer"}
+        if method == "GET" and re.fullmatch(r"(/calendar/v3)?/calendars/[^/]+/events", path):
+            with self.lock:
+                if "syncToken" in body:
+                    since = int(body["syncToken"])
+                    items = [event for version, event in self.changes if version > since]
+                    route = "events.list.incremental"
+                else:
+                    items, route = self.events, "events.list"
+                return route, 200, {"kind": "calendar#events", "items": items, "nextSyncToken": str(self.version)}
+        if method == "POST" and re.fullmatch(r"(/calendar/v3)?/calendars/[^/]+/events/watch", path):
+            ttl = int(body.get("params", {}).get("ttl", 604800))
+            channel = {
+                "kind": "api#channel", "id": body["id"], "resourceId": f"resource-{body['id']}",
+                "resourceUri": path, "expiration": str(int((time.time() + ttl) * 1000)),
+                "address": body["address"], "token": body.get("token"), "messages": 0,
+            }
+            with self.lock:
+                self.channels[channel["id"]] = channel
+            self.notify(channel, "sync")
+            return "events.watch", 200, {
+                key: channel[key] for key in ("kind", "id", "resourceId", "resourceUri", "expiration")
+            }
+        if method == "POST" and re.fullmatch(r"(/calendar/v3)?/channels/stop", path):
+            with self.lock:
+                self.channels.pop(body.get("id"), None)
+            return "channels.stop", 200, {}
+        return None
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self.lock:
+            stats["channels"] = len(self.channels)
+            stats["notifications"] = dict(self.notifications)
+        return stats
+
+
+def calendar_event(summary: str, start: datetime.datetime, end: datetime.datetime) -> dict:
+    return {
+        "kind": "calendar#event", "id": f"{summary}-{int(start.timestamp())}", "summary": summary,
+        "start": {"dateTime": start.isoformat()}, "end": {"dateTime": end.isoformat()},
+    }
+
+
+def _make_handler(state: VendorState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw_body = self.rfile.read(length) if length else b""
+            if state.latency:
+                time.sleep(state.latency)
+
+            url = urlsplit(self.path)
+            path = url.path
+            try:
+                body = json.loads(raw_body) if raw_body else {}
+            except ValueError:
+                # Form encoded OAuth requests
+                body = {}
+            if self.command == "GET":
+                # Query parameters are handed over as the body
+                body = dict(parse_qsl(url.query))
+
+            headers = {}
+            if state.error_rate and random.random() < state.error_rate:
+                route, status, content = "error", 503, {"error": "injected failure"}
+            elif state.throttled():
+                route, status, content = "throttled", 429, {"error": "too many requests"}
+                headers["Retry-After"] = "1"
+            else:
+                result = state.handle(self.command, path, body)
+                route, status, content = result if result else ("not_found", 404, {"error": path})
+
+            data = json.dumps(content).encode()
+            state.count(route, len(raw_body), len(data))
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = _handle
+
+    return Handler
+
+
+class MockServers:
+    """Vendor stand-ins served from background threads, on ephemeral ports of localhost."""
+
+    def __init__(self, heatzy_devices: int = 1, stove_devices: int = 1, latency: float = 0.0,
+                 error_rate: float = 0.0, tempo_color: int = 1, events: list = None, rate_limit: float = 0.0):
+        options = {"latency": latency, "error_rate": error_rate, "rate_limit": rate_limit}
+        self.states = {
+            "heatzy": HeatzyState(heatzy_devices, **options),
+            "agua_iot": AguaIotState(stove_devices, **options),
+            "edf_tempo": EDFTempoState(tempo_color, **options),
+            "google": GoogleState(events, **options),
+        }
+        self.servers = {}
+        self.threads = []
+
+    def start(self):
+        for vendor, state in self.states.items():
+            server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(state))
+            server.daemon_threads = True
+            thread = threading.Thread(target=server.serve_forever, name=f"mock-{vendor}", daemon=True)
+            thread.start()
+            self.servers[vendor] = server
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def url(self, vendor: str) -> str:
+        host, port = self.servers[vendor].server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def urls(self) -> dict:
+        """API URLs to set in main.yaml, see configs/main.example.yaml."""
+        return {
+            "heatzy": f"{self.url('heatzy')}/app",
+            "stove": self.url("agua_iot"),
+            "edf_tempo": f"{self.url('edf_tempo')}/api/jourTempo",
+            "google": f"{self.url('google')}/calendar/v3/",
+            "google_token": f"{self.url('google')}/token",
+        }
+
+    def stats(self) -> dict:
+        return {vendor: state.stats() for vendor, state in self.states.items()}
+
+    def reset_stats(self):
+        for state in self.states.values():
+            state.reset()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="Vendor APIs stand-ins")
+    parser.add_argument("--heatzy-devices", type=int, default=1, help="Heatzy devices bound to the account")
+    parser.add_argument("--stove-devices", type=int, default=1, help="Agua IoT stoves of the account")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 503")
+    parser.add_argument("--tempo-color", type=int, default=1, help="EDF Tempo color, 1 blue, 2 white, 3 red")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Requests per second accepted by each vendor")
+    args = parser.parse_args()
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    servers = MockServers(
+        args.heatzy_devices, args.stove_devices, args.latency, args.error_rate, args.tempo_color,
+        events=[calendar_event("bench", now - datetime.timedelta(hours=1), now + datetime.timedelta(hours=1))],
+        rate_limit=args.rate_limit,
+    ).start()
+    for name, url in servers.urls.items():
+        print(f"{name:<12} {url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps({vendor: stats["requests"] for vendor, stats in servers.stats().items()}))
+    except KeyboardInterrupt:
+        servers.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Calendar edit to heater latency of `main.py --mode daemon`, with calendar push notifications.
+
+The daemon is run against the local vendor stand-ins with `daemon.watch` set and hour long intervals, so that
+only notifications can apply an edit in time. The calendar event is removed then added back, and the time until
+every Heatzy stand-in device is in its new mode is measured. A short channel TTL checks renewals too.
+
+    python benchmarks/watch.py
+    python benchmarks/watch.py --devices 50 --edits 5 --latency 0.05
+"""
+import argparse
+import datetime
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from e2e import APP_DIR, write_configs
+from mock_servers import MockServers, calendar_event
+
+# Heatzy binary modes of the stand-in, see `HeaterBinaryModes`
+COMFORT, ECO = 0, 1
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout: float) -> float:
+    """Wait until `condition()` is true, and return the seconds waited, or None on timeout."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if condition():
+            return time.perf_counter() - start
+        time.sleep(0.01)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="Calendar notifications latency benchmark")
+    parser.add_argument("--devices", type=int, default=10, help="Heatzy devices")
+    parser.add_argument("--edits", type=int, default=3, help="Calendar edits, each one switching every device")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each stand-in answer")
+    parser.add_argument("--ttl", type=int, default=8, help="Notification channels TTL, in seconds")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for an edit to be applied")
+    args = parser.parse_args()
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    event = calendar_event("bench", now - datetime.timedelta(hours=1), now + datetime.timedelta(hours=1))
+    port = _free_port()
+    with MockServers(args.devices, 0, args.latency, events=[event]) as servers, \
+            tempfile.TemporaryDirectory(prefix="heaters-watch-") as directory:
+        config_file_path = write_configs(directory, servers, args.devices, 0)
+        with open(config_file_path) as file:
+            configs = yaml.safe_load(file)
+        configs["daemon"] = {
+            "schedules_interval": 3600, "heaters_interval": 3600,
+            "watch": {"address": f"http://127.0.0.1:{port}/notifications", "host": "127.0.0.1", "port": port,
+                      "token": "bench", "ttl": args.ttl, "renew_margin": args.ttl // 2, "delay": 0.2},
+        }
+        with open(config_file_path, "w") as file:
+            yaml.safe_dump(configs, file)
+
+        heatzy, google = servers.states["heatzy"], servers.states["google"]
+
+        def all_in(mode):
+            return lambda: all(value == mode for value in heatzy.modes.values())
+
+        process = subprocess.Popen(
+            [sys.executable, "main.py", "--configs", config_file_path, "--mode", "daemon"],
+            cwd=APP_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        latencies = []
+        try:
+            if wait_for(all_in(COMFORT), args.timeout) is None:
+                print("Daemon did not set the devices on start", file=sys.stderr)
+                return 1
+            for edit in range(args.edits):
+                # The event is removed (default mode, ECO) then added back (COMFORT)
+                events, mode = ([], ECO) if edit % 2 == 0 else ([event], COMFORT)
+                google.set_events(events)
+                latency = wait_for(all_in(mode), args.timeout)
+                latencies.append(latency)
+                print(f"edit {edit + 1}: " + (f"{latency:.2f}s" if latency is not None else "TIMEOUT"))
+            # Channels are renewed at half their TTL
+            time.sleep(args.ttl)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                _, stderr = process.communicate(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                _, stderr = process.communicate()
+
+        stats = google.stats()
+        print(f"calendar requests: {stats['routes']}")
+        print(f"notifications: {stats['notifications']}, channels left open: {stats['channels']}")
+        if process.returncode:
+            print(stderr[-2000:], file=sys.stderr)
+        applied = [latency for latency in latencies if latency is not None]
+        if applied:
+            print(f"edit to heaters latency: max {max(applied):.2f}s, mean {sum(applied) / len(applied):.2f}s")
+        return 0 if len(applied) == len(latencies) and stats["channels"] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules are imported from `app`, as when running `main.py`
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
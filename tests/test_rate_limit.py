@@ -0,0 +1,154 @@
+import email.utils
+import http.server
+import threading
+import time
+
+import pytest
+
+from libs import rate_limit
+
+
+@pytest.fixture(autouse=True)
+def buckets(monkeypatch):
+    # Buckets and share are process-wide, each test starting from none
+    monkeypatch.setattr(rate_limit, "_buckets", {})
+    monkeypatch.setattr(rate_limit, "_share", 1.0)
+
+
+def test_parse_retry_after():
+    assert rate_limit.parse_retry_after(None) is None
+    assert rate_limit.parse_retry_after("") is None
+    assert rate_limit.parse_retry_after("2.5") == 2.5
+    assert rate_limit.parse_retry_after("-3") == 0.0
+    assert rate_limit.parse_retry_after("not a date") is None
+
+
+def test_parse_retry_after_http_date():
+    retry_time = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= rate_limit.parse_retry_after(retry_time) <= 30
+    # Dates already passed are not waited for
+    assert rate_limit.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_acquire_burst_then_waits():
+    bucket = rate_limit.TokenBucket("test", rate=100, burst=5)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05 and bucket.get_state()["waits"] == 0
+
+    bucket.acquire()
+    state = bucket.get_state()
+    assert state["requests"] == 6 and state["waits"] == 1 and state["wait_seconds"] > 0
+
+
+def test_acquire_timeout_does_not_wait():
+    bucket = rate_limit.TokenBucket("test", rate=0.5, burst=1)
+    bucket.acquire()
+    start = time.monotonic()
+    with pytest.raises(rate_limit.RateLimitTimeout):
+        bucket.acquire(timeout=1)
+    assert time.monotonic() - start < 0.1
+
+
+def test_acquire_stops_at_context_deadline():
+    bucket = rate_limit.TokenBucket("test", rate=0.5, burst=1)
+    bucket.acquire()
+    token = rate_limit.deadline.set(time.monotonic() + 0.5)
+    try:
+        with pytest.raises(rate_limit.RateLimitTimeout):
+            bucket.acquire()
+    finally:
+        rate_limit.deadline.reset(token)
+
+
+def test_throttled_lowers_rate_once():
+    bucket = rate_limit.TokenBucket("test", rate=10, burst=10)
+    assert bucket.on_response(200) is None
+
+    assert bucket.on_response(429, 0.2) == 0.2
+    # Answered while the first throttled one is still waited for, the rate is not lowered again
+    assert bucket.on_response(429) == rate_limit.DEFAULT_RETRY_AFTER
+    assert bucket.rate == 10 * rate_limit.DECREASE_FACTOR
+    assert bucket.get_state()["throttled"] == 2
+
+    # Raised back step by step on accepted requests
+    bucket.on_response(200)
+    assert bucket.rate == 10 * rate_limit.DECREASE_FACTOR + rate_limit.INCREASE_STEP
+
+
+def test_throttled_blocks_until_retry_after():
+    bucket = rate_limit.TokenBucket("test", rate=1000, burst=10)
+    bucket.on_response(429, 0.3)
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.29
+
+    bucket.on_response(429, 5)
+    with pytest.raises(rate_limit.RateLimitTimeout):
+        bucket.acquire(timeout=1)
+
+
+def test_share_splits_new_buckets():
+    rate, burst = rate_limit.VENDOR_RATE_LIMITS["heatzy"]
+    rate_limit.set_share(1 / 4)
+    bucket = rate_limit.get_bucket("heatzy", "example.com")
+
+    assert (bucket.rate, bucket.burst) == (rate / 4, burst // 4)
+    assert rate_limit.get_bucket("heatzy", "example.com") is bucket
+    assert list(rate_limit.get_states()) == ["heatzy:example.com"]
+
+
+class ThrottlingHandler(http.server.BaseHTTPRequestHandler):
+    """Answers 429 to the first `throttled` requests, then 200."""
+    throttled = 1
+    retry_after = "0.2"
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(time.monotonic())
+        if len(self.requests) <= self.throttled:
+            self.send_response(429)
+            self.send_header("Retry-After", self.retry_after)
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    ThrottlingHandler.requests = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ThrottlingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_retries_throttled_after_retry_after(server):
+    from libs import transport
+    session = transport.VendorSession("test", (5, 5))
+
+    response = session.get(f"http://127.0.0.1:{server.server_port}/")
+
+    assert response.status_code == 200
+    first, second = ThrottlingHandler.requests
+    assert second - first >= 0.19
+    bucket = rate_limit.get_bucket("test", f"127.0.0.1:{server.server_port}")
+    assert bucket.get_state()["throttled"] == 1
+
+
+def test_session_returns_throttled_after_retries(server, monkeypatch):
+    from libs import transport
+    monkeypatch.setattr(ThrottlingHandler, "throttled", 10)
+    monkeypatch.setattr(ThrottlingHandler, "retry_after", "0")
+    session = transport.VendorSession("test", (5, 5))
+
+    response = session.get(f"http://127.0.0.1:{server.server_port}/")
+
+    assert response.status_code == 429
+    assert len(ThrottlingHandler.requests) == transport.THROTTLED_RETRIES + 1
@@ -0,0 +1,119 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from libs.py_agua_iot import Device, RegisterBuffer, RegisterTable, formula_parser
+
+
+def _register(reg_key, offset, formula="#", mask=65535, format_string="{0:.0f}"):
+    return {
+        "reg_key": reg_key, "reg_type": "DATA", "offset": offset, "formula": formula, "formula_inverse": "#",
+        "format_string": format_string, "set_min": 0, "set_max": 65535, "mask": mask, "enc_val": [],
+    }
+
+
+# Registers of a NOBIS stove map, formulas and masks as sent by the Agua IoT API
+REGISTERS = [
+    _register("status_get", 33),
+    _register("status_managed_get", 1348, mask=1),
+    _register("temp_air_get", 1025, formula="#/10", format_string="{0:.1f}"),
+    _register("temp_air_set", 50, formula="#/2", format_string="{0:.1f}"),
+    _register("temp_gas_flue_get", 1026),
+    _register("temp_water_get", 1030, formula="#/10-5", format_string="{0:.1f}"),
+    _register("real_power_get", 1036, mask=255),
+    _register("power_set", 52, formula="#-50"),
+    _register("fan_speed_get", 1037, formula="#x10"),
+    _register("flow_get", 1039, formula="#*2+30"),
+    _register("alarms_get", 34, mask=0xFF00),
+    _register("canalization_1_fan_get", 1040, formula="#/2/3"),
+    _register("canalization_1_temp_set", 70, formula="100-#"),
+    _register("canalization_2_temp_set", 71, formula="#x2/3+1"),
+    _register("broken_get", 1041, formula="#/0"),
+    _register("not_in_buffer_get", 2000, formula="#/10"),
+]
+
+
+def reference_value(register: dict, buffer: RegisterBuffer):
+    """Value of a register as decoded one at a time by `formula_parser.parser`, None when it cannot be."""
+    raw = buffer.get(register["offset"])
+    if raw is None:
+        return None
+    try:
+        return formula_parser.parser(register["formula"].replace("#", str(raw & register["mask"])))
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+@pytest.fixture
+def buffer():
+    rng = random.Random(42)
+    offsets = [register["offset"] for register in REGISTERS if register["reg_key"] != "not_in_buffer_get"]
+    return RegisterBuffer(offsets, [rng.randint(0, 65535) for _ in offsets])
+
+
+def test_compile_formula_kinds():
+    assert formula_parser.compile_formula("#") == (formula_parser.KIND_SCALE, 1.0, 1.0, 0.0)
+    assert formula_parser.compile_formula("# / 10 - 5") == (formula_parser.KIND_SCALE, 1.0, 10.0, -5.0)
+    assert formula_parser.compile_formula("#x10")[0] == formula_parser.KIND_SCALE
+    for formula in ("#/0", "#/2/3", "100-#", "#x2/3+1"):
+        assert formula_parser.compile_formula(formula)[0] == formula_parser.KIND_GENERIC
+
+
+def test_decode_matches_parser(buffer):
+    table = RegisterTable(REGISTERS)
+
+    assert table.decode(buffer) == {register["reg_key"]: reference_value(register, buffer) for register in REGISTERS}
+
+
+def test_decode_matches_parser_on_every_raw_value():
+    table = RegisterTable(REGISTERS)
+    for raw in list(range(0, 1024)) + [65279, 65280, 65535]:
+        buffer = RegisterBuffer([register["offset"] for register in REGISTERS], [raw] * len(REGISTERS))
+        assert table.decode(buffer) == {register["reg_key"]: reference_value(register, buffer)
+                                        for register in REGISTERS}, raw
+
+
+def test_decode_array_valid_mask(buffer):
+    table = RegisterTable(REGISTERS)
+    values, valid = table.decode_array(buffer)
+
+    expected = [reference_value(register, buffer) for register in REGISTERS]
+    assert valid.tolist() == [value is not None for value in expected]
+    assert [int(value) for value, is_valid in zip(values.tolist(), valid.tolist()) if is_valid] == \
+        [value for value in expected if value is not None]
+
+
+def test_decode_selected_keys(buffer):
+    table = RegisterTable(REGISTERS)
+    keys = ["temp_air_get", "unknown_get", "canalization_1_temp_set", "not_in_buffer_get"]
+    by_key = {register["reg_key"]: register for register in REGISTERS}
+
+    assert table.decode(buffer, keys) == {
+        "temp_air_get": reference_value(by_key["temp_air_get"], buffer),
+        "unknown_get": None,
+        "canalization_1_temp_set": reference_value(by_key["canalization_1_temp_set"], buffer),
+        "not_in_buffer_get": None,
+    }
+
+
+def test_empty_buffer():
+    assert set(RegisterTable(REGISTERS).decode(RegisterBuffer([], [])).values()) == {None}
+
+
+def test_device_values_and_format_string(buffer):
+    connection = SimpleNamespace(register_tables={"map": RegisterTable(REGISTERS)})
+    device = Device(1, "stove", "product", "serial", "stove", True, "NOBIS", "map", connection)
+    device._Device__buffer = buffer
+
+    data_map = device.full_data_map
+    for register in REGISTERS:
+        expected = reference_value(register, buffer)
+        reg_key = register["reg_key"]
+        assert data_map[reg_key]["calculated_value"] == expected
+        assert data_map[reg_key]["raw_value"] == buffer.get(register["offset"])
+        if expected is not None:
+            assert device.get_item_value(reg_key) == expected
+            assert device.get_item_value(reg_key, True) == register["format_string"].format(expected)
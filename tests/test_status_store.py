@@ -0,0 +1,70 @@
+import pytest
+
+from libs.status_store import JOBS_STATUS_KEY, StatusStore
+
+DESIRED = {
+    "living": {"type": "heatzy", "mode": "COMFORT"},
+    "bedroom": {"type": "heatzy", "mode": "ECO"},
+    "stove": {"type": "stove", "mode": "COMFORT"},
+}
+JOB = {"id_device": 1, "mode": "COMFORT", "requests": ["a"], "time": 1700000000, "retries": 0}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StatusStore(str(tmp_path / "data" / "status.sqlite"))
+    yield store
+    store.close()
+
+
+def test_save_and_load(store):
+    assert store.is_empty()
+    status = {
+        "living": "COMFORT", "bedroom": "changed_1700000000", "stove": "OFF",
+        JOBS_STATUS_KEY: {"stove": JOB}, "_last_reconcile": 1700000000, "_desired_since": {"living": 1},
+    }
+    store.save(status, DESIRED)
+
+    assert not store.is_empty()
+    assert store.load() == status
+    records = store.get_records()
+    assert records["bedroom"].override_time == 1700000000 and records["bedroom"].observed_mode is None
+    assert records["stove"].provider == "stove" and records["stove"].last_job == JOB
+    assert store.get_meta() == {"_last_reconcile": 1700000000, "_desired_since": {"living": 1}}
+
+
+def test_save_writes_only_changes(store):
+    previous = {"living": "COMFORT", "bedroom": "ECO", "_last_reconcile": 1}
+    store.save(previous, DESIRED)
+
+    # Another run changed the bedroom meanwhile, this run leaving it as it found it
+    store.save({"living": "COMFORT", "bedroom": "OFF", "_last_reconcile": 1}, DESIRED)
+    store.save({"living": "ECO", "bedroom": "ECO", "_last_reconcile": 2}, DESIRED, previous=previous)
+
+    assert store.load() == {"living": "ECO", "bedroom": "OFF", "_last_reconcile": 2}
+
+
+def test_save_updates_desired_of_unchanged_devices(store):
+    status = {"living": "COMFORT"}
+    store.save(status, DESIRED)
+    store.save(status, {"living": {"type": "heatzy", "mode": "ECO"}}, previous=status)
+
+    assert store.get_records()["living"].desired_mode == "ECO"
+
+
+def test_save_removes_dropped_devices_and_meta(store):
+    previous = {"living": "COMFORT", "stove": "OFF", JOBS_STATUS_KEY: {"stove": JOB}, "_heatzy_deferred": {"a": 1}}
+    store.save(previous, DESIRED)
+    # Recorded by another run, not dropped by this one
+    store.save({"kitchen": "ECO", "_last_reconcile": 3}, previous={})
+
+    store.save({"living": "COMFORT", "stove": "OFF"}, DESIRED, previous=previous)
+
+    assert store.load() == {"living": "COMFORT", "stove": "OFF", "kitchen": "ECO", "_last_reconcile": 3}
+    assert store.get_records()["stove"].last_job is None
+
+
+def test_job_of_device_without_status(store):
+    store.save({JOBS_STATUS_KEY: {"stove": JOB}}, DESIRED)
+
+    assert store.load() == {JOBS_STATUS_KEY: {"stove": JOB}}
@@ -0,0 +1,104 @@
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from libs.storage import S3Storage, StorageConflict
+
+BUCKET = "heaters"
+
+
+@pytest.fixture
+def client():
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+class CountingClient:
+    """S3 client recording the calls made through it."""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def call(**kwargs):
+            self.calls.append((name, kwargs))
+            return method(**kwargs)
+        return call
+
+
+def get_storage(client, tmp_path, name="cache"):
+    return S3Storage(BUCKET, prefix="home/", cache_directory=str(tmp_path / name), client=CountingClient(client))
+
+
+def test_read_not_modified_uses_cache(client, tmp_path):
+    client.put_object(Bucket=BUCKET, Key="home/status.json", Body=b"{}")
+    storage = get_storage(client, tmp_path)
+
+    assert storage.read("status.json") == b"{}"
+    assert "IfNoneMatch" not in storage.client.calls[-1][1]
+    # Second read is a conditional GET answered 304, served from the cache
+    assert storage.read("status.json") == b"{}"
+    assert storage.client.calls[-1][1]["IfNoneMatch"] == client.head_object(Bucket=BUCKET,
+                                                                            Key="home/status.json")["ETag"]
+
+    client.put_object(Bucket=BUCKET, Key="home/status.json", Body=b'{"a": 1}')
+    assert storage.read("status.json") == b'{"a": 1}'
+
+
+def test_read_missing(client, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        get_storage(client, tmp_path).read("status.json")
+
+
+def test_write_conflict_on_concurrent_change(client, tmp_path):
+    first, second = get_storage(client, tmp_path, "first"), get_storage(client, tmp_path, "second")
+    first.write("status.json", b"1", if_unchanged=True)
+    assert second.read("status.json") == b"1"
+
+    first.write("status.json", b"2", if_unchanged=True)
+    # Second writes on the ETag it read, changed since then
+    with pytest.raises(StorageConflict):
+        second.write("status.json", b"3", if_unchanged=True)
+    assert client.get_object(Bucket=BUCKET, Key="home/status.json")["Body"].read() == b"2"
+
+    # Once read again, the write goes through
+    assert second.read("status.json") == b"2"
+    second.write("status.json", b"3", if_unchanged=True)
+    assert first.read("status.json") == b"3"
+
+
+def test_write_conflict_on_created_object(client, tmp_path):
+    storage = get_storage(client, tmp_path)
+    with pytest.raises(FileNotFoundError):
+        storage.read("status.json")
+    # Created by someone else after it was read as missing
+    client.put_object(Bucket=BUCKET, Key="home/status.json", Body=b"remote")
+    with pytest.raises(StorageConflict):
+        storage.write("status.json", b"local", if_unchanged=True)
+    assert client.get_object(Bucket=BUCKET, Key="home/status.json")["Body"].read() == b"remote"
+
+
+def test_output_replaced_from_fresh_cache(client, tmp_path):
+    # Each scheduled run starts with an empty cache, outputs written by previous runs are replaced
+    for run in range(3):
+        get_storage(client, tmp_path, f"run{run}").write("schedules.json", f"run {run}".encode())
+        assert client.get_object(Bucket=BUCKET, Key="home/schedules.json")["Body"].read() == f"run {run}".encode()
+
+
+def test_unchanged_write_checks_remote(client, tmp_path):
+    storage = get_storage(client, tmp_path)
+    storage.write("status.json", b"1", if_unchanged=True)
+    storage.write("status.json", b"1", if_unchanged=True)
+    assert [name for name, _ in storage.client.calls].count("put_object") == 1
+
+    # Changed by someone else, writing the cached content again is not skipped
+    client.put_object(Bucket=BUCKET, Key="home/status.json", Body=b"2")
+    with pytest.raises(StorageConflict):
+        storage.write("status.json", b"1", if_unchanged=True)
+    assert client.get_object(Bucket=BUCKET, Key="home/status.json")["Body"].read() == b"2"
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from libs import telemetry
+from libs.telemetry import TelemetryRecorder, TelemetryRing
+
+
+def fill(ring: TelemetryRing, times):
+    for sample_time in times:
+        ring.append(float(sample_time), mode="ON", target="COMFORT", decision="set", air_temp=sample_time / 10)
+
+
+def test_append_and_read(tmp_path):
+    ring = TelemetryRing(str(tmp_path / "stove.ring"), capacity=8)
+    fill(ring, range(5))
+    ring.append(5.0)
+
+    assert len(ring) == 6 and ring.written == 6
+    samples = ring.read()
+    assert samples["time"].tolist() == [0, 1, 2, 3, 4, 5]
+    assert samples["mode"][0] == b"ON" and samples["decision"][0] == b"set"
+    assert samples["air_temp"][4] == pytest.approx(0.4)
+    # Readings not given are NaN
+    assert np.isnan(samples["air_temp"][5]) and samples["mode"][5] == b""
+
+
+def test_query_before_wrap_around(tmp_path):
+    ring = TelemetryRing(str(tmp_path / "stove.ring"), capacity=8)
+    fill(ring, range(6))
+
+    views = ring.query(2, 4)
+    assert len(views) == 1 and views[0]["time"].tolist() == [2, 3]
+    # Views of the file, not copies
+    assert np.shares_memory(views[0], ring._samples)
+    assert ring.query(10) == []
+    assert len(ring.read(10)) == 0
+
+
+def test_query_after_wrap_around(tmp_path):
+    ring = TelemetryRing(str(tmp_path / "stove.ring"), capacity=8)
+    fill(ring, range(13))
+
+    assert len(ring) == 8 and ring.written == 13
+    # Oldest samples overwritten, the rest split at the end of the ring
+    views = ring.query()
+    assert [view["time"].tolist() for view in views] == [[5, 6, 7], [8, 9, 10, 11, 12]]
+    assert [view["time"].tolist() for view in ring.query(6, 10)] == [[6, 7], [8, 9]]
+    assert [view["time"].tolist() for view in ring.query(9)] == [[9, 10, 11, 12]]
+    assert [view["time"].tolist() for view in ring.query(end=7)] == [[5, 6]]
+
+    assert ring.read(6, 10)["time"].tolist() == [6, 7, 8, 9]
+    # Within a single segment, `read` gives a view
+    assert np.shares_memory(ring.read(9), ring._samples)
+
+
+def test_query_after_exact_wrap_around(tmp_path):
+    ring = TelemetryRing(str(tmp_path / "stove.ring"), capacity=8)
+    fill(ring, range(16))
+
+    assert [view["time"].tolist() for view in ring.query()] == [list(range(8, 16))]
+
+
+def test_reopen_keeps_samples_and_capacity(tmp_path):
+    path = str(tmp_path / "stove.ring")
+    fill(TelemetryRing(path, capacity=4), range(6))
+
+    ring = TelemetryRing(path, capacity=100)
+    assert ring.capacity == 4
+    assert ring.read()["time"].tolist() == [2, 3, 4, 5]
+
+    readonly = telemetry.open_ring(str(tmp_path), "stove")
+    assert readonly.read()["time"].tolist() == [2, 3, 4, 5]
+    with pytest.raises(FileNotFoundError):
+        telemetry.open_ring(str(tmp_path), "other")
+
+
+def test_recorder_moves_other_versions_aside(tmp_path):
+    path = telemetry.get_ring_path(str(tmp_path), "salon/stove")
+    with open(path, "wb") as ring_file:
+        ring_file.write(b"HGCTLM1".ljust(4096, b"\0"))
+
+    recorder = TelemetryRecorder(str(tmp_path), capacity=4)
+    recorder.record("salon/stove", 1.0, mode="OFF")
+    recorder.close()
+
+    assert os.path.exists(f"{path}.old")
+    assert telemetry.list_devices(str(tmp_path)) == ["salon_stove"]
+    assert telemetry.open_ring(str(tmp_path), "salon_stove").read()["mode"].tolist() == [b"OFF"]